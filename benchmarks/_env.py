@@ -0,0 +1,42 @@
+"""
+Benchmark environment bootstrap.
+
+Importing config.py no longer needs credentials, but building the pipeline's
+clients validates them (per subsystem) and reads BASE_PROMPT_FILE, so benchmarks
+fill in placeholder values (without overriding anything already set) before
+importing any pipeline module. Call setup() before those imports.
+"""
+
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+PLACEHOLDER_ENV = {
+    "INSTAGRAM_APP_ID": "bench-app-id",
+    "INSTAGRAM_APP_SECRET": "bench-app-secret",
+    "PARTICIPANT_FB_PAGE_NAME": "participant-0",
+    "PARTICIPANT_IG_USERNAME": "bench_participant",
+    "PARTICIPANT_IG_PASSWORD": "bench",
+    "AUNT_IG_USERNAME": "bench_aunt",
+    "AUNT_IG_PASSWORD": "bench",
+    "GCS_BUCKET_NAME": "bench-bucket",
+    "GCP_CREDENTIALS_PATH": "bench-credentials.json",
+    "OPENAI_API_KEY": "bench-key",
+}
+
+
+def setup():
+    """Put the repo on sys.path and fill in placeholder settings. Safe to call more than once."""
+    if str(REPO_ROOT) not in sys.path:
+        sys.path.insert(0, str(REPO_ROOT))
+
+    for name, value in PLACEHOLDER_ENV.items():
+        os.environ.setdefault(name, value)
+
+    if not os.getenv("BASE_PROMPT_FILE"):
+        prompt_file = Path(tempfile.gettempdir()) / "bench_base_prompt.txt"
+        prompt_file.write_text("You are a supportive commenter on food posts.")
+        os.environ["BASE_PROMPT_FILE"] = str(prompt_file)
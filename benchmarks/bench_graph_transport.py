@@ -0,0 +1,84 @@
+"""
+Graph API transport benchmark.
+
+Compares per-call latency against a local stub Graph server for:
+  - bare requests.get per call (a new connection every time, the old behaviour)
+  - one keep-alive requests.Session, called sequentially
+  - AsyncInstagramAPI awaited sequentially, and with calls issued concurrently
+
+Usage:
+    python benchmarks/bench_graph_transport.py --calls 50 --latency 0.02 --handshake 0.06
+"""
+
+import _env
+_env.setup()  # must come before pipeline imports
+
+import argparse
+import asyncio
+import time
+
+import requests
+
+from instagram_api import AsyncInstagramAPI
+from stub_graph_server import StubGraphServer
+
+
+def bench_bare_requests(base_url, calls):
+    start = time.perf_counter()
+    for _ in range(calls):
+        response = requests.get(f"{base_url}/me/accounts", params={"access_token": "t"})
+        response.raise_for_status()
+    return time.perf_counter() - start
+
+
+def bench_session(base_url, calls):
+    with requests.Session() as session:
+        start = time.perf_counter()
+        for _ in range(calls):
+            response = session.get(f"{base_url}/me/accounts", params={"access_token": "t"})
+            response.raise_for_status()
+        return time.perf_counter() - start
+
+
+async def bench_async(base_url, calls, concurrent):
+    async with AsyncInstagramAPI("t", base_url=base_url) as api:
+        start = time.perf_counter()
+        if concurrent:
+            await asyncio.gather(*(api.get_user_pages() for _ in range(calls)))
+        else:
+            for _ in range(calls):
+                await api.get_user_pages()
+        return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.02, help="server-side latency per request (s)")
+    parser.add_argument("--handshake", type=float, default=0.06, help="simulated handshake cost per new connection (s)")
+    args = parser.parse_args()
+
+    server = StubGraphServer(latency=args.latency, handshake_latency=args.handshake).start()
+    try:
+        results = []
+        for label, run in [
+            ("requests.get per call", lambda: bench_bare_requests(server.base_url, args.calls)),
+            ("requests.Session", lambda: bench_session(server.base_url, args.calls)),
+            ("AsyncInstagramAPI sequential", lambda: asyncio.run(bench_async(server.base_url, args.calls, False))),
+            ("AsyncInstagramAPI concurrent", lambda: asyncio.run(bench_async(server.base_url, args.calls, True))),
+        ]:
+            connections_before = server.stats["connections"]
+            elapsed = run()
+            results.append((label, elapsed, server.stats["connections"] - connections_before))
+
+        baseline = results[0][1] / args.calls
+        print(f"{'transport':<30} {'ms/call':>8} {'saved':>8} {'conns':>6}")
+        for label, elapsed, connections in results:
+            per_call = elapsed / args.calls
+            print(f"{label:<30} {per_call * 1000:8.1f} {(baseline - per_call) * 1000:8.1f} {connections:6d}")
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Import-time (cold start) benchmark.
+
+Imports each module in a fresh interpreter, `--runs` times, and reports:
+  - the median and best wall time of the import, net of interpreter startup
+  - the heaviest modules it imports directly (from `python -X importtime`)
+  - which heavy SDKs (openai, google.cloud.storage, instagrapi, av) got loaded;
+    these should only be imported once their client is first used
+
+Children run in an empty working directory (no .env is picked up). With
+--no-credentials the benchmark's placeholder settings are removed as well, which
+checks that the modules load without any credentials configured.
+
+Usage:
+    python benchmarks/bench_import_time.py
+    python benchmarks/bench_import_time.py main comment_generator --runs 20 --no-credentials
+"""
+
+import _env
+_env.setup()
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+MODULES = ("config", "main", "comment_generator", "media_uploader", "instagrapi_pool", "instagram_api",
+           "image_preprocessor", "video_keyframes")
+HEAVY_SDKS = ("openai", "google.cloud.storage", "instagrapi", "av")
+
+CHILD = """
+import sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+import json
+print(json.dumps({{"seconds": elapsed, "loaded": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def child_env(no_credentials):
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [str(_env.REPO_ROOT), env.get("PYTHONPATH")]))
+    if no_credentials:
+        for name in (*_env.PLACEHOLDER_ENV, "BASE_PROMPT_FILE"):
+            env.pop(name, None)
+    return env
+
+
+def run_child(args, env, cwd):
+    completed = subprocess.run([sys.executable, *args], env=env, cwd=cwd, capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise RuntimeError(completed.stderr.strip().splitlines()[-1] if completed.stderr else "import failed")
+    return completed
+
+
+def heaviest_imports(importtime_output, module, top):
+    """
+    The modules `module` imports directly, by cumulative time (ms), from
+    `-X importtime` output. Each import is printed after everything it imported,
+    indented two spaces per level.
+    """
+    entries = []  # (depth, cumulative ms, name), in output order
+    for line in importtime_output.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        entries.append((depth, int(cumulative) / 1000, name.strip()))
+
+    ends = [i for i, (depth, _, name) in enumerate(entries) if depth == 0 and name == module]
+    if not ends:
+        return []
+    start = end = ends[-1]
+    while start > 0 and entries[start - 1][0] > 0:
+        start -= 1
+    children = [(cumulative_ms, name) for depth, cumulative_ms, name in entries[start:end] if depth == 1]
+    return sorted(children, reverse=True)[:top]
+
+
+def bench_module(module, runs, top, env, cwd):
+    code = CHILD.format(module=module, heavy=HEAVY_SDKS)
+    samples, loaded = [], []
+    for _ in range(runs):
+        result = json.loads(run_child(["-c", code], env, cwd).stdout.strip().splitlines()[-1])
+        samples.append(result["seconds"] * 1000)
+        loaded = result["loaded"]
+    profile = run_child(["-X", "importtime", "-c", f"import {module}"], env, cwd)
+    return {
+        "median_ms": statistics.median(samples),
+        "best_ms": min(samples),
+        "heavy_sdks": loaded,
+        "heaviest": heaviest_imports(profile.stderr, module, top),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("modules", nargs="*", help=f"default: {', '.join(MODULES)}")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--top", type=int, default=5, help="heaviest direct imports listed per module")
+    parser.add_argument("--no-credentials", action="store_true", help="import without any credentials set")
+    args = parser.parse_args()
+
+    env = child_env(args.no_credentials)
+    with tempfile.TemporaryDirectory(prefix="bench-import-") as cwd:
+        results = {}
+        for module in args.modules or MODULES:
+            try:
+                results[module] = bench_module(module, args.runs, args.top, env, cwd)
+            except RuntimeError as e:
+                print(f"{module}: {e}")
+
+    print(f"\n{'module':<20} {'median ms':>10} {'best ms':>9}  heavy SDKs loaded at import")
+    for module, r in results.items():
+        print(f"{module:<20} {r['median_ms']:>10.1f} {r['best_ms']:>9.1f}  {', '.join(r['heavy_sdks']) or '-'}")
+    for module, r in results.items():
+        print(f"\nHeaviest imports of {module}:")
+        for cumulative_ms, name in r["heaviest"]:
+            print(f"  {cumulative_ms:>8.1f} ms  {name}")
+
+
+if __name__ == "__main__":
+    main()
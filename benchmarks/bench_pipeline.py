@@ -0,0 +1,292 @@
+"""
+Offline end-to-end pipeline benchmark.
+
+Runs main.process_participants against local stand-ins for every external
+service: stub_graph_server (graph.facebook.com and the media CDN),
+stub_gcs_server (Cloud Storage, via STORAGE_EMULATOR_HOST) and
+stub_openai_server (chat completions, via OPENAI_BASE_URL). Each has its own
+latency model and optional error injection, so no account or network is needed.
+
+Scenarios cover 1 vs. 100 participants, each with single-image, 10-item carousel
+and video posts, commented on by 6 personas. Each scenario runs in a fresh
+process and working directory (own personas.json, tokens.json, comments.db and
+caches), and reports:
+  - throughput: posts and comments per minute over the whole run
+  - per-stage latency percentiles (p50/p95/p99) from the telemetry table
+  - peak RSS of the pipeline process (the stubs run in the parent)
+
+Usage:
+    python benchmarks/bench_pipeline.py                          # every scenario
+    python benchmarks/bench_pipeline.py 1p-image 100p-carousel --llm-ttft 0.5
+    python benchmarks/bench_pipeline.py --error-rate 0.05 --out results.json
+    python benchmarks/bench_pipeline.py --baseline results.json  # exit 1 on regressions
+
+Video keyframes need PyAV (and numpy to build the sample clip); without them the
+video scenarios still fetch and mirror the media but prepare no frames.
+"""
+
+import _env
+_env.setup()  # must come before pipeline imports
+
+import argparse
+import asyncio
+import json
+import os
+import resource
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from stub_gcs_server import StubGcsServer
+from stub_graph_server import GraphFixtures, StubGraphServer, sample_jpeg, sample_mp4
+from stub_openai_server import StubOpenAIServer
+
+SCENARIOS = {
+    "1p-image": {"participants": 1, "media_kind": "image"},
+    "1p-carousel": {"participants": 1, "media_kind": "carousel"},
+    "1p-video": {"participants": 1, "media_kind": "video"},
+    "100p-image": {"participants": 100, "media_kind": "image"},
+    "100p-carousel": {"participants": 100, "media_kind": "carousel"},
+    "100p-video": {"participants": 100, "media_kind": "video"},
+}
+PERCENTILES = (50, 95, 99)
+TOKEN_LIFETIME_SECONDS = 60 * 86400
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(1, -(-p * len(sorted_values) // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024  # bytes on macOS, KiB on Linux
+
+
+# ---------------------------------------------------------------------------
+# Worker: one scenario, in its own process and working directory
+# ---------------------------------------------------------------------------
+
+def stage_percentiles(db_path):
+    conn = sqlite3.connect(db_path)
+    rows = conn.execute("SELECT stage, duration_ms, ok FROM stage_events").fetchall()
+    comments = conn.execute("SELECT COUNT(*) FROM comments").fetchone()[0]
+    conn.close()
+    stages = {}
+    for stage, duration_ms, ok in rows:
+        entry = stages.setdefault(stage, {"durations": [], "errors": 0})
+        entry["durations"].append(duration_ms)
+        entry["errors"] += not ok
+    report = {}
+    for stage, entry in stages.items():
+        durations = sorted(entry["durations"])
+        report[stage] = {"events": len(durations), "errors": entry["errors"], "max_ms": durations[-1],
+                         **{f"p{p}_ms": percentile(durations, p) for p in PERCENTILES}}
+    return report, comments
+
+
+def run_worker(spec_path):
+    with open(spec_path) as f:
+        spec = json.load(f)
+    import main  # after the environment is in place; config is read at import
+
+    rss_after_import = peak_rss_mb()
+    page_names = [f"participant-{i}" for i in range(spec["participants"])]
+    start = time.perf_counter()
+    stats = asyncio.run(main.process_participants(
+        page_names, recent_posts=spec["posts"], max_concurrency=spec["concurrency"],
+        selected_persona=None, use_instagrapi=False
+    ))
+    elapsed = time.perf_counter() - start
+    stages, comments = stage_percentiles("comments.db")
+    posts = spec["participants"] * spec["posts"]
+    result = {
+        "posts": posts,
+        "comments": comments,
+        "expected_comments": posts * spec["personas"],
+        "wall_seconds": elapsed,
+        "posts_per_min": posts * 60.0 / elapsed,
+        "comments_per_min": comments * 60.0 / elapsed,
+        "failed_stage_items": sum(counter.failed for counter in stats.stages.values()),
+        "rss_after_import_mb": rss_after_import,
+        "peak_rss_mb": peak_rss_mb(),
+        "stages": stages,
+    }
+    with open(spec["result_path"], "w") as f:
+        json.dump(result, f)
+
+
+# ---------------------------------------------------------------------------
+# Driver: stubs, working directories and reporting
+# ---------------------------------------------------------------------------
+
+def prepare_workdir(workdir, personas):
+    """personas.json limited to `personas` (no posting delays) and tokens valid for weeks."""
+    with open(_env.REPO_ROOT / "personas.json") as f:
+        all_personas = json.load(f)
+    selected = {name: {k: v for k, v in data.items() if k != "delay_minutes"}
+                for name, data in list(all_personas.items())[:personas]}
+    with open(workdir / "personas.json", "w") as f:
+        json.dump(selected, f, indent=4)
+
+    expires_at = time.time() + TOKEN_LIFETIME_SECONDS
+    tokens = {
+        "business_token": "bench-business-token",
+        "business_token_expires_at": expires_at,
+        "persona_tokens": {name: {"access_token": f"bench-{name}-token", "expires_at": expires_at}
+                           for name in selected},
+    }
+    with open(workdir / "tokens.json", "w") as f:
+        json.dump(tokens, f, indent=4)
+    return len(selected)
+
+
+def run_scenario(name, args, media):
+    scenario = SCENARIOS[name]
+    fixtures = GraphFixtures(
+        participants=scenario["participants"], posts_per_participant=args.posts,
+        media_kind=scenario["media_kind"], carousel_size=args.carousel_size,
+        comments_per_post=args.comments, image_payload=media["image"], video_payload=media["video"]
+    )
+    graph = StubGraphServer(fixtures, latency=args.graph_latency, error_rate=args.error_rate).start()
+    gcs = StubGcsServer(latency=args.gcs_latency, error_rate=args.error_rate).start()
+    llm = StubOpenAIServer(ttft=args.llm_ttft, token_latency=args.llm_token_latency,
+                           error_rate=args.error_rate).start()
+    workdir = Path(tempfile.mkdtemp(prefix=f"bench-{name}-"))
+    try:
+        personas = prepare_workdir(workdir, args.personas)
+        spec = {"participants": scenario["participants"], "posts": args.posts, "personas": personas,
+                "concurrency": args.concurrency, "result_path": str(workdir / "result.json")}
+        with open(workdir / "spec.json", "w") as f:
+            json.dump(spec, f)
+
+        env = dict(os.environ)
+        env.update({
+            "GRAPH_API_BASE_URL": graph.base_url,
+            "STORAGE_EMULATOR_HOST": gcs.endpoint,
+            "OPENAI_BASE_URL": llm.base_url,
+            "PARTICIPANT_FB_PAGE_NAME": "participant-0",
+            "RESPONSE_CACHE_ENABLED": "false",  # every scenario measures real generations
+            "TELEMETRY_ENABLED": "true",        # the per-stage percentiles come from it
+            "MULTI_PERSONA_GENERATION": "true" if args.multi_persona else "false",
+        })
+        if not args.keep_rate_limits:
+            env.update({"OPENAI_RPM_LIMIT": "1000000", "OPENAI_TPM_LIMIT": "1000000000"})
+
+        command = [sys.executable, os.path.abspath(__file__), "--worker", str(workdir / "spec.json")]
+        output = None if args.verbose else subprocess.PIPE
+        completed = subprocess.run(command, cwd=workdir, env=env, stdout=output, stderr=subprocess.STDOUT,
+                                   text=True, timeout=args.timeout)
+        if completed.returncode != 0:
+            tail = "\n".join((completed.stdout or "").splitlines()[-30:])
+            raise RuntimeError(f"scenario {name} failed (exit {completed.returncode}):\n{tail}")
+        with open(spec["result_path"]) as f:
+            result = json.load(f)
+        result["stub_requests"] = {"graph": graph.stats["requests"], "gcs": gcs.stats["requests"],
+                                   "llm": llm.stats["requests"]}
+        result["injected_errors"] = graph.stats["errors"] + gcs.stats["errors"] + llm.stats["errors"]
+        return result
+    finally:
+        graph.stop()
+        gcs.stop()
+        llm.stop()
+        if not args.keep_workdirs:
+            shutil.rmtree(workdir, ignore_errors=True)
+        else:
+            print(f"Kept working directory {workdir}")
+
+
+def print_report(results):
+    print(f"\n{'scenario':<15} {'posts':>5} {'comments':>9} {'wall s':>8} {'posts/min':>10} "
+          f"{'comments/min':>13} {'peak MB':>8} {'errors':>7}")
+    for name, r in results.items():
+        print(f"{name:<15} {r['posts']:>5} {r['comments']:>4}/{r['expected_comments']:<4} {r['wall_seconds']:>8.1f} "
+              f"{r['posts_per_min']:>10.1f} {r['comments_per_min']:>13.1f} {r['peak_rss_mb']:>8.1f} "
+              f"{r['injected_errors']:>7}")
+
+    print(f"\n{'scenario':<15} {'stage':<9} {'events':>7} {'errors':>7} "
+          + " ".join(f"{f'p{p} ms':>9}" for p in PERCENTILES) + f" {'max ms':>9}")
+    for name, r in results.items():
+        for stage, s in sorted(r["stages"].items()):
+            print(f"{name:<15} {stage:<9} {s['events']:>7} {s['errors']:>7} "
+                  + " ".join(f"{s[f'p{p}_ms']:>9.1f}" for p in PERCENTILES) + f" {s['max_ms']:>9.1f}")
+
+
+def regressions(results, baseline, tolerance):
+    """Throughput drops and p95 increases beyond `tolerance` (a fraction) versus `baseline`."""
+    found = []
+    for name, r in results.items():
+        before = baseline.get(name)
+        if not before:
+            continue
+        if r["comments_per_min"] < before["comments_per_min"] * (1 - tolerance):
+            found.append(f"{name}: comments/min {before['comments_per_min']:.1f} -> {r['comments_per_min']:.1f}")
+        if r["peak_rss_mb"] > before["peak_rss_mb"] * (1 + tolerance):
+            found.append(f"{name}: peak RSS {before['peak_rss_mb']:.1f} -> {r['peak_rss_mb']:.1f} MB")
+        for stage, s in r["stages"].items():
+            old = before["stages"].get(stage)
+            if old and s["p95_ms"] > old["p95_ms"] * (1 + tolerance):
+                found.append(f"{name}: {stage} p95 {old['p95_ms']:.1f} -> {s['p95_ms']:.1f} ms")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("scenarios", nargs="*", help=f"default: all of {', '.join(SCENARIOS)}")
+    parser.add_argument("--posts", type=int, default=1, help="recent posts processed per participant")
+    parser.add_argument("--personas", type=int, default=6)
+    parser.add_argument("--carousel-size", type=int, default=10)
+    parser.add_argument("--comments", type=int, default=20, help="existing comments per post")
+    parser.add_argument("--concurrency", type=int, default=8, help="max_concurrency of process_participants")
+    parser.add_argument("--multi-persona", action="store_true", help="one generation request per post")
+    parser.add_argument("--graph-latency", type=float, default=0.05, help="seconds per Graph API/CDN request")
+    parser.add_argument("--gcs-latency", type=float, default=0.02, help="seconds per GCS request")
+    parser.add_argument("--llm-ttft", type=float, default=0.4, help="seconds to first token")
+    parser.add_argument("--llm-token-latency", type=float, default=0.01, help="seconds per generated token")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of stub requests that fail")
+    parser.add_argument("--keep-rate-limits", action="store_true",
+                        help="keep the configured OpenAI RPM/TPM limits instead of lifting them")
+    parser.add_argument("--timeout", type=float, default=1800, help="seconds per scenario")
+    parser.add_argument("--out", help="write the results as JSON (usable as a --baseline)")
+    parser.add_argument("--baseline", help="results JSON of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed regression versus the baseline")
+    parser.add_argument("--keep-workdirs", action="store_true")
+    parser.add_argument("--verbose", action="store_true", help="show the pipeline's own output")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        return run_worker(args.worker)
+
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(unknown)}")
+    media = {"image": sample_jpeg(), "video": sample_mp4()}
+    results = {}
+    for name in args.scenarios or SCENARIOS:
+        print(f"Running {name}...", flush=True)
+        results[name] = run_scenario(name, args, media)
+    print_report(results)
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            found = regressions(results, json.load(f), args.tolerance)
+        if found:
+            print(f"\nRegressions beyond {args.tolerance:.0%}:")
+            print("\n".join(f"  {line}" for line in found))
+            sys.exit(1)
+        print(f"\nNo regressions beyond {args.tolerance:.0%} versus {args.baseline}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,292 @@
+"""
+Local stand-in for Google Cloud Storage (JSON API), used through the
+STORAGE_EMULATOR_HOST environment variable that google-cloud-storage honours.
+
+Implements the calls MediaUploader makes: get bucket, get object metadata,
+multipart uploads, resumable uploads (chunked PUTs, as written by Blob.open),
+copyTo/rewriteTo (rename_blob), ACL patch (make_public) and delete. Objects keep
+their size, content type and checksums; their bytes are discarded unless
+`keep_data` is set, so large runs do not grow the stub's memory.
+
+Every request waits `latency` seconds; with `error_rate` set, that fraction of
+requests fails with a 503 (which the client library retries).
+
+    server = StubGcsServer(latency=0.01).start()
+    os.environ["STORAGE_EMULATOR_HOST"] = server.endpoint
+    ...
+    server.stop()
+"""
+
+import base64
+import hashlib
+import json
+import random
+import re
+import struct
+import threading
+import time
+import uuid
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, unquote, urlparse
+
+try:
+    import google_crc32c
+except ImportError:  # pure-Python fallback, fine for benchmark-sized media
+    google_crc32c = None
+
+_CRC32C_TABLE = []
+for _n in range(256):
+    _c = _n
+    for _ in range(8):
+        _c = (_c >> 1) ^ 0x82F63B78 if _c & 1 else _c >> 1
+    _CRC32C_TABLE.append(_c)
+
+
+def crc32c_update(crc, data):
+    if google_crc32c is not None:
+        return google_crc32c.extend(crc, data)
+    crc ^= 0xFFFFFFFF
+    for byte in data:
+        crc = _CRC32C_TABLE[(crc ^ byte) & 0xFF] ^ (crc >> 8)
+    return crc ^ 0xFFFFFFFF
+
+
+class _Digest:
+    """Running size, MD5 and CRC32C of an object's bytes (what GCS reports)."""
+    def __init__(self):
+        self.size = 0
+        self.md5 = hashlib.md5()
+        self.crc = 0
+        self.chunks = []
+
+    def update(self, data, keep):
+        self.size += len(data)
+        self.md5.update(data)
+        self.crc = crc32c_update(self.crc, data)
+        if keep:
+            self.chunks.append(data)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, payload, status=200, headers=None):
+        body = json.dumps(payload).encode() if payload is not None else b""
+        self.send_response(status)
+        if payload is not None:
+            self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _not_found(self):
+        self._send_json({"error": {"code": 404, "message": "No such object"}}, 404)
+
+    def _body(self):
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def _begin(self):
+        self.server.stats["requests"] += 1
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        if self.server.error_rate and self.server.rng.random() < self.server.error_rate:
+            self.server.stats["errors"] += 1
+            self._body()  # drain, so the connection can be reused
+            self._send_json({"error": {"code": 503, "message": "Service Unavailable"}}, 503)
+            return True
+        return False
+
+    def _route(self):
+        parsed = urlparse(self.path)
+        query = {k: v[0] for k, v in parse_qs(parsed.query).items()}
+        return parsed.path, query
+
+    def do_GET(self):
+        if self._begin():
+            return
+        path, _ = self._route()
+        match = re.fullmatch(r"/storage/v1/b/([^/]+)/o/(.+)", path)
+        if match:
+            obj = self.server.store.get((match.group(1), unquote(match.group(2))))
+            return self._send_json(obj["resource"]) if obj else self._not_found()
+        match = re.fullmatch(r"/storage/v1/b/([^/]+)", path)
+        if match:
+            bucket = match.group(1)
+            return self._send_json({"kind": "storage#bucket", "id": bucket, "name": bucket})
+        # Public object URLs: /<bucket>/<name>
+        match = re.fullmatch(r"/([^/]+)/(.+)", path)
+        obj = self.server.store.get((match.group(1), unquote(match.group(2)))) if match else None
+        if not obj or obj["data"] is None:
+            return self._not_found()
+        self.send_response(200)
+        self.send_header("Content-Type", obj["resource"]["contentType"])
+        self.send_header("Content-Length", str(len(obj["data"])))
+        self.end_headers()
+        self.wfile.write(obj["data"])
+
+    def do_POST(self):
+        if self._begin():
+            return
+        path, query = self._route()
+        match = re.fullmatch(r"/upload/storage/v1/b/([^/]+)/o", path)
+        if match and query.get("uploadType") == "multipart":
+            return self._multipart_upload(match.group(1))
+        if match and query.get("uploadType") == "resumable":
+            return self._start_resumable(match.group(1), query)
+        match = re.fullmatch(r"/storage/v1/b/([^/]+)/o/(.+)/(copyTo|rewriteTo|moveTo)/b/([^/]+)/o/(.+)", path)
+        if match:
+            self._body()
+            return self._copy(match.group(1), unquote(match.group(2)), match.group(3),
+                              match.group(4), unquote(match.group(5)))
+        self._body()
+        self._send_json({"error": {"code": 404, "message": "unknown path"}}, 404)
+
+    def do_PUT(self):
+        if self._begin():
+            return
+        _, query = self._route()
+        session = self.server.uploads.get(query.get("upload_id"))
+        if session is None:
+            self._body()
+            return self._send_json({"error": {"code": 404, "message": "unknown upload"}}, 404)
+        data = self._body()
+        session["digest"].update(data, self.server.keep_data)
+        # "bytes 0-262143/*" (more to come), "bytes 0-999/1000" or "bytes */1000" (final)
+        total = self.headers.get("Content-Range", "").rpartition("/")[2]
+        if total == "*" or (total.isdigit() and session["digest"].size < int(total)):
+            headers = {"Range": f"bytes=0-{session['digest'].size - 1}"} if session["digest"].size else {}
+            return self._send_json(None, 308, headers)
+        del self.server.uploads[query["upload_id"]]
+        self._send_json(self._store(session["bucket"], session["metadata"], session["digest"]))
+
+    def do_PATCH(self):
+        if self._begin():
+            return
+        path, _ = self._route()
+        body = json.loads(self._body() or b"{}")
+        match = re.fullmatch(r"/storage/v1/b/([^/]+)/o/(.+)", path)
+        obj = self.server.store.get((match.group(1), unquote(match.group(2)))) if match else None
+        if obj is None:
+            return self._not_found()
+        obj["resource"].update(body)
+        self._send_json(obj["resource"])
+
+    def do_DELETE(self):
+        if self._begin():
+            return
+        path, _ = self._route()
+        match = re.fullmatch(r"/storage/v1/b/([^/]+)/o/(.+)", path)
+        if not match or self.server.store.pop((match.group(1), unquote(match.group(2))), None) is None:
+            return self._not_found()
+        self._send_json(None, 204)
+
+    def _multipart_upload(self, bucket):
+        # multipart/related: a JSON metadata part followed by the media part
+        body = self._body()
+        message = BytesParser(policy=HTTP).parsebytes(
+            b"Content-Type: " + self.headers["Content-Type"].encode() + b"\r\n\r\n" + body
+        )
+        metadata_part, media_part = list(message.iter_parts())[:2]
+        metadata = json.loads(metadata_part.get_payload(decode=True) or b"{}")
+        metadata.setdefault("contentType", media_part.get_content_type())
+        digest = _Digest()
+        digest.update(media_part.get_payload(decode=True) or b"", self.server.keep_data)
+        self._send_json(self._store(bucket, metadata, digest))
+
+    def _start_resumable(self, bucket, query):
+        metadata = json.loads(self._body() or b"{}")
+        metadata.setdefault("name", query.get("name"))
+        if self.headers.get("X-Upload-Content-Type"):
+            metadata.setdefault("contentType", self.headers["X-Upload-Content-Type"])
+        upload_id = uuid.uuid4().hex
+        self.server.uploads[upload_id] = {"bucket": bucket, "metadata": metadata, "digest": _Digest()}
+        location = (f"http://{self.headers['Host']}/upload/storage/v1/b/{bucket}/o"
+                    f"?uploadType=resumable&upload_id={upload_id}")
+        self._send_json(None, 200, {"Location": location})
+
+    def _copy(self, src_bucket, src_name, verb, dst_bucket, dst_name):
+        src = self.server.store.get((src_bucket, src_name))
+        if src is None:
+            return self._not_found()
+        resource = self._resource(dst_bucket, dst_name, src["resource"]["contentType"], src["digest"])
+        self.server.store[(dst_bucket, dst_name)] = {**src, "resource": resource}
+        if verb == "moveTo":
+            self.server.store.pop((src_bucket, src_name), None)
+        if verb == "rewriteTo":
+            size = int(resource["size"])
+            return self._send_json({"kind": "storage#rewriteResponse", "done": True, "resource": resource,
+                                    "totalBytesRewritten": str(size), "objectSize": str(size)})
+        self._send_json(resource)
+
+    def _resource(self, bucket, name, content_type, digest):
+        self.server.stats["generation"] += 1
+        generation = str(self.server.stats["generation"])
+        return {
+            "kind": "storage#object",
+            "id": f"{bucket}/{name}/{generation}",
+            "name": name,
+            "bucket": bucket,
+            "generation": generation,
+            "metageneration": "1",
+            "contentType": content_type or "application/octet-stream",
+            "size": str(digest["size"]),
+            "md5Hash": digest["md5Hash"],
+            "crc32c": digest["crc32c"],
+            "mediaLink": f"{self.server.endpoint}/{bucket}/{quote(name, safe='')}",
+        }
+
+    def _store(self, bucket, metadata, running):
+        digest = {
+            "size": running.size,
+            "md5Hash": base64.b64encode(running.md5.digest()).decode(),
+            "crc32c": base64.b64encode(struct.pack(">I", running.crc)).decode(),
+        }
+        resource = self._resource(bucket, metadata["name"], metadata.get("contentType"), digest)
+        data = b"".join(running.chunks) if self.server.keep_data else None
+        self.server.store[(bucket, metadata["name"])] = {"resource": resource, "digest": digest, "data": data}
+        self.server.stats["uploads"] += 1
+        self.server.stats["bytes_uploaded"] += running.size
+        return resource
+
+
+class StubGcsServer:
+    def __init__(self, latency=0.0, error_rate=0.0, seed=0, keep_data=False, host="127.0.0.1", port=0):
+        self.httpd = ThreadingHTTPServer((host, port), _Handler)
+        self.httpd.daemon_threads = True
+        self.httpd.latency = latency
+        self.httpd.error_rate = error_rate
+        self.httpd.rng = random.Random(seed)
+        self.httpd.keep_data = keep_data
+        self.httpd.store = {}    # (bucket, name) -> {"resource", "digest", "data"}
+        self.httpd.uploads = {}  # resumable upload id -> session
+        self.httpd.stats = {"requests": 0, "errors": 0, "uploads": 0, "bytes_uploaded": 0, "generation": 0}
+        self.httpd.endpoint = self.endpoint
+        self._thread = None
+
+    @property
+    def endpoint(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def stats(self):
+        return self.httpd.stats
+
+    def object_names(self, bucket):
+        return sorted(name for b, name in self.httpd.store if b == bucket)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
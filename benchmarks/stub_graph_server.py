@@ -0,0 +1,321 @@
+"""
+Local stand-in for graph.facebook.com.
+
+Serves just enough of the Graph API surface used by AsyncInstagramAPI (pages,
+connected Instagram account, recent media with `children{...}` expansion, media
+details, batch requests, paged comments, token inspection/exchange, media bytes)
+from in-memory fixtures. Every request waits `latency` seconds, and the first request
+on each new TCP connection additionally waits `handshake_latency` seconds to
+stand in for the TCP + TLS handshake a real client pays on a fresh connection.
+
+Posts are single images, carousels of `carousel_size` images, or videos. With
+`error_rate` set, that fraction of requests fails with a transient Graph error
+(HTTP 500, code 2) or a rate-limit error (HTTP 429, code 4), chosen by a seeded RNG.
+
+    server = StubGraphServer(latency=0.02, handshake_latency=0.06).start()
+    api = AsyncInstagramAPI("token", base_url=server.base_url)
+    ...
+    server.stop()
+"""
+
+import io
+import json
+import random
+import struct
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlparse
+
+API_VERSION = "v22.0"
+COMMENT_AUTHORS = ("mia.eats", "sam_cooks", "noodle_nora", "greens4days", "the_late_lunch")
+
+
+def placeholder_bytes(size, magic=b"\xff\xd8"):
+    return magic + b"\0" * max(size - len(magic), 0)
+
+
+def sample_jpeg(width=1080, height=1350, seed=0):
+    """
+    A real, photo-sized JPEG (smooth colour noise) so image preprocessing does real
+    decode/resize/encode work. Falls back to placeholder bytes without Pillow.
+    """
+    try:
+        from PIL import Image
+    except ImportError:
+        return placeholder_bytes(200 * 1024)
+    rng = random.Random(seed)
+    bands = [Image.effect_noise((width // 16, height // 16), 64 + 16 * rng.random()) for _ in range(3)]
+    image = Image.merge("RGB", bands).resize((width, height), Image.BICUBIC)
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def sample_mp4(width=640, height=360, seconds=4, fps=24, shots=4):
+    """
+    A short H.264 MP4 with `shots` visually distinct shots, for keyframe sampling.
+    Falls back to placeholder bytes without PyAV.
+    """
+    try:
+        import av
+        import numpy as np
+    except ImportError:
+        return placeholder_bytes(512 * 1024, magic=b"\0\0\0\x18ftypmp42")
+    buffer = io.BytesIO()
+    with av.open(buffer, mode="w", format="mp4") as container:
+        stream = container.add_stream("h264", rate=fps)
+        stream.width, stream.height, stream.pix_fmt = width, height, "yuv420p"
+        total = seconds * fps
+        for i in range(total):
+            shot = i * shots // total
+            frame = np.zeros((height, width, 3), dtype=np.uint8)
+            frame[:, :, shot % 3] = 60 + 180 * shot // max(shots - 1, 1)
+            frame[:, : width * (i % fps + 1) // fps, (shot + 1) % 3] = 120  # motion within a shot
+            for packet in stream.encode(av.VideoFrame.from_ndarray(frame, format="rgb24")):
+                container.mux(packet)
+        for packet in stream.encode():
+            container.mux(packet)
+    return buffer.getvalue()
+
+
+def unique_payload(payload, media_id, kind):
+    """
+    `payload` made byte-unique per media item without changing how it decodes, so
+    content-addressed caches treat every item as new: JPEG decoders stop at the
+    EOI marker, and MP4 readers skip a trailing `free` box.
+    """
+    tag = media_id.encode()
+    if kind == "video":
+        return payload + struct.pack(">I", 8 + len(tag)) + b"free" + tag
+    return payload + tag
+
+
+class GraphFixtures:
+    """
+    In-memory pages, accounts, posts and comments served by the stub.
+    Participant `i` owns page "participant-{i}" and Instagram account "ig_{i}".
+
+    `media_kind` is "image", "carousel" (`carousel_size` images) or "video"; it
+    defaults to "carousel" when `carousel_size` is set. Each post starts with
+    `comments_per_post` comments from other accounts.
+    """
+    def __init__(self, participants=1, posts_per_participant=3, carousel_size=0, media_bytes=2048,
+                 media_kind=None, comments_per_post=0, image_payload=None, video_payload=None):
+        self.media_kind = media_kind or ("carousel" if carousel_size else "image")
+        self.pages = []
+        self.posts = {}
+        self.media = {}
+        self.comments = {}
+        self.media_payload = image_payload or placeholder_bytes(media_bytes)
+        self.video_payload = video_payload or placeholder_bytes(media_bytes, magic=b"\0\0\0\x18ftypmp42")
+        self._lock = threading.Lock()
+        for i in range(participants):
+            ig_id = f"ig_{i}"
+            self.pages.append({"id": f"page_{i}", "name": f"participant-{i}",
+                               "access_token": f"page-token-{i}", "ig_id": ig_id})
+            self.posts[ig_id] = []
+            for n in range(posts_per_participant):
+                post_id = f"{ig_id}_post_{n}"
+                post = {
+                    "id": post_id,
+                    "caption": f"Lunch #{n} for participant {i}",
+                    "timestamp": "2025-01-01T12:00:00+0000",
+                    "permalink": f"https://www.instagram.com/p/{post_id}/",
+                }
+                if self.media_kind == "carousel":
+                    post["media_type"] = "CAROUSEL_ALBUM"
+                    post["children"] = {"data": [{"id": f"{post_id}_c{c}"} for c in range(carousel_size)]}
+                    for c in range(carousel_size):
+                        child_id = f"{post_id}_c{c}"
+                        self.media[child_id] = {"id": child_id, "media_type": "IMAGE",
+                                                "media_url": f"/media/{child_id}.jpg"}
+                elif self.media_kind == "video":
+                    post["media_type"] = "VIDEO"
+                    post["media_url"] = f"/media/{post_id}.mp4"
+                else:
+                    post["media_type"] = "IMAGE"
+                    post["media_url"] = f"/media/{post_id}.jpg"
+                self.posts[ig_id].append(post)
+                self.media[post_id] = post
+                self.comments[post_id] = [
+                    {"id": f"{post_id}_seed_{k}", "text": f"Looks tasty! Is that homemade? ({k})",
+                     "username": COMMENT_AUTHORS[k % len(COMMENT_AUTHORS)],
+                     "timestamp": f"2025-01-01T12:{k % 60:02d}:00+0000"}
+                    for k in range(comments_per_post)
+                ]
+
+    def media_bytes(self, filename):
+        media_id, _, extension = filename.rpartition(".")
+        if extension == "mp4":
+            return unique_payload(self.video_payload, media_id, "video"), "video/mp4"
+        return unique_payload(self.media_payload, media_id, "image"), "image/jpeg"
+
+    def add_comment(self, post_id, text):
+        with self._lock:
+            comments = self.comments.setdefault(post_id, [])
+            comment = {"id": f"{post_id}_comment_{len(comments)}", "text": text, "username": "persona",
+                       "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S+0000", time.gmtime())}
+            comments.append(comment)
+        return comment
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, so pooled clients can reuse connections
+
+    def setup(self):
+        super().setup()
+        self.server.stats["connections"] += 1
+        if self.server.handshake_latency:
+            time.sleep(self.server.handshake_latency)
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, payload, status=200, headers=None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_bytes(self, body, content_type):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _absolute(self, path):
+        return f"http://{self.headers['Host']}{path}"
+
+    def _begin(self):
+        """Count and delay the request; returns True if an injected error was sent instead."""
+        self.server.stats["requests"] += 1
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        if self.server.error_rate and self.server.rng.random() < self.server.error_rate:
+            self.server.stats["errors"] += 1
+            if self.server.rng.random() < 0.5:
+                self._send_json({"error": {"message": "An unexpected error has occurred. Please retry your "
+                                           "request later.", "type": "OAuthException", "code": 2,
+                                           "is_transient": True}}, 500)
+            else:
+                self._send_json({"error": {"message": "Application request limit reached",
+                                           "type": "OAuthException", "code": 4, "is_transient": True}}, 429)
+            return True
+        return False
+
+    def do_GET(self):
+        if self._begin():
+            return
+        parsed = urlparse(self.path)
+        query = {k: v[0] for k, v in parse_qs(parsed.query).items()}
+        parts = [p for p in parsed.path.split("/") if p]
+        fixtures = self.server.fixtures
+
+        if parts and parts[0] == "media":
+            return self._send_bytes(*fixtures.media_bytes(parts[-1]))
+        if not parts or parts[0] != API_VERSION:
+            return self._send_json({"error": {"message": "unknown path"}}, 404)
+        parts = parts[1:]
+
+        if parts == ["me", "accounts"]:
+            return self._send_json({"data": [{k: p[k] for k in ("id", "name", "access_token")}
+                                             for p in fixtures.pages]})
+        if parts == ["me"]:
+            return self._send_json({"id": "me", "name": "Bench User"})
+        if parts == ["debug_token"]:
+            return self._send_json({"data": {"is_valid": True, "expires_at": int(time.time()) + 60 * 86400}})
+        if parts == ["oauth", "access_token"]:
+            return self._send_json({"access_token": f"{query.get('fb_exchange_token', 'token')}-renewed",
+                                    "token_type": "bearer", "expires_in": 60 * 86400})
+        if len(parts) == 2 and parts[1] == "media":
+            posts = fixtures.posts.get(parts[0], [])
+            limit = int(query.get("limit", 25))
+            expand = "children{" in query.get("fields", "")
+            return self._send_json({"data": [self._with_urls(p, expand) for p in posts[:limit]]})
+        if len(parts) == 2 and parts[1] == "comments":
+            return self._send_json(self._comments_page(parts[0], parsed.path, query))
+        if len(parts) == 1:
+            for page in fixtures.pages:
+                if page["id"] == parts[0]:
+                    return self._send_json({"id": page["id"],
+                                            "connected_instagram_account": {"id": page["ig_id"]}})
+            if parts[0] in fixtures.media:
+                return self._send_json(self._with_urls(fixtures.media[parts[0]]))
+        return self._send_json({"error": {"message": "unknown object"}}, 404)
+
+    def do_POST(self):
+        if self._begin():
+            return
+        length = int(self.headers.get("Content-Length", 0))
+        form = {k: v[0] for k, v in parse_qs(self.rfile.read(length).decode()).items()}
+        parts = [p for p in urlparse(self.path).path.split("/") if p]
+        if parts == [API_VERSION] and "batch" in form:
+            return self._send_json([self._batch_item(item) for item in json.loads(form["batch"])])
+        if len(parts) == 3 and parts[0] == API_VERSION and parts[2] == "comments":
+            comment = self.server.fixtures.add_comment(parts[1], form.get("message", ""))
+            return self._send_json({"id": comment["id"]})
+        return self._send_json({"error": {"message": "unknown path"}}, 404)
+
+    def _comments_page(self, post_id, path, query):
+        """Oldest-first pages with numeric `after` cursors, like the comments edge."""
+        comments = self.server.fixtures.comments.get(post_id, [])
+        start = int(query.get("after", 0))
+        end = min(start + int(query.get("limit", 25)), len(comments))
+        page = {"data": comments[start:end], "paging": {"cursors": {"before": str(start), "after": str(end)}}}
+        if end < len(comments):
+            page["paging"]["next"] = self._absolute(f"{path}?{urlencode({**query, 'after': end})}")
+        return page
+
+    def _with_urls(self, media, expand_children=False):
+        media = dict(media)
+        if media.get("media_url", "").startswith("/"):
+            media["media_url"] = self._absolute(media["media_url"])
+        if expand_children and "children" in media:
+            media["children"] = {"data": [self._with_urls(self.server.fixtures.media[c["id"]])
+                                          for c in media["children"]["data"]]}
+        return media
+
+    def _batch_item(self, item):
+        media_id = item["relative_url"].split("?")[0]
+        media = self.server.fixtures.media.get(media_id)
+        if media is None:
+            return {"code": 404, "body": json.dumps({"error": {"message": "unknown object"}})}
+        return {"code": 200, "body": json.dumps(self._with_urls(media))}
+
+
+class StubGraphServer:
+    def __init__(self, fixtures=None, latency=0.0, handshake_latency=0.0, error_rate=0.0, seed=0,
+                 host="127.0.0.1", port=0):
+        self.httpd = ThreadingHTTPServer((host, port), _Handler)
+        self.httpd.daemon_threads = True
+        self.httpd.fixtures = fixtures or GraphFixtures()
+        self.httpd.latency = latency
+        self.httpd.handshake_latency = handshake_latency
+        self.httpd.error_rate = error_rate
+        self.httpd.rng = random.Random(seed)
+        self.httpd.stats = {"connections": 0, "requests": 0, "errors": 0}
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/{API_VERSION}"
+
+    @property
+    def stats(self):
+        return self.httpd.stats
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -0,0 +1,204 @@
+"""
+Local stand-in for the OpenAI chat-completions endpoint (POST /v1/chat/completions),
+used by pointing OPENAI_BASE_URL at `server.base_url`.
+
+Answers with a short generated comment: as one JSON response, or streamed as
+server-sent events (with a final usage chunk when `stream_options.include_usage`
+is set). json_schema requests (multi-persona generation) get an object with a
+comment for every required key. Usage reports prompt tokens estimated like the
+real API (text length / 4, a flat cost per image) and counts the system-message
+prefix as cached once it has been seen, like automatic prompt caching.
+
+Latency is modelled as `ttft` seconds before the first token plus `token_latency`
+per generated token. With `error_rate` set, that fraction of requests fails with a
+429 (with a short Retry-After) or a 500.
+
+    server = StubOpenAIServer(ttft=0.3, token_latency=0.01).start()
+    client = AsyncOpenAI(api_key="test", base_url=server.base_url)
+    ...
+    server.stop()
+"""
+
+import hashlib
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WORDS = (
+    "This looks so good! Love the colours on that plate, and the veggies are a nice touch. "
+    "Did you take your time with it? Savour every bite, you deserve a proper meal today."
+).split()
+# Provider prompt caching works on prefixes of at least this many tokens, in steps of CACHE_BLOCK
+CACHE_MIN_TOKENS = 1024
+CACHE_BLOCK = 128
+IMAGE_TOKENS = {"low": 85, "high": 765, "auto": 765}
+
+
+def estimate_tokens(content):
+    if isinstance(content, str):
+        return len(content) // 4 + 1
+    tokens = 0
+    for block in content or []:
+        if block.get("type") == "text":
+            tokens += len(block.get("text", "")) // 4 + 1
+        else:
+            tokens += IMAGE_TOKENS.get(block.get("image_url", {}).get("detail", "auto"), 765)
+    return tokens
+
+
+def comment_text(rng, words):
+    start = rng.randrange(len(WORDS))
+    return " ".join(WORDS[(start + i) % len(WORDS)] for i in range(words))
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, payload, status=200, headers=None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_chunk(self, payload):
+        data = f"data: {payload if isinstance(payload, str) else json.dumps(payload)}\n\n".encode()
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_POST(self):
+        server = self.server
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        server.count("requests")
+        if self.path.rstrip("/") != "/v1/chat/completions":
+            return self._send_json({"error": {"message": "unknown path"}}, 404)
+        if server.error_rate and server.random() < server.error_rate:
+            server.count("errors")
+            if server.random() < 0.5:
+                return self._send_json({"error": {"message": "Rate limit reached", "type": "requests",
+                                                  "code": "rate_limit_exceeded"}}, 429, {"Retry-After": "0.2"})
+            return self._send_json({"error": {"message": "The server had an error", "type": "server_error"}}, 500)
+
+        text, structured = self._completion_text(request)
+        tokens = text.split(" ")
+        if request.get("max_tokens") and not structured:
+            tokens = tokens[:request["max_tokens"]]
+        usage = self._usage(request, len(tokens))
+        server.count("completion_tokens", len(tokens))
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        base = {"id": completion_id, "created": int(time.time()), "model": request.get("model", "stub")}
+
+        time.sleep(server.ttft)
+        if not request.get("stream"):
+            time.sleep(server.token_latency * len(tokens))
+            return self._send_json({**base, "object": "chat.completion", "usage": usage, "choices": [{
+                "index": 0, "finish_reason": "stop",
+                "message": {"role": "assistant", "content": " ".join(tokens)}
+            }]})
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        chunk = {**base, "object": "chat.completion.chunk"}
+        try:
+            self._send_chunk({**chunk, "choices": [{"index": 0, "delta": {"role": "assistant", "content": ""},
+                                                    "finish_reason": None}]})
+            for i, token in enumerate(tokens):
+                if i:
+                    time.sleep(server.token_latency)
+                content = token if i == 0 else f" {token}"
+                self._send_chunk({**chunk, "choices": [{"index": 0, "delta": {"content": content},
+                                                        "finish_reason": None}]})
+            self._send_chunk({**chunk, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+            if (request.get("stream_options") or {}).get("include_usage"):
+                self._send_chunk({**chunk, "choices": [], "usage": usage})
+            self._send_chunk("[DONE]")
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            server.count("streams_cut")  # the client stopped reading (length budget reached)
+            self.close_connection = True
+
+    def _completion_text(self, request):
+        rng = random.Random(self.server.random())
+        schema = ((request.get("response_format") or {}).get("json_schema") or {}).get("schema")
+        if schema:
+            return json.dumps({key: comment_text(rng, self.server.words) for key in schema.get("required", [])}), True
+        return comment_text(rng, self.server.words), False
+
+    def _usage(self, request, completion_tokens):
+        messages = request.get("messages", [])
+        prompt_tokens = sum(estimate_tokens(m.get("content")) for m in messages)
+        prefix = [m for m in messages if m.get("role") == "system"]
+        prefix_tokens = sum(estimate_tokens(m.get("content")) for m in prefix)
+        cached_tokens = 0
+        if prefix_tokens >= CACHE_MIN_TOKENS:
+            key = hashlib.sha256(json.dumps(prefix, sort_keys=True).encode()).hexdigest()
+            if self.server.seen_prefix(key):
+                cached_tokens = prefix_tokens // CACHE_BLOCK * CACHE_BLOCK
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "prompt_tokens_details": {"cached_tokens": cached_tokens}
+        }
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.stats[name] = self.stats.get(name, 0) + amount
+
+    def random(self):
+        with self.lock:
+            return self.rng.random()
+
+    def seen_prefix(self, key):
+        with self.lock:
+            seen = key in self.prefixes
+            self.prefixes.add(key)
+            return seen
+
+
+class StubOpenAIServer:
+    def __init__(self, ttft=0.0, token_latency=0.0, words=18, error_rate=0.0, seed=0,
+                 host="127.0.0.1", port=0):
+        self.httpd = _Server((host, port), _Handler)
+        self.httpd.ttft = ttft
+        self.httpd.token_latency = token_latency
+        self.httpd.words = words
+        self.httpd.error_rate = error_rate
+        self.httpd.rng = random.Random(seed)
+        self.httpd.lock = threading.Lock()
+        self.httpd.prefixes = set()
+        self.httpd.stats = {"requests": 0, "errors": 0, "completion_tokens": 0}
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    @property
+    def stats(self):
+        return self.httpd.stats
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
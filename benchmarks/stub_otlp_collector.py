@@ -0,0 +1,129 @@
+"""
+Local stand-in for an OpenTelemetry collector.
+
+Accepts OTLP/HTTP JSON on POST /v1/traces (what tracing.OtlpHttpExporter sends),
+keeps the spans in memory and can print a per-name latency summary. Optionally
+appends every span to a JSON-lines file.
+
+    collector = StubOtlpCollector().start()
+    tracing.configure(enabled=True, exporter="otlp", endpoint=collector.endpoint)
+    ...
+    tracing.flush()
+    print(collector.summary())
+    collector.stop()
+
+Or standalone, for a pipeline run with TRACE_EXPORTER=otlp:
+    python benchmarks/stub_otlp_collector.py --port 4318 --out traces.jsonl
+"""
+
+import argparse
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def _attribute_value(value):
+    for key in ("stringValue", "boolValue", "doubleValue"):
+        if key in value:
+            return value[key]
+    if "intValue" in value:
+        return int(value["intValue"])
+    return None
+
+
+def _flatten(body):
+    """OTLP resourceSpans -> flat span dicts."""
+    spans = []
+    for resource_spans in body.get("resourceSpans", []):
+        for scope_spans in resource_spans.get("scopeSpans", []):
+            for span in scope_spans.get("spans", []):
+                start, end = int(span["startTimeUnixNano"]), int(span["endTimeUnixNano"])
+                spans.append({
+                    "trace_id": span["traceId"],
+                    "span_id": span["spanId"],
+                    "parent_id": span.get("parentSpanId"),
+                    "name": span["name"],
+                    "start_ns": start,
+                    "duration_ms": (end - start) / 1e6,
+                    "attributes": {a["key"]: _attribute_value(a["value"]) for a in span.get("attributes", [])},
+                    "error": span.get("status", {}).get("message") if span.get("status", {}).get("code") == 2 else None
+                })
+    return spans
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        if self.path.rstrip("/") != "/v1/traces":
+            self.send_response(404)
+            self.end_headers()
+            return
+        length = int(self.headers.get("Content-Length", 0))
+        spans = _flatten(json.loads(self.rfile.read(length) or b"{}"))
+        with self.server.lock:
+            self.server.spans.extend(spans)
+            if self.server.out_path:
+                with open(self.server.out_path, "a", encoding="utf-8") as f:
+                    f.writelines(json.dumps(span) + "\n" for span in spans)
+        body = b"{}"
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class StubOtlpCollector:
+    def __init__(self, host="127.0.0.1", port=0, out_path=None):
+        self.httpd = ThreadingHTTPServer((host, port), _Handler)
+        self.httpd.daemon_threads = True
+        self.httpd.spans = []
+        self.httpd.lock = threading.Lock()
+        self.httpd.out_path = out_path
+        self._thread = None
+
+    @property
+    def endpoint(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1/traces"
+
+    @property
+    def spans(self):
+        with self.httpd.lock:
+            return list(self.httpd.spans)
+
+    def summary(self):
+        """Count, average and max duration per span name, slowest first."""
+        by_name = {}
+        for span in self.spans:
+            by_name.setdefault(span["name"], []).append(span["duration_ms"])
+        lines = [f"{'span':<40} {'count':>6} {'avg ms':>9} {'max ms':>9}"]
+        for name, durations in sorted(by_name.items(), key=lambda item: -sum(item[1])):
+            lines.append(f"{name:<40} {len(durations):>6} {sum(durations) / len(durations):>9.1f} "
+                         f"{max(durations):>9.1f}")
+        return "\n".join(lines)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=4318)
+    parser.add_argument("--out", default=None, help="append received spans to this JSON-lines file")
+    args = parser.parse_args()
+    collector = StubOtlpCollector(port=args.port, out_path=args.out).start()
+    print(f"Collecting spans at {collector.endpoint}; Ctrl+C prints a summary.")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        print(collector.summary())
+        collector.stop()
@@ -1,7 +1,58 @@
+import asyncio
 import json
 import mimetypes
-from openai import OpenAI
-from config import OPENAI_API_KEY, OPENAI_MODEL
+import random
+import re
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Optional
+from rate_limiter import RateLimiter
+from response_cache import CacheMiss, ResponseCache, request_key
+from telemetry import annotate, error_code
+from tracing import span
+from config import (
+    OPENAI_API_KEY,
+    OPENAI_MODEL,
+    OPENAI_BASE_URL,
+    OPENAI_IMAGE_DETAIL,
+    OPENAI_RPM_LIMIT,
+    OPENAI_TPM_LIMIT,
+    OPENAI_REQUEST_TIMEOUT,
+    OPENAI_MAX_RETRIES,
+    OPENAI_BACKOFF_BASE_SECONDS,
+    OPENAI_BACKOFF_MAX_SECONDS,
+    OPENAI_REPLAY,
+    RESPONSE_CACHE_ENABLED,
+    GENERATION_STREAMING,
+    COMMENT_HISTORY_LIMIT,
+    DEBUG_LOGGING,
+    validate_config
+)
+
+# Rough per-image input cost used only for rate-limit reservations
+IMAGE_TOKEN_ESTIMATE = 85 if OPENAI_IMAGE_DETAIL == "low" else 765
+OUTPUT_TOKEN_ESTIMATE = 100
+TEMPERATURE = 0.7
+# Output cap: generous per-word allowance (emoji and punctuation tokenize poorly) plus slack
+TOKENS_PER_WORD = 2
+MAX_TOKENS_MARGIN = 16
+DEFAULT_MAX_TOKENS = 150
+
+# Ranges and counts must name their unit, so "1-2 sentences" is not read as a word budget
+WORD_RANGE = re.compile(r"(\d+)\s*(?:–|—|-|to)\s*(\d+)\s+(?:\w+\s+)?words")
+WORD_COUNT = re.compile(r"(\d+)\s+(?:\w+\s+)?words")
+SENTENCE_END = re.compile(r"[.!?…]+[\"')\]]*(?=\s|$)")
+# Words whose period does not end a sentence ("Mr. Chen"); initialisms like "e.g." are recognised by shape
+ABBREVIATIONS = {"mr", "mrs", "ms", "dr", "prof", "sr", "jr", "st", "vs", "approx", "incl"}
+INITIALISM = re.compile(r"\w(?:\.\w)+")
+CLAUSE_BREAK = re.compile(r"[,;:]?\s+[—–-]\s+|[,;:](?=\s)")
+# Words a cut comment should not end on ("... looks amazing and")
+DANGLING_WORDS = {
+    "a", "an", "and", "as", "at", "because", "but", "by", "for", "from", "if", "in", "is", "it's", "its",
+    "my", "of", "on", "or", "so", "than", "that", "the", "this", "to", "too", "very", "with", "your"
+}
 
 def format_persona_for_prompt(persona_data):
     """
@@ -25,70 +76,561 @@ def format_persona_for_prompt(persona_data):
 
     return "\n\n".join([p for p in parts if p])
 
+
+@dataclass(frozen=True)
+class PersonaPrompt:
+    """
+    A persona compiled once (at load time) into the immutable prompt fragment sent
+    with every request for that persona.
+    """
+    name: str
+    text: str
+    max_words: Optional[int] = None  # upper bound from the persona's "Length of Comments"
+
+    @property
+    def message(self):
+        return {"role": "system", "content": f"Persona:\n{self.text}"}
+
+    @property
+    def max_tokens(self):
+        if self.max_words is None:
+            return DEFAULT_MAX_TOKENS
+        return self.max_words * TOKENS_PER_WORD + MAX_TOKENS_MARGIN
+
+
+def parse_max_words(length_spec):
+    """
+    Upper word bound from a "Length of Comments" description such as
+    "Comments range from 6–15 punchy words"; None if it names no number.
+    """
+    if not length_spec:
+        return None
+    match = WORD_RANGE.search(length_spec)
+    if match:
+        return max(int(match.group(1)), int(match.group(2)))
+    match = WORD_COUNT.search(length_spec)
+    return int(match.group(1)) if match else None
+
+
+def compile_persona(name, persona_data):
+    return PersonaPrompt(
+        name=name,
+        text=format_persona_for_prompt(persona_data).strip(),
+        max_words=parse_max_words(persona_data.get("Length of Comments"))
+    )
+
+
+def _sentence_ends(text):
+    """End offsets of the sentences in `text`, skipping periods that close an abbreviation."""
+    ends = []
+    for m in SENTENCE_END.finditer(text):
+        before = text[:m.start()].split()
+        if m.group().rstrip("\"')]") == "." and before:
+            word = before[-1].lstrip("\"'(").lower()
+            if word in ABBREVIATIONS or INITIALISM.fullmatch(word):
+                continue
+        ends.append(m.end())
+    return ends
+
+
+def _trim_fragment(head, max_words):
+    """
+    End a cut with no complete sentence somewhere that reads as finished: at the
+    last clause break that keeps at least half the budget, then without trailing
+    conjunctions, articles or prepositions.
+    """
+    breaks = [m.start() for m in CLAUSE_BREAK.finditer(head) if len(head[:m.start()].split()) * 2 >= max_words]
+    if breaks:
+        head = head[:breaks[-1]]
+    words = head.split()
+    while len(words) > 1 and words[-1].lower().strip(",;:—–-") in DANGLING_WORDS:
+        words.pop()
+    return " ".join(words).rstrip(",;:—–- ")
+
+
+def fit_to_budget(text, max_words):
+    """
+    Cut `text` to at most `max_words` words, ending at the last complete sentence
+    that fits, or at a clause boundary when no sentence does (see _trim_fragment).
+    Returns the text and whether it was cut.
+    """
+    words = list(re.finditer(r"\S+", text))
+    if max_words is None or len(words) <= max_words:
+        return text, False
+    head = text[:words[max_words - 1].end()]
+    sentence_ends = _sentence_ends(head)
+    if sentence_ends:
+        return head[:sentence_ends[-1]].strip(), True
+    return _trim_fragment(head, max_words), True
+
+
+def estimate_request_tokens(messages):
+    """
+    Cheap upper-bound-ish token estimate (~4 characters per token, a flat cost per
+    image, plus the expected output) used to reserve TPM capacity before a call.
+    """
+    tokens = OUTPUT_TOKEN_ESTIMATE
+    for message in messages:
+        content = message["content"]
+        if isinstance(content, str):
+            content = [{"type": "text", "text": content}]
+        for block in content:
+            if block["type"] == "text":
+                tokens += len(block["text"]) // 4 + 1
+            else:
+                tokens += IMAGE_TOKEN_ESTIMATE
+    return tokens
+
+
+def loggable_messages(messages):
+    """Copy of `messages` with inlined image data shortened, for debug output."""
+    def shorten(block):
+        url = block.get("image_url", {}).get("url", "") if block.get("type") == "image_url" else ""
+        if not url.startswith("data:"):
+            return block
+        header = url.split(",", 1)[0]
+        return {**block, "image_url": {**block["image_url"], "url": f"{header},<{len(url)} chars>"}}
+
+    return [
+        {**m, "content": [shorten(b) for b in m["content"]]} if isinstance(m["content"], list) else m
+        for m in messages
+    ]
+
+
+def format_comment_history(comment_history):
+    """
+    The most recent COMMENT_HISTORY_LIMIT comments, one per line. Accepts the list
+    from CommentSnapshot.history() or already-formatted text.
+    """
+    if isinstance(comment_history, str):
+        return comment_history.strip() or "[No previous comments]"
+    recent = (comment_history or [])[-COMMENT_HISTORY_LIMIT:]
+    return "\n".join(recent) or "[No previous comments]"
+
+
+def is_retryable(error):
+    """Rate limits, server errors, timeouts and dropped connections are worth retrying."""
+    import openai  # already loaded by the client that raised
+    if isinstance(error, (asyncio.TimeoutError, openai.APIConnectionError, openai.RateLimitError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
+
+def backoff_delay(attempt, error=None):
+    """
+    Exponential backoff with full jitter, or the server's Retry-After when a
+    response carries one.
+    """
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass
+    return random.uniform(0, min(OPENAI_BACKOFF_MAX_SECONDS, OPENAI_BACKOFF_BASE_SECONDS * 2 ** attempt))
+
+
+def set_usage(llm_span, usage):
+    """Token counts of a completion as attributes of its LLM span."""
+    if usage is not None:
+        details = getattr(usage, "prompt_tokens_details", None)
+        llm_span.set(prompt_tokens=usage.prompt_tokens, completion_tokens=usage.completion_tokens,
+                     cached_tokens=getattr(details, "cached_tokens", None))
+
 class CommentGenerator:
-    def __init__(self, base_prompt):
+    def __init__(self, base_prompt, response_cache=None, replay=OPENAI_REPLAY):
         self.base_prompt = base_prompt
-        self.client = OpenAI(api_key=OPENAI_API_KEY)
+        # The openai SDK is imported and its clients built on first use (see client/async_client)
+        self._client = None
+        self._async_client = None
+        self._client_lock = threading.Lock()
+        self.rate_limiter = RateLimiter(rpm=OPENAI_RPM_LIMIT, tpm=OPENAI_TPM_LIMIT)
         self.model = OPENAI_MODEL
+        # Prompt-cache accounting across all requests made by this generator
+        self.usage_stats = {"requests": 0, "prompt_tokens": 0, "cached_tokens": 0}
+        self._stats_lock = threading.Lock()
+        # Completed generations, reused when the exact same request is made again.
+        # In replay mode nothing else is used: a request without a cached response fails.
+        if response_cache is None and (RESPONSE_CACHE_ENABLED or replay):
+            response_cache = ResponseCache()
+        self.response_cache = response_cache
+        self.replay = replay
+        # Streaming latency: time to first token of recent streamed generations
+        self.streaming = GENERATION_STREAMING
+        self.ttft_samples = deque(maxlen=1000)
+        self.truncated = 0
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    validate_config("openai")
+                    from openai import OpenAI
+                    self._client = OpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL)
+        return self._client
+
+    @property
+    def async_client(self):
+        if self._async_client is None:
+            with self._client_lock:
+                if self._async_client is None:
+                    validate_config("openai")
+                    from openai import AsyncOpenAI
+                    # Retries are handled by agenerate_comment so they go through the rate limiter
+                    self._async_client = AsyncOpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL,
+                                                     max_retries=0)
+        return self._async_client
+
+    def close(self):
+        """Close the response cache's database and the sync OpenAI client, if one was built."""
+        if self.response_cache is not None:
+            self.response_cache.close()
+        if self._client is not None:
+            self._client.close()
+
+    def _record_usage(self, usage):
+        if usage is None:
+            return
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached_tokens = (getattr(details, "cached_tokens", 0) or 0) if details else 0
+        with self._stats_lock:
+            self.usage_stats["requests"] += 1
+            self.usage_stats["prompt_tokens"] += usage.prompt_tokens or 0
+            self.usage_stats["cached_tokens"] += cached_tokens
+        annotate(prompt_tokens=usage.prompt_tokens, completion_tokens=usage.completion_tokens,
+                 cached_tokens=cached_tokens)
+        print(f"🧠 Prompt tokens: {usage.prompt_tokens} (cached: {cached_tokens}), "
+              f"overall cache hit rate: {self.cache_hit_rate():.0%}")
+
+    def cache_hit_rate(self):
+        """Fraction of prompt tokens served from the provider's prompt cache so far."""
+        with self._stats_lock:
+            prompt_tokens = self.usage_stats["prompt_tokens"]
+            return self.usage_stats["cached_tokens"] / prompt_tokens if prompt_tokens else 0.0
+
+    def ttft_summary(self):
+        """Average and p95 time to first token over recent streamed generations."""
+        with self._stats_lock:
+            samples = sorted(self.ttft_samples)
+        if not samples:
+            return "no streamed generations"
+        p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+        return (f"avg {sum(samples) / len(samples):.2f}s, p95 {p95:.2f}s over {len(samples)} generations "
+                f"({self.truncated} cut to the length budget)")
 
     def is_supported_image(self, url):
         mime, _ = mimetypes.guess_type(url)
         return mime in ["image/png", "image/jpeg", "image/webp", "image/gif"]
 
-    def generate_comment(self, media_url, caption, comment_history, persona_data):
+    def build_messages(self, persona_prompt, caption, media_urls, comment_history=None):
+        """
+        Lay out the request so the parts that never change for a persona come first:
+        base prompt, then the compiled persona, both as system messages. That stable
+        prefix is what the provider's automatic prompt caching can reuse; the
+        per-post caption, recent comments and images follow in the user message.
+        """
+        return [
+            {"role": "system", "content": self.base_prompt},
+            persona_prompt.message,
+            {"role": "user", "content": self._user_content(caption, media_urls, comment_history)}
+        ]
+
+    def _user_content(self, caption, media_urls, comment_history=None):
+        # Filter to include only supported images (preprocessed data URLs or plain image URLs)
+        media_blocks = [
+            {"type": "image_url", "image_url": {"url": url, "detail": OPENAI_IMAGE_DETAIL}}
+            for url in media_urls
+            if url and self.is_supported_image(url)
+        ]
+
+        # Construct the structured message content
+        return [
+            {"type": "text", "text": f"Caption:\n{caption.strip() or '[No caption provided]'}"},
+            {"type": "text", "text": f"Comment History:\n{format_comment_history(comment_history)}"},
+            *media_blocks
+        ]
+
+    def _prepare_messages(self, media_url, caption, persona_prompt, comment_history=None):
+        # # Format persona details as a readable string
+        # persona_details = "\n".join([
+        #     f"- {key}: {value}"
+        #     for key, value in persona_data.items()
+        #     if key != "IG User ID"
+        # ])
+
+        # Ensure media_url is a list
+        if isinstance(media_url, str):
+            media_url = [media_url]
+
+        # Prepare the full message sequence
+        return self.build_messages(persona_prompt, caption, media_url, comment_history)
+
+    def _lookup(self, messages, **request_options):
+        """
+        Return (cached content or None, cache key) for this exact request. In replay
+        mode a miss raises CacheMiss instead.
+        """
+        if self.response_cache is None:
+            return None, None
+        key = request_key(self.model, TEMPERATURE, messages, **request_options)
+        content = self.response_cache.get(key)
+        if content is not None:
+            print("🧠 Served from the response cache.")
+            annotate(response_cached=1)
+        elif self.replay:
+            raise CacheMiss("Replay mode: no cached response for this request")
+        return content, key
+
+    def _store(self, key, content):
+        if key is not None and content:
+            self.response_cache.put(key, content)
+
+    def _finish(self, content, messages):
+        output = content.strip().strip("\"")
+
+        # Simulated output for now
+        # output = "test"
+
+        if DEBUG_LOGGING:
+            print("🧠 Final message sent to GPT:")
+            print(json.dumps(loggable_messages(messages), indent=2))
+        return output
+
+    def generate_comment(self, media_url, caption, comment_history, persona_data, persona_prompt=None):
         """
         Generate a comment using GPT-4o with multimodal structured input.
+
+        Pass the persona's precompiled `persona_prompt` (see PersonaManager) to avoid
+        re-formatting the persona on every call.
         """
         try:
-            # # Format persona details as a readable string
-            # persona_details = "\n".join([
-            #     f"- {key}: {value}"
-            #     for key, value in persona_data.items()
-            #     if key != "IG User ID"
-            # ])
-
-            persona_details = format_persona_for_prompt(persona_data)
-
-            # Ensure media_url is a list
-            if isinstance(media_url, str):
-                media_url = [media_url]
-
-            # Filter to include only supported image URLs
-            media_blocks = [
-                {"type": "image_url", "image_url": {"url": url}}
-                for url in media_url
-                if url and self.is_supported_image(url)
-            ]
-
-            # Construct the structured message content
-            message_content = [
-                {"type": "text", "text": f"Caption:\n{caption.strip() or '[No caption provided]'}"},
-                {"type": "text", "text": f"Persona:\n{persona_details.strip()}"},
-                # {"type": "text", "text": f"Comment History:\n{comment_history.strip() or '[No previous comments]'}"},
-                *media_blocks
-            ]
-
-            # Prepare the full message sequence
-            messages = [
-                {"role": "system", "content": self.base_prompt},
-                {"role": "user", "content": message_content}
-            ]
-
-            # Uncomment this to call the real API
-            response = self.client.chat.completions.create(
+            persona_prompt = persona_prompt or compile_persona(persona_data.get("Label", ""), persona_data)
+            messages = self._prepare_messages(media_url, caption, persona_prompt, comment_history)
+
+            content, key = self._lookup(messages, max_tokens=persona_prompt.max_tokens)
+            if content is None:
+                # Uncomment this to call the real API
+                with span("llm.chat.completions", model=self.model, persona=persona_prompt.name) as llm_span:
+                    response = self.client.chat.completions.create(
+                        model=self.model,
+                        messages=messages,
+                        temperature=TEMPERATURE,
+                        max_tokens=persona_prompt.max_tokens
+                    )
+                    set_usage(llm_span, response.usage)
+                self._record_usage(response.usage)
+                content, _ = fit_to_budget(response.choices[0].message.content or "", persona_prompt.max_words)
+                self._store(key, content)
+            return self._finish(content, messages)
+
+        except Exception as e:
+            print(f"❌ Error generating comment: {e}")
+            annotate(error_code=error_code(e))
+            return None
+
+    async def _with_retries(self, messages, call):
+        """
+        Run `call()` (one API request returning (result, usage)) through the rate
+        limiter, retrying transient failures. Raises once retries are exhausted or
+        on a non-retryable error.
+        """
+        estimated_tokens = estimate_request_tokens(messages)
+        for attempt in range(OPENAI_MAX_RETRIES + 1):
+            await self.rate_limiter.acquire(estimated_tokens)
+            annotate(attempts=1)
+            try:
+                with span("llm.chat.completions", model=self.model, attempt=attempt + 1) as llm_span:
+                    result, usage = await asyncio.wait_for(call(), timeout=OPENAI_REQUEST_TIMEOUT)
+                    set_usage(llm_span, usage)
+            except Exception as e:
+                if not is_retryable(e) or attempt == OPENAI_MAX_RETRIES:
+                    raise
+                delay = backoff_delay(attempt, e)
+                if getattr(e, "status_code", None) == 429:
+                    self.rate_limiter.pause(delay)
+                print(f"⚠️ Generation attempt {attempt + 1} failed ({e.__class__.__name__}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                continue
+
+            if usage is not None:
+                self.rate_limiter.reconcile(estimated_tokens, usage.total_tokens)
+            self._record_usage(usage)
+            return result
+
+    async def _acreate(self, messages, **request_options):
+        """One chat completion, rate limited and retried (see _with_retries)."""
+        async def call():
+            response = await self.async_client.chat.completions.create(
                 model=self.model,
                 messages=messages,
-                temperature=0.7
+                temperature=TEMPERATURE,
+                **request_options
             )
-            output = response.choices[0].message.content.strip().strip("\"")
+            return response, response.usage
 
-            # Simulated output for now
-            # output = "test"
+        return await self._with_retries(messages, call)
 
-            print("🧠 Final message sent to GPT:")
-            print(json.dumps(messages, indent=2))
-            return output
+    async def _astream(self, messages, persona_prompt):
+        """
+        Stream one completion and stop collecting text as soon as it overruns the
+        persona's word budget, keeping the complete sentences that fit. The rest of
+        the stream (at most max_tokens) is still read, without keeping its content,
+        so the final usage chunk is recorded. Records the time to first token.
+        """
+        async def call():
+            started = time.perf_counter()
+            first_token_at = None
+            text, usage, truncated = "", None, False
+            stream = await self.async_client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                temperature=TEMPERATURE,
+                max_tokens=persona_prompt.max_tokens,
+                stream=True,
+                stream_options={"include_usage": True}
+            )
+            try:
+                async for chunk in stream:
+                    if chunk.usage is not None:
+                        usage = chunk.usage
+                    if truncated or not chunk.choices or not chunk.choices[0].delta.content:
+                        continue
+                    if first_token_at is None:
+                        first_token_at = time.perf_counter()
+                    text += chunk.choices[0].delta.content
+                    text, truncated = fit_to_budget(text, persona_prompt.max_words)
+                    if truncated:
+                        cut_at = time.perf_counter()
+            finally:
+                await stream.close()
+
+            if first_token_at is not None:
+                ttft = first_token_at - started
+                annotate(ttft_ms=ttft * 1000.0)
+                with self._stats_lock:
+                    self.ttft_samples.append(ttft)
+                    self.truncated += truncated
+                cut = f" (cut to length budget after {cut_at - started:.2f}s)" if truncated else ""
+                print(f"⏱️ {persona_prompt.name}: first token after {ttft:.2f}s, "
+                      f"done after {time.perf_counter() - started:.2f}s" + cut)
+            return text, usage
+
+        return await self._with_retries(messages, call)
+
+    async def _acomplete(self, messages, persona_prompt):
+        """Completion text for `messages`, from the response cache when possible."""
+        content, key = self._lookup(messages, max_tokens=persona_prompt.max_tokens)
+        if content is None:
+            if self.streaming:
+                content = await self._astream(messages, persona_prompt)
+            else:
+                response = await self._acreate(messages, max_tokens=persona_prompt.max_tokens)
+                content, _ = fit_to_budget(response.choices[0].message.content or "", persona_prompt.max_words)
+            self._store(key, content)
+        return content
+
+    async def agenerate_comment(self, media_url, caption, comment_history, persona_data, persona_prompt=None):
+        """
+        Async variant of generate_comment for use inside the event loop, so persona
+        generations actually run concurrently.
+
+        Every attempt first reserves capacity from the shared RPM/TPM rate limiter and
+        is bounded by OPENAI_REQUEST_TIMEOUT. 429s, 5xx, timeouts and connection errors
+        are retried up to OPENAI_MAX_RETRIES times with jittered exponential backoff
+        (or the server's Retry-After, when given).
+
+        With GENERATION_STREAMING the completion is streamed and cut off at the last
+        complete sentence within the persona's word budget; the tokens past it (at
+        most max_tokens) are only read for the final usage report.
+        """
+        try:
+            persona_prompt = persona_prompt or compile_persona(persona_data.get("Label", ""), persona_data)
+            messages = self._prepare_messages(media_url, caption, persona_prompt, comment_history)
+            content = await self._acomplete(messages, persona_prompt)
+            return self._finish(content, messages)
 
         except Exception as e:
             print(f"❌ Error generating comment: {e}")
+            annotate(error_code=error_code(e))
             return None
+
+    def build_multi_persona_messages(self, persona_prompts, caption, media_urls, comment_history=None):
+        """
+        One request covering several personas: the base prompt, every persona block,
+        and an instruction to answer with a JSON object keyed by persona name. The
+        caption and images are sent once instead of once per persona.
+        """
+        persona_blocks = "\n\n".join(f"### {p.name}\n{p.text}" for p in persona_prompts)
+        instructions = (
+            "Write one separate comment for each persona above, in that persona's own voice, "
+            "as if each were posted by a different account. Respond with a JSON object whose "
+            "keys are the persona names exactly as given and whose values are the comment text only."
+        )
+        return [
+            {"role": "system", "content": self.base_prompt},
+            {"role": "system", "content": f"Personas:\n\n{persona_blocks}\n\n{instructions}"},
+            {"role": "user", "content": self._user_content(caption, media_urls, comment_history)}
+        ]
+
+    async def agenerate_comments(self, media_url, caption, comment_history, personas):
+        """
+        Generate comments for several personas with a single structured-output request.
+
+        `personas` maps persona name -> (persona_data, persona_prompt). Returns a dict
+        of persona name -> comment text (None where generation failed). Any persona whose
+        entry is missing or not a usable string in the JSON response is regenerated on
+        its own with agenerate_comment.
+        """
+        if isinstance(media_url, str):
+            media_url = [media_url]
+        # PersonaPrompt names match the persona keys, so the JSON keys line up with the prompt
+        persona_prompts = [
+            persona_prompt or compile_persona(name, persona_data)
+            for name, (persona_data, persona_prompt) in personas.items()
+        ]
+        budgets = {p.name: p.max_words for p in persona_prompts}
+        # Room for every persona's comment plus the JSON keys and punctuation around them
+        max_tokens = sum(p.max_tokens for p in persona_prompts) + 10 * len(persona_prompts)
+
+        comments = {}
+        try:
+            messages = self.build_multi_persona_messages(persona_prompts, caption, media_url, comment_history)
+            response_format = {
+                "type": "json_schema",
+                "json_schema": {
+                    "name": "persona_comments",
+                    "strict": True,
+                    "schema": {
+                        "type": "object",
+                        "properties": {name: {"type": "string"} for name in personas},
+                        "required": list(personas),
+                        "additionalProperties": False
+                    }
+                }
+            }
+            content, key = self._lookup(messages, response_format=response_format, max_tokens=max_tokens)
+            if content is None:
+                response = await self._acreate(messages, response_format=response_format, max_tokens=max_tokens)
+                content = response.choices[0].message.content
+                parsed = json.loads(content)
+                self._store(key, content)  # only once it has parsed
+            else:
+                parsed = json.loads(content)
+            for name in personas:
+                value = parsed.get(name) if isinstance(parsed, dict) else None
+                if isinstance(value, str) and value.strip().strip("\""):
+                    comments[name], _ = fit_to_budget(value.strip().strip("\""), budgets.get(name))
+        except Exception as e:
+            print(f"❌ Error generating multi-persona comments, falling back to per-persona calls: {e}")
+
+        missing = [name for name in personas if name not in comments]
+        if missing:
+            print(f"Generating individually for: {', '.join(missing)}")
+            results = await asyncio.gather(*(
+                self.agenerate_comment(media_url, caption, comment_history, *personas[name])
+                for name in missing
+            ))
+            comments.update(zip(missing, results))
+        return comments
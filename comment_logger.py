@@ -1,11 +1,40 @@
-import sqlite3
-from config import COMMENT_LOG_FILE
+"""
+Comment Logger
+
+Records every posted comment in comments.db. The database runs in WAL mode, so
+readers (including the comment scheduler's connection) never block the writer,
+and the comments table is indexed on (post_id, persona, timestamp), so
+get_comments(post_id) stays an index lookup as the log grows.
+
+log_comment() only queues the row; a BatchWriter thread inserts queued rows in
+group commits, so concurrent persona tasks neither share a connection nor wait
+on a commit each.
+"""
+
+import threading
+from datetime import datetime, timezone
+from sqlite_writer import BatchWriter, connect
+from config import COMMENT_LOG_FILE, COMMENT_LOG_BATCH_SIZE, COMMENT_LOG_FLUSH_INTERVAL
+
 
 class CommentLogger:
-    def __init__(self, db_path=COMMENT_LOG_FILE):
+    def __init__(self, db_path=COMMENT_LOG_FILE, batch_size=COMMENT_LOG_BATCH_SIZE,
+                 flush_interval=COMMENT_LOG_FLUSH_INTERVAL):
         self.db_path = db_path
-        self.conn = sqlite3.connect(self.db_path)
+        self._local = threading.local()  # one read connection per thread
+        self.conn = connect(self.db_path)
         self.create_table()
+        self._writer = BatchWriter(
+            self.db_path,
+            'INSERT INTO comments (post_id, persona, comment, timestamp) VALUES (?, ?, ?, ?)',
+            batch_size, flush_interval, name="comment-logger"
+        )
+
+    def _reader(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = connect(self.db_path)
+        return conn
 
     def create_table(self):
         cursor = self.conn.cursor()
@@ -18,18 +47,29 @@ class CommentLogger:
                 timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
             )
         ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_comments_post_persona_time ON comments (post_id, persona, timestamp)
+        ''')
         self.conn.commit()
 
     def log_comment(self, post_id, persona, comment):
-        cursor = self.conn.cursor()
-        cursor.execute('''
-            INSERT INTO comments (post_id, persona, comment) VALUES (?, ?, ?)
-        ''', (post_id, persona, comment))
-        self.conn.commit()
+        """Queue a comment for the writer thread; the timestamp is taken now, not at commit."""
+        timestamp = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")  # CURRENT_TIMESTAMP format
+        self._writer.put((post_id, persona, comment, timestamp))
+
+    def flush(self):
+        """Block until every queued comment is committed."""
+        self._writer.flush()
 
     def get_comments(self, post_id):
-        cursor = self.conn.cursor()
+        self.flush()  # read your own writes
+        cursor = self._reader().cursor()
         cursor.execute('''
-            SELECT persona, comment, timestamp FROM comments WHERE post_id = ?
+            SELECT persona, comment, timestamp FROM comments WHERE post_id = ? ORDER BY persona, timestamp
         ''', (post_id,))
         return cursor.fetchall()
+
+    def close(self):
+        """Commit what is queued and stop the writer thread."""
+        self._writer.close()
+        self.conn.close()
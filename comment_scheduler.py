@@ -0,0 +1,324 @@
+"""
+Durable Comment Scheduler
+
+Persona delays used to be an `asyncio.sleep` per comment, so the process had to
+outlive the longest delay and a crash lost every pending comment. Scheduled
+comments now live in a `scheduled_comments` table in comments.db and are posted
+by a single dispatcher:
+
+- schedule() writes the job and returns its id immediately; a job is unique per
+  (post_id, persona), so re-running a post never schedules a second comment. Only
+  a job that failed can be scheduled again.
+- The dispatcher keeps one timer, set for the earliest due job. The table's
+  (status, due_at) index plays the role of the heap, so memory does not grow
+  with the number of pending jobs.
+- A due job is claimed atomically (pending -> posting) before it is posted and
+  marked posted afterwards, so each job is posted by exactly one worker.
+- Each claim records its owner and time. Several processes can share
+  comments.db, so a "posting" job is only taken back once its claim is older
+  than the lease (SCHEDULER_CLAIM_LEASE_SECONDS) and another scheduler owns it:
+  its process died mid-post. Such jobs, and jobs whose post attempt raised, are
+  retried only after `confirm_fn` has checked that the comment did not in fact
+  go out.
+
+Usage:
+    scheduler = CommentScheduler(post_fn, confirm_fn)
+    scheduler.start()      # inside a running event loop
+    job_id = scheduler.schedule(post_id, "aunt", "Lovely!", delay_seconds=600)
+    await scheduler.wait_for([job_id])
+    await scheduler.stop()
+"""
+
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from config import (
+    COMMENT_LOG_FILE,
+    SCHEDULER_MAX_CONCURRENCY,
+    SCHEDULER_MAX_ATTEMPTS,
+    SCHEDULER_RETRY_SECONDS,
+    SCHEDULER_CLAIM_LEASE_SECONDS
+)
+
+PENDING = "pending"
+POSTING = "posting"
+POSTED = "posted"
+FAILED = "failed"
+
+
+class CommentScheduler:
+    def __init__(self, post_fn, confirm_fn=None, db_path=COMMENT_LOG_FILE,
+                 max_concurrency=SCHEDULER_MAX_CONCURRENCY, max_attempts=SCHEDULER_MAX_ATTEMPTS,
+                 retry_seconds=SCHEDULER_RETRY_SECONDS, claim_lease_seconds=SCHEDULER_CLAIM_LEASE_SECONDS):
+        """
+        `post_fn(job)` posts a claimed job and returns the API response (None if
+        nothing was posted). `confirm_fn(job)`, if given, returns True when a job whose
+        earlier attempt was interrupted already made it onto the post.
+        """
+        self.post_fn = post_fn
+        self.confirm_fn = confirm_fn
+        self.max_concurrency = max_concurrency
+        self.max_attempts = max_attempts
+        self.retry_seconds = retry_seconds
+        self.claim_lease_seconds = claim_lease_seconds
+        self.owner = uuid.uuid4().hex  # identifies this scheduler's claims
+        self._next_recover_at = 0.0
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        self._inflight = set()
+        self._wakeup = None
+        self._job_done = None
+        self._task = None
+        self.create_table()
+
+    def create_table(self):
+        with self._lock:
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS scheduled_comments (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    post_id TEXT NOT NULL,
+                    persona TEXT NOT NULL,
+                    comment TEXT NOT NULL,
+                    payload TEXT,
+                    due_at REAL NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    needs_check INTEGER NOT NULL DEFAULT 0,
+                    last_error TEXT,
+                    created_at REAL NOT NULL,
+                    posted_at REAL,
+                    claimed_by TEXT,
+                    claimed_at REAL,
+                    UNIQUE (post_id, persona)
+                )
+            ''')
+            # Tables created before claims had an owner and time
+            columns = {row[1] for row in self.conn.execute("PRAGMA table_info(scheduled_comments)")}
+            for column, column_type in (("claimed_by", "TEXT"), ("claimed_at", "REAL")):
+                if column not in columns:
+                    try:
+                        self.conn.execute(f"ALTER TABLE scheduled_comments ADD COLUMN {column} {column_type}")
+                    except sqlite3.OperationalError:  # another process added it first
+                        pass
+            self.conn.execute('''
+                CREATE INDEX IF NOT EXISTS idx_scheduled_comments_due ON scheduled_comments (status, due_at)
+            ''')
+            self.conn.commit()
+
+    def schedule(self, post_id, persona, comment, delay_seconds=0, **payload):
+        """
+        Persist a comment to be posted `delay_seconds` from now. Extra keyword
+        arguments are stored with the job and handed back to `post_fn`. Returns the
+        job id, or None if this persona already has a comment pending, being posted
+        or posted for the post. A failed job is replaced by the new one.
+        """
+        now = time.time()
+        with self._lock:
+            cursor = self.conn.execute('''
+                INSERT INTO scheduled_comments (post_id, persona, comment, payload, due_at, created_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (post_id, persona) DO UPDATE SET
+                    comment = excluded.comment, payload = excluded.payload, due_at = excluded.due_at,
+                    created_at = excluded.created_at, status = ?, attempts = 0, needs_check = 0,
+                    last_error = NULL, posted_at = NULL, claimed_by = NULL, claimed_at = NULL
+                WHERE scheduled_comments.status = ?
+            ''', (post_id, persona, comment, json.dumps(payload), now + delay_seconds, now, PENDING, FAILED))
+            job_id = None
+            if cursor.rowcount == 1:
+                job_id = self.conn.execute('''
+                    SELECT id FROM scheduled_comments WHERE post_id = ? AND persona = ?
+                ''', (post_id, persona)).fetchone()[0]
+            self.conn.commit()
+        if job_id is None:
+            return None
+        if self._wakeup is not None:
+            self._wakeup.set()  # it may be due before the current timer
+        return job_id
+
+    def start(self):
+        """Recover interrupted jobs and start the dispatcher."""
+        if self._task is None:
+            self._recover()
+            self._wakeup = asyncio.Event()
+            self._job_done = asyncio.Event()
+            self._task = asyncio.create_task(self._dispatch_loop())
+        return self
+
+    async def stop(self):
+        """
+        Stop dispatching and let in-flight posts finish. Pending jobs stay in the
+        table for the next start().
+        """
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await asyncio.gather(*self._inflight, return_exceptions=True)
+
+    def _recover(self):
+        """
+        Return abandoned claims to pending: jobs other schedulers claimed more than
+        the lease ago (or before claims were timed). Claims of live processes, and
+        this scheduler's own, are left alone.
+        """
+        now = time.time()
+        self._next_recover_at = now + self.claim_lease_seconds
+        with self._lock:
+            cursor = self.conn.execute('''
+                UPDATE scheduled_comments SET status = ?, needs_check = 1, claimed_by = NULL, claimed_at = NULL
+                WHERE status = ? AND (claimed_by IS NULL OR claimed_by != ?)
+                    AND (claimed_at IS NULL OR claimed_at < ?)
+            ''', (PENDING, POSTING, self.owner, now - self.claim_lease_seconds))
+            self.conn.commit()
+        if cursor.rowcount:
+            print(f"Recovered {cursor.rowcount} scheduled comment(s) interrupted while posting.")
+
+    def comments_for_post(self, post_id):
+        """Text of every comment scheduled for the post, whether pending, being posted or posted."""
+        with self._lock:
+            rows = self.conn.execute('''
+                SELECT comment FROM scheduled_comments WHERE post_id = ?
+            ''', (post_id,)).fetchall()
+        return [row[0] for row in rows]
+
+    def pending_count(self, job_ids=None):
+        """Jobs pending or being posted: all of them, or those among `job_ids`."""
+        query = "SELECT COUNT(*) FROM scheduled_comments WHERE status IN (?, ?)"
+        params = [PENDING, POSTING]
+        if job_ids is not None:
+            query += f" AND id IN ({', '.join('?' * len(job_ids))})"
+            params.extend(job_ids)
+        with self._lock:
+            return self.conn.execute(query, params).fetchone()[0]
+
+    async def wait_idle(self):
+        """Wait until no comment is pending or being posted."""
+        while True:
+            self._job_done.clear()
+            if not self.pending_count() and not self._inflight:
+                return
+            await self._job_done.wait()
+
+    async def wait_for(self, job_ids):
+        """
+        Wait until the given jobs have been posted (or have failed). Other jobs in
+        the table, including ones due much later, are not waited on.
+        """
+        job_ids = [job_id for job_id in job_ids if job_id is not None]
+        while job_ids:
+            self._job_done.clear()
+            if not self.pending_count(job_ids):
+                return
+            await self._job_done.wait()
+
+    def _next_due_at(self):
+        with self._lock:
+            row = self.conn.execute('''
+                SELECT due_at FROM scheduled_comments WHERE status = ? ORDER BY due_at LIMIT 1
+            ''', (PENDING,)).fetchone()
+        return row[0] if row else None
+
+    def _claim_due(self, limit):
+        """Atomically move up to `limit` due jobs from pending to posting and return them."""
+        now = time.time()
+        claimed = []
+        with self._lock:
+            rows = self.conn.execute('''
+                SELECT * FROM scheduled_comments WHERE status = ? AND due_at <= ? ORDER BY due_at LIMIT ?
+            ''', (PENDING, now, limit)).fetchall()
+            for row in rows:
+                cursor = self.conn.execute('''
+                    UPDATE scheduled_comments SET status = ?, attempts = attempts + 1, claimed_by = ?, claimed_at = ?
+                    WHERE id = ? AND status = ?
+                ''', (POSTING, self.owner, now, row["id"], PENDING))
+                if cursor.rowcount == 1:  # another process may have claimed it first
+                    job = dict(row)
+                    job["attempts"] += 1
+                    job["payload"] = json.loads(job["payload"] or "{}")
+                    claimed.append(job)
+            self.conn.commit()
+        return claimed
+
+    async def _dispatch_loop(self):
+        while True:
+            self._wakeup.clear()
+            if time.time() >= self._next_recover_at:
+                # Claims of processes that died while this one runs expire as well
+                self._recover()
+            capacity = self.max_concurrency - len(self._inflight)
+            if capacity > 0:
+                for job in self._claim_due(capacity):
+                    task = asyncio.create_task(self._run(job))
+                    self._inflight.add(task)
+                    task.add_done_callback(self._inflight.discard)
+
+            timeout = None
+            if len(self._inflight) < self.max_concurrency:
+                next_due_at = self._next_due_at()
+                if next_due_at is not None:
+                    timeout = max(0.0, next_due_at - time.time())
+            recover_in = max(0.0, self._next_recover_at - time.time())
+            timeout = recover_in if timeout is None else min(timeout, recover_in)
+            # Sleep until the earliest job is due, a job is added, or a slot frees up. asyncio.wait,
+            # unlike wait_for, never swallows stop()'s cancellation when the wakeup fires at the same time.
+            waiter = asyncio.ensure_future(self._wakeup.wait())
+            try:
+                await asyncio.wait((waiter,), timeout=timeout)
+            finally:
+                waiter.cancel()
+
+    def update_comment(self, job_id, comment, payload):
+        """
+        Replace a claimed job's text and payload (e.g. a regenerated draft) before it
+        is posted, so a recovery check looks for the text that was actually sent.
+        """
+        with self._lock:
+            self.conn.execute('''
+                UPDATE scheduled_comments SET comment = ?, payload = ? WHERE id = ?
+            ''', (comment, json.dumps(payload), job_id))
+            self.conn.commit()
+
+    def _finish(self, job_id, status, error=None):
+        with self._lock:
+            self.conn.execute('''
+                UPDATE scheduled_comments SET status = ?, last_error = ?, posted_at = ? WHERE id = ?
+            ''', (status, error, time.time() if status == POSTED else None, job_id))
+            self.conn.commit()
+
+    def _retry_later(self, job, error):
+        delay = self.retry_seconds * 2 ** (job["attempts"] - 1)
+        with self._lock:
+            # The failed attempt may still have reached Instagram, so check before re-posting
+            self.conn.execute('''
+                UPDATE scheduled_comments SET status = ?, due_at = ?, needs_check = 1, last_error = ? WHERE id = ?
+            ''', (PENDING, time.time() + delay, error, job["id"]))
+            self.conn.commit()
+        print(f"Retrying comment for {job['persona']} on post {job['post_id']} in {delay:.0f}s: {error}")
+
+    async def _run(self, job):
+        try:
+            if job["needs_check"] and self.confirm_fn is not None and await self.confirm_fn(job):
+                print(f"Comment for {job['persona']} on post {job['post_id']} was already posted.")
+                self._finish(job["id"], POSTED)
+                return
+            response = await self.post_fn(job)
+            if response is None:
+                self._finish(job["id"], FAILED, "nothing was posted")
+            else:
+                self._finish(job["id"], POSTED)
+        except asyncio.CancelledError:
+            raise  # left in "posting"; recovered (and checked) on the next start
+        except Exception as e:
+            if job["attempts"] >= self.max_attempts:
+                print(f"Giving up on comment for {job['persona']} on post {job['post_id']}: {e}")
+                self._finish(job["id"], FAILED, str(e))
+            else:
+                self._retry_later(job, str(e))
+        finally:
+            self._inflight.discard(asyncio.current_task())
+            self._job_done.set()
+            self._wakeup.set()
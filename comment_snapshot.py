@@ -0,0 +1,142 @@
+"""
+Per-Post Comment Snapshot
+
+One shared, lazily-loaded view of a post's comment thread. The first persona
+task to ask for the comments fetches every page once; the others wait for that
+fetch and reuse it. Before a delayed comment is posted, refresh() pulls only the
+comments added since the last fetch, so later personas see earlier personas'
+comments without re-downloading the whole thread.
+
+is_material_change() decides whether the comments added since a draft was
+generated are reason enough to regenerate it before posting; comments the
+pipeline posted itself (other personas) are left out with exclude_own().
+"""
+
+import asyncio
+import re
+from config import DRAFT_REFRESH_MIN_NEW_COMMENTS, DRAFT_SIMILARITY_THRESHOLD
+
+
+def _is_newest_first(comments):
+    """
+    Infer the API's page ordering from the first full fetch. Returns None when
+    there are too few distinct timestamps to tell.
+    """
+    timestamps = [c.get("timestamp") for c in comments if c.get("timestamp")]
+    if len(timestamps) < 2 or timestamps[0] == timestamps[-1]:
+        return None
+    return timestamps[0] > timestamps[-1]
+
+
+def _words(text):
+    return set(re.findall(r"\w+", (text or "").lower()))
+
+
+def similarity(a, b):
+    """Jaccard similarity of the two texts' word sets."""
+    words_a, words_b = _words(a), _words(b)
+    if not words_a or not words_b:
+        return 0.0
+    return len(words_a & words_b) / len(words_a | words_b)
+
+
+def exclude_own(comments, own_texts=(), own_usernames=()):
+    """
+    `comments` without those the pipeline posted itself: the texts of this post's
+    scheduled comments, or anything from one of the personas' usernames.
+    """
+    own_texts, own_usernames = set(own_texts), set(own_usernames)
+    return [c for c in comments if c.get("text") not in own_texts and c.get("username") not in own_usernames]
+
+
+def is_material_change(draft, new_comments, min_new=DRAFT_REFRESH_MIN_NEW_COMMENTS,
+                       similarity_threshold=DRAFT_SIMILARITY_THRESHOLD):
+    """
+    True when the thread moved on enough that `draft` should be rewritten: at least
+    `min_new` comments arrived since it was generated, or one of them already says
+    much the same thing (posting the draft would look like an echo).
+    """
+    if len(new_comments) >= min_new:
+        return True
+    return any(similarity(draft, comment.get("text")) >= similarity_threshold for comment in new_comments)
+
+
+class CommentSnapshot:
+    def __init__(self, insta_api, post_id):
+        self.insta_api = insta_api
+        self.post_id = post_id
+        self.comments = []          # oldest first
+        self.last_timestamp = None  # timestamp of the newest comment seen
+        self._ids = set()
+        self._tail_cursor = None    # `after` cursor of the last page (resume point for oldest-first ordering)
+        self._newest_first = None
+        self._loaded = False
+        self._lock = asyncio.Lock()
+
+    def _merge(self, comments):
+        fresh = [c for c in comments if c.get("id") not in self._ids]
+        self._ids.update(c.get("id") for c in fresh)
+        self.comments.extend(fresh)
+        self.comments.sort(key=lambda c: c.get("timestamp") or "")
+        if self.comments:
+            self.last_timestamp = self.comments[-1].get("timestamp")
+        return fresh
+
+    async def _load(self):
+        comments, after, has_next = await self.insta_api.get_comments_page(self.post_id)
+        while has_next:
+            page, cursor, has_next = await self.insta_api.get_comments_page(self.post_id, after=after)
+            comments.extend(page)
+            after = cursor or after
+        self._tail_cursor = after
+        self._newest_first = _is_newest_first(comments)
+        self._merge(comments)
+        self._loaded = True
+
+    async def get(self):
+        """All comments on the post (oldest first), fetched once and shared."""
+        if not self._loaded:
+            async with self._lock:
+                if not self._loaded:
+                    await self._load()
+        return list(self.comments)
+
+    async def history(self):
+        """Comment history formatted for the prompt, e.g. "username: text"."""
+        return [f"{comment['username']}: {comment['text']}" for comment in await self.get()]
+
+    def comments_since(self, timestamp):
+        """Known comments newer than `timestamp` (all of them if it is None)."""
+        return [c for c in self.comments if timestamp is None or (c.get("timestamp") or "") > timestamp]
+
+    async def refresh(self):
+        """
+        Fetch only comments added since the last fetch and return them.
+
+        With newest-first pages, reading stops at the first page that overlaps what
+        is already known; with oldest-first pages, reading resumes from the cursor
+        where the previous fetch ended.
+        """
+        if not self._loaded:
+            await self.get()
+            return []
+
+        async with self._lock:
+            new_comments = []
+            if self._newest_first is False:
+                after, has_next = self._tail_cursor, True
+                while has_next:
+                    page, cursor, has_next = await self.insta_api.get_comments_page(self.post_id, after=after)
+                    new_comments.extend(page)
+                    after = cursor or after
+                self._tail_cursor = after
+            else:
+                after = None
+                while True:
+                    page, cursor, has_next = await self.insta_api.get_comments_page(self.post_id, after=after)
+                    fresh = [c for c in page if c.get("id") not in self._ids]
+                    new_comments.extend(fresh)
+                    if len(fresh) < len(page) or not has_next:
+                        break
+                    after = cursor
+            return self._merge(new_comments)
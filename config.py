@@ -8,8 +8,11 @@ throughout the codebase.
 
 Key Features:
 - Centralizes configuration management for the application.
-- Validates required environment variables at startup.
+- Validates required environment variables per subsystem (Graph API, instagrapi,
+  GCS, OpenAI), when that subsystem's client is first built, so tools that only
+  use part of the pipeline load without every credential.
 - Provides type-safe access to configuration values.
+- Reads the base prompt file on first use rather than at import.
 - Maintains consistent API versions across the application.
 - Offers default values for optional configurations.
 
@@ -20,6 +23,7 @@ Usage Example:
     api_url = f"https://graph.facebook.com/{GRAPH_API_VERSION}"
 """
 
+import functools
 import os
 from dotenv import load_dotenv
 
@@ -53,28 +57,124 @@ AUNT_IG_PASSWORD = os.getenv("AUNT_IG_PASSWORD")
 # OpenAI API
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o")
+# OpenAI-compatible endpoint, e.g. a local stub server for benchmarks (unset: api.openai.com)
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL")
+# Account limits for OPENAI_MODEL, enforced client-side across all concurrent generations
+OPENAI_RPM_LIMIT = int(os.getenv("OPENAI_RPM_LIMIT", "500"))
+OPENAI_TPM_LIMIT = int(os.getenv("OPENAI_TPM_LIMIT", "30000"))
+OPENAI_REQUEST_TIMEOUT = float(os.getenv("OPENAI_REQUEST_TIMEOUT", "60"))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "5"))
+OPENAI_BACKOFF_BASE_SECONDS = float(os.getenv("OPENAI_BACKOFF_BASE_SECONDS", "1"))
+OPENAI_BACKOFF_MAX_SECONDS = float(os.getenv("OPENAI_BACKOFF_MAX_SECONDS", "30"))
+# Generate all personas' comments for a post in a single structured-output request
+MULTI_PERSONA_GENERATION = os.getenv("MULTI_PERSONA_GENERATION", "false").lower() in ("1", "true", "yes")
+# Stream completions and stop once a comment overruns the persona's "Length of Comments" budget
+GENERATION_STREAMING = os.getenv("GENERATION_STREAMING", "true").lower() in ("1", "true", "yes")
+# Reuse completed generations for identical requests; in replay mode only cached responses are used
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+RESPONSE_CACHE_TTL_SECONDS = int(os.getenv("RESPONSE_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "10000"))
+OPENAI_REPLAY = os.getenv("OPENAI_REPLAY", "false").lower() in ("1", "true", "yes")
+# Prompt images are downscaled for this detail level (low | high | auto) and inlined as data URLs
+OPENAI_IMAGE_DETAIL = os.getenv("OPENAI_IMAGE_DETAIL", "high")
+IMAGE_FORMAT = os.getenv("IMAGE_FORMAT", "JPEG")  # JPEG or WEBP
+IMAGE_QUALITY = int(os.getenv("IMAGE_QUALITY", "85"))
+# Video media contributes up to VIDEO_MAX_FRAMES keyframes (needs the optional `av` package);
+# VIDEO_SAMPLING is "scene" (one frame per shot change) or "uniform"
+VIDEO_MAX_FRAMES = int(os.getenv("VIDEO_MAX_FRAMES", "4"))
+VIDEO_SAMPLING = os.getenv("VIDEO_SAMPLING", "scene")
+VIDEO_SCENE_THRESHOLD = float(os.getenv("VIDEO_SCENE_THRESHOLD", "0.12"))
+# Media larger than this is left out of the prompt instead of being downloaded in full
+MEDIA_MAX_DOWNLOAD_BYTES = int(os.getenv("MEDIA_MAX_DOWNLOAD_BYTES", str(256 * 1024 * 1024)))
+
+# Graph API HTTP transport (connection pool shared by every AsyncInstagramAPI call)
+GRAPH_HTTP_MAX_CONNECTIONS = int(os.getenv("GRAPH_HTTP_MAX_CONNECTIONS", "20"))
+GRAPH_HTTP_MAX_CONNECTIONS_PER_HOST = int(os.getenv("GRAPH_HTTP_MAX_CONNECTIONS_PER_HOST", "10"))
+GRAPH_HTTP_TIMEOUT = float(os.getenv("GRAPH_HTTP_TIMEOUT", "30"))
 
 # Google Cloud
 GCS_BUCKET_NAME = os.getenv("GCS_BUCKET_NAME")
 GCP_CREDENTIALS_PATH = os.getenv("GCP_CREDENTIALS_PATH")
+# Points the storage client at a GCS emulator (e.g. http://127.0.0.1:9023) with anonymous credentials
+STORAGE_EMULATOR_HOST = os.getenv("STORAGE_EMULATOR_HOST")
+
+# Media mirror (Instagram CDN -> GCS)
+MEDIA_MIRROR_WORKERS = int(os.getenv("MEDIA_MIRROR_WORKERS", "4"))
+MEDIA_DOWNLOAD_CHUNK_SIZE = int(os.getenv("MEDIA_DOWNLOAD_CHUNK_SIZE", str(1024 * 1024)))
+# GCS resumable upload chunk size; must be a multiple of 256 KiB
+MEDIA_UPLOAD_CHUNK_SIZE = int(os.getenv("MEDIA_UPLOAD_CHUNK_SIZE", str(8 * 1024 * 1024)))
 
-# Base Prompt
-with open(os.getenv('BASE_PROMPT_FILE'), 'r') as f:
-    BASE_PROMPT = f.read()
+# Base Prompt (read on first use, see base_prompt())
+BASE_PROMPT_FILE = os.getenv("BASE_PROMPT_FILE")
 
 # File paths
 PERSONA_FILE = "personas.json"
 COMMENT_LOG_FILE = "comments.db"
+RESPONSE_CACHE_FILE = "response_cache.db"
+PAGE_CACHE_FILE = "page_cache.json"
+MEDIA_INDEX_FILE = "media_index.json"
+INSTAGRAPI_SESSION_DIR = "instagrapi_sessions"
+IMAGE_CACHE_DIR = "image_cache"
+
+# How often (seconds) the shared TokenStore checks tokens.json for outside edits
+TOKEN_FILE_CHECK_INTERVAL = float(os.getenv("TOKEN_FILE_CHECK_INTERVAL", "5"))
+# Tokens are treated as expired (and refreshed) this long before they actually expire
+TOKEN_REFRESH_MARGIN_SECONDS = int(os.getenv("TOKEN_REFRESH_MARGIN_SECONDS", str(24 * 3600)))
+# Proactive refresh: renew tokens this long before expiry (must exceed the margin above),
+# spread by up to TOKEN_REFRESH_JITTER_SECONDS
+TOKEN_REFRESH_LEAD_SECONDS = int(os.getenv("TOKEN_REFRESH_LEAD_SECONDS", str(3 * 24 * 3600)))
+TOKEN_REFRESH_JITTER_SECONDS = int(os.getenv("TOKEN_REFRESH_JITTER_SECONDS", str(6 * 3600)))
+TOKEN_REFRESH_RETRY_SECONDS = int(os.getenv("TOKEN_REFRESH_RETRY_SECONDS", "300"))
+TOKEN_REFRESH_RESCAN_SECONDS = int(os.getenv("TOKEN_REFRESH_RESCAN_SECONDS", "600"))
+
+# Prompt includes the most recent comments on the post. A scheduled draft is regenerated
+# before posting if this many comments arrived since, or one closely echoes it.
+COMMENT_HISTORY_LIMIT = int(os.getenv("COMMENT_HISTORY_LIMIT", "20"))
+DRAFT_REFRESH_MIN_NEW_COMMENTS = int(os.getenv("DRAFT_REFRESH_MIN_NEW_COMMENTS", "3"))
+DRAFT_SIMILARITY_THRESHOLD = float(os.getenv("DRAFT_SIMILARITY_THRESHOLD", "0.5"))
+
+# Comment log write-behind: rows are committed in groups of up to this many, gathered for
+# at most COMMENT_LOG_FLUSH_INTERVAL seconds
+COMMENT_LOG_BATCH_SIZE = int(os.getenv("COMMENT_LOG_BATCH_SIZE", "100"))
+COMMENT_LOG_FLUSH_INTERVAL = float(os.getenv("COMMENT_LOG_FLUSH_INTERVAL", "0.5"))
+
+# Per-stage timings, token counts and errors recorded in comments.db (see telemetry.py)
+TELEMETRY_ENABLED = os.getenv("TELEMETRY_ENABLED", "true").lower() in ("1", "true", "yes")
+
+# Tracing spans (see tracing.py): exported as JSON lines to TRACE_FILE ("jsonl") or as
+# OTLP/HTTP JSON to TRACE_OTLP_ENDPOINT ("otlp")
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "false").lower() in ("1", "true", "yes")
+TRACE_EXPORTER = os.getenv("TRACE_EXPORTER", "jsonl")
+TRACE_FILE = os.getenv("TRACE_FILE", "traces.jsonl")
+TRACE_OTLP_ENDPOINT = os.getenv("TRACE_OTLP_ENDPOINT", "http://localhost:4318/v1/traces")
+TRACE_SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "conversational-agent-for-mindful-eating")
+TRACE_BATCH_SIZE = int(os.getenv("TRACE_BATCH_SIZE", "256"))
+TRACE_FLUSH_INTERVAL = float(os.getenv("TRACE_FLUSH_INTERVAL", "1"))
+
+# DEBUG also prints the full messages sent to the LLM and other bulky diagnostics
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+DEBUG_LOGGING = LOG_LEVEL == "DEBUG"
+
+# Durable comment scheduler: concurrent posts, and attempts (with exponential backoff) per comment
+SCHEDULER_MAX_CONCURRENCY = int(os.getenv("SCHEDULER_MAX_CONCURRENCY", "4"))
+SCHEDULER_MAX_ATTEMPTS = int(os.getenv("SCHEDULER_MAX_ATTEMPTS", "3"))
+SCHEDULER_RETRY_SECONDS = float(os.getenv("SCHEDULER_RETRY_SECONDS", "60"))
+# A job claimed for posting longer ago than this is assumed abandoned (its process died) and retried;
+# must exceed the longest post attempt, including a draft regeneration
+SCHEDULER_CLAIM_LEASE_SECONDS = float(os.getenv("SCHEDULER_CLAIM_LEASE_SECONDS", "900"))
+
+# How long a cached page -> Instagram account resolution stays valid
+PAGE_CACHE_TTL_SECONDS = int(os.getenv("PAGE_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
 
 # Constructed values
-GRAPH_API_BASE_URL = f"https://graph.facebook.com/{GRAPH_API_VERSION}"
+# GRAPH_API_BASE_URL can be overridden to point the clients at a local stub server.
+GRAPH_API_BASE_URL = os.getenv("GRAPH_API_BASE_URL", f"https://graph.facebook.com/{GRAPH_API_VERSION}")
 
 # Validation
-def validate_config():
-    required_vars = [
-        "INSTAGRAM_APP_ID",
-        "INSTAGRAM_APP_SECRET",
-        "PARTICIPANT_FB_PAGE_NAME",
+# Settings each subsystem needs, checked by validate_config() when its client is built
+REQUIRED_SETTINGS = {
+    "graph": ("INSTAGRAM_APP_ID", "INSTAGRAM_APP_SECRET", "PARTICIPANT_FB_PAGE_NAME"),
+    "instagrapi": (
         "PARTICIPANT_IG_USERNAME",
         "PARTICIPANT_IG_PASSWORD",
         "AUNT_IG_USERNAME",
@@ -89,14 +189,37 @@ def validate_config():
         # "FAN_IG_PASSWORD",
         # "VISITOR_IG_USERNAME",
         # "VISITOR_IG_PASSWORD",
-        "GCS_BUCKET_NAME",
-        "GCP_CREDENTIALS_PATH",
-        "OPENAI_API_KEY"
-    ]
-    
-    missing_vars = [var for var in required_vars if not os.getenv(var)]
+    ),
+    "gcs": ("GCS_BUCKET_NAME", "GCP_CREDENTIALS_PATH"),
+    "openai": ("OPENAI_API_KEY", "BASE_PROMPT_FILE"),
+}
+
+
+def validate_config(*subsystems):
+    """
+    Raise if a setting required by any of `subsystems` (keys of REQUIRED_SETTINGS;
+    all of them when none are given) is missing.
+    """
+    required_vars = [var for name in subsystems or REQUIRED_SETTINGS for var in REQUIRED_SETTINGS[name]]
+    if STORAGE_EMULATOR_HOST:
+        # The emulator is used with anonymous credentials
+        required_vars = [var for var in required_vars if var != "GCP_CREDENTIALS_PATH"]
+
+    missing_vars = [var for var in dict.fromkeys(required_vars) if not os.getenv(var)]
     if missing_vars:
         raise ValueError(f"Missing required environment variables: {', '.join(missing_vars)}")
 
-# Validate configuration on import
-validate_config()
+
+@functools.lru_cache(maxsize=None)
+def base_prompt():
+    """The contents of BASE_PROMPT_FILE, read once on first use."""
+    validate_config("openai")
+    with open(BASE_PROMPT_FILE, 'r') as f:
+        return f.read()
+
+
+def __getattr__(name):
+    # config.BASE_PROMPT keeps working, but only touches the file when accessed
+    if name == "BASE_PROMPT":
+        return base_prompt()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
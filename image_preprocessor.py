@@ -0,0 +1,282 @@
+"""
+Prompt Image Preprocessing
+
+Prepares post images for the multimodal prompt locally instead of handing the
+model public GCS URLs. Each image is downloaded straight from the Instagram
+CDN, downscaled to the resolution the model actually works at for the
+configured `detail` level, re-encoded (JPEG or WebP) and inlined as a base64
+data URL. The provider no longer fetches full-resolution images, and generation
+no longer waits for the GCS mirror to finish.
+
+Downloads are streamed in chunks into a temporary file (up to
+MEDIA_MAX_DOWNLOAD_BYTES), so memory stays bounded by the chunk size. Videos
+contribute a few keyframes (see video_keyframes), decoded from that file and
+encoded the same way.
+
+Encoded images and keyframes are cached on disk, keyed by the SHA-256 of the
+original bytes plus the encoding settings; source URLs are remembered as well,
+so media seen before costs neither a download nor a re-encode.
+"""
+
+import asyncio
+import base64
+import hashlib
+import io
+import json
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import requests
+from requests.adapters import HTTPAdapter
+from PIL import Image, ImageOps
+import video_keyframes
+from media_index import source_key
+from config import (
+    IMAGE_CACHE_DIR,
+    IMAGE_FORMAT,
+    IMAGE_QUALITY,
+    OPENAI_IMAGE_DETAIL,
+    MEDIA_MIRROR_WORKERS,
+    MEDIA_DOWNLOAD_CHUNK_SIZE,
+    MEDIA_MAX_DOWNLOAD_BYTES,
+    GRAPH_HTTP_TIMEOUT,
+    VIDEO_MAX_FRAMES,
+    VIDEO_SAMPLING,
+    VIDEO_SCENE_THRESHOLD
+)
+
+SOURCE_INDEX_FILE = "sources.json"
+MIME_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp"}
+
+
+def target_size(width, height, detail):
+    """
+    Largest size the model uses for an image at this detail level: 512px on the
+    long side for "low"; otherwise fit within 2048x2048 with the short side at
+    most 768px. Images are never upscaled.
+    """
+    if detail == "low":
+        scale = 512 / max(width, height)
+    else:
+        scale = min(2048 / max(width, height), 768 / min(width, height))
+    scale = min(1.0, scale)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def to_data_url(data, mime_type):
+    return f"data:{mime_type};base64,{base64.b64encode(data).decode('ascii')}"
+
+
+class ImagePreprocessor:
+    def __init__(self, cache_dir=IMAGE_CACHE_DIR, detail=OPENAI_IMAGE_DETAIL, image_format=IMAGE_FORMAT,
+                 quality=IMAGE_QUALITY, max_workers=MEDIA_MIRROR_WORKERS, timeout=GRAPH_HTTP_TIMEOUT,
+                 max_frames=VIDEO_MAX_FRAMES, sampling=VIDEO_SAMPLING, scene_threshold=VIDEO_SCENE_THRESHOLD,
+                 chunk_size=MEDIA_DOWNLOAD_CHUNK_SIZE, max_download_bytes=MEDIA_MAX_DOWNLOAD_BYTES):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.detail = detail
+        self.image_format = image_format.upper()
+        if self.image_format not in MIME_TYPES:
+            raise Exception(f"Unsupported IMAGE_FORMAT: {image_format} (use JPEG or WEBP)")
+        self.quality = quality
+        self.max_frames = max_frames
+        self.sampling = sampling
+        self.scene_threshold = scene_threshold
+        self.timeout = timeout
+        self.chunk_size = chunk_size
+        self.max_download_bytes = max_download_bytes
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="image-prep")
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._lock = threading.Lock()
+        self._sources = self._load_sources()
+
+    @property
+    def mime_type(self):
+        return MIME_TYPES[self.image_format]
+
+    def _load_sources(self):
+        try:
+            with open(self.cache_dir / SOURCE_INDEX_FILE) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _remember_source(self, source_url, content_hash):
+        with self._lock:
+            self._sources[source_key(source_url)] = content_hash
+            with open(self.cache_dir / SOURCE_INDEX_FILE, "w") as f:
+                json.dump(self._sources, f, indent=4)
+
+    def _cache_path(self, content_hash):
+        # The settings are part of the name, so changing them never serves stale encodings
+        variant = f"{self.detail}-q{self.quality}"
+        return self.cache_dir / f"{content_hash}.{variant}.{self.image_format.lower()}"
+
+    def _frames_path(self, content_hash, suffix):
+        # Like _cache_path, plus the sampling settings that decide which frames are kept
+        variant = f"{self.detail}-q{self.quality}-{self.sampling}{self.max_frames}-t{self.scene_threshold:g}"
+        return self.cache_dir / f"{content_hash}.{variant}.{suffix}"
+
+    def _manifest_path(self, content_hash):
+        return self._frames_path(content_hash, f"{self.image_format.lower()}.frames.json")
+
+    def encode_image(self, image):
+        """Downscale and re-encode one PIL image; returns the encoded bytes."""
+        size = target_size(image.width, image.height, self.detail)
+        if size != image.size:
+            image = image.resize(size, Image.LANCZOS)
+        if self.image_format == "JPEG" and image.mode != "RGB":
+            if image.mode in ("RGBA", "LA", "P"):
+                image = image.convert("RGBA")
+                background = Image.new("RGB", image.size, (255, 255, 255))
+                background.paste(image, mask=image.getchannel("A"))
+                image = background
+            else:
+                image = image.convert("RGB")
+        output = io.BytesIO()
+        image.save(output, format=self.image_format, quality=self.quality, optimize=True)
+        return output.getvalue()
+
+    def encode(self, image_file):
+        """Downscale and re-encode one image file (a path or a binary file object)."""
+        with Image.open(image_file) as image:
+            # Bake in the camera rotation before resizing
+            return self.encode_image(ImageOps.exif_transpose(image))
+
+    @staticmethod
+    def _write_atomic(path, data):
+        tmp_path = path.with_suffix(".tmp")
+        tmp_path.write_bytes(data)
+        tmp_path.replace(path)
+
+    def prepare_image(self, image_file, content_hash, source_url=None):
+        """
+        Data URL of the preprocessed image in `image_file`, whose original bytes hash
+        to `content_hash`, encoding it only if it is not cached yet.
+        """
+        cache_path = self._cache_path(content_hash)
+        if cache_path.exists():
+            encoded = cache_path.read_bytes()
+        else:
+            encoded = self.encode(image_file)
+            self._write_atomic(cache_path, encoded)
+        if source_url:
+            self._remember_source(source_url, content_hash)
+        return to_data_url(encoded, self.mime_type)
+
+    def _frame_paths(self, content_hash):
+        """Cached keyframes of a video, or None if it has not been sampled yet."""
+        manifest = self._manifest_path(content_hash)
+        if not manifest.exists():
+            return None
+        with open(manifest) as f:
+            return [self.cache_dir / name for name in json.load(f)]
+
+    def prepare_video(self, video_path, content_hash, source_url=None):
+        """
+        Data URLs of keyframes sampled from the video at `video_path`, extracting and
+        encoding them only if this video has not been sampled before.
+        """
+        frame_paths = self._frame_paths(content_hash)
+        if frame_paths is None:
+            frames = video_keyframes.extract_keyframes(
+                video_path, max_frames=self.max_frames, mode=self.sampling, threshold=self.scene_threshold,
+                size_for=lambda width, height: target_size(width, height, self.detail)
+            )
+            frame_paths = []
+            for i, frame in enumerate(frames):
+                frame_path = self._frames_path(content_hash, f"f{i}.{self.image_format.lower()}")
+                self._write_atomic(frame_path, self.encode_image(frame))
+                frame_paths.append(frame_path)
+            # Written last, so a half-sampled video is simply sampled again
+            manifest = self._manifest_path(content_hash)
+            self._write_atomic(manifest, json.dumps([path.name for path in frame_paths]).encode())
+        if source_url:
+            self._remember_source(source_url, content_hash)
+        return [to_data_url(path.read_bytes(), self.mime_type) for path in frame_paths]
+
+    def _cached(self, media_url):
+        content_hash = self._sources.get(source_key(media_url))
+        if not content_hash:
+            return None
+        cache_path = self._cache_path(content_hash)
+        if cache_path.exists():
+            return [to_data_url(cache_path.read_bytes(), self.mime_type)]
+        frame_paths = self._frame_paths(content_hash)
+        if frame_paths is not None:
+            return [to_data_url(path.read_bytes(), self.mime_type) for path in frame_paths]
+        return None
+
+    def _download(self, response, media_file):
+        """
+        Stream the response body into `media_file` chunk by chunk and return the
+        SHA-256 of its bytes. Media larger than `max_download_bytes` is rejected.
+        """
+        content_length = response.headers.get("Content-Length")
+        if content_length and int(content_length) > self.max_download_bytes:
+            raise Exception(f"Media is larger than {self.max_download_bytes} bytes ({content_length})")
+        digest = hashlib.sha256()
+        size = 0
+        for chunk in response.iter_content(chunk_size=self.chunk_size):
+            size += len(chunk)
+            if size > self.max_download_bytes:
+                raise Exception(f"Media is larger than {self.max_download_bytes} bytes")
+            digest.update(chunk)
+            media_file.write(chunk)
+        media_file.flush()
+        media_file.seek(0)
+        return digest.hexdigest()
+
+    def prepare_one(self, media_url):
+        """
+        Data URLs for the media at `media_url`: one for an image, a few keyframes for
+        a video, none for anything else. Runs on a worker thread.
+        """
+        cached = self._cached(media_url)
+        if cached is not None:
+            return cached
+
+        with self.session.get(media_url, stream=True, timeout=self.timeout) as response:
+            if response.status_code != 200:
+                raise Exception(f"Error downloading media: {response.text}")
+            content_type = response.headers.get("Content-Type", "")
+            is_video = content_type.startswith("video/")
+            if not is_video and not content_type.startswith("image/"):
+                return []
+            if is_video and not video_keyframes.available():
+                print(f"Skipping video {media_url}: PyAV is not installed.")
+                return []
+            # Deleted on close; videos are decoded from the file by path, without Python-level reads
+            with tempfile.NamedTemporaryFile(dir=self.cache_dir, suffix=".download") as media_file:
+                content_hash = self._download(response, media_file)
+                if is_video:
+                    return self.prepare_video(media_file.name, content_hash, source_url=media_url)
+                return [self.prepare_image(media_file, content_hash, source_url=media_url)]
+
+    async def prepare(self, media_urls):
+        """
+        Prepare every URL concurrently and return the data URLs of the images (and
+        video keyframes) that succeeded, in the original order.
+        """
+        loop = asyncio.get_running_loop()
+        results = await asyncio.gather(
+            *(loop.run_in_executor(self.executor, self.prepare_one, url) for url in media_urls),
+            return_exceptions=True
+        )
+
+        prompt_images = []
+        for media_url, result in zip(media_urls, results):
+            if isinstance(result, Exception):
+                print(f"Error preparing media from {media_url}: {result}")
+                continue
+            prompt_images.extend(result)
+        return prompt_images
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+        self.session.close()
@@ -1,184 +1,393 @@
-import requests
-from config import GRAPH_API_VERSION
+import asyncio
+import json
+from urllib.parse import urlparse
 
-class InstagramAPI:
-    def __init__(self, access_token):
-        self.ig_business_access_token = access_token
+import httpx
+from page_cache import PageAccountCache
+from tracing import traced
+from config import (
+    GRAPH_API_VERSION,
+    GRAPH_API_BASE_URL,
+    GRAPH_HTTP_MAX_CONNECTIONS,
+    GRAPH_HTTP_MAX_CONNECTIONS_PER_HOST,
+    GRAPH_HTTP_TIMEOUT,
+    DEBUG_LOGGING
+)
+
+MEDIA_DETAIL_FIELDS = "id,media_type,media_url,timestamp"
+# Field expansion returns each carousel child's media URL inline with the post,
+# so resolving a carousel needs no extra round trip per child.
+CAROUSEL_CHILD_FIELDS = "id,media_type,media_url"
+RECENT_POST_FIELDS = f"id,caption,media_type,media_url,timestamp,permalink,children{{{CAROUSEL_CHILD_FIELDS}}}"
+COMMENT_FIELDS = "id,text,username,timestamp"
+COMMENTS_PAGE_SIZE = 50
+
+
+# Graph API error codes meaning the access token is invalid, expired or revoked
+AUTH_ERROR_CODES = {102, 190}
+
+
+class GraphAPIError(Exception):
+    """
+    A non-200 Graph API response. Carries the HTTP status and the Graph error code
+    so callers can tell auth failures apart from other errors.
+    """
+    def __init__(self, message, status_code=None, error_code=None, error_type=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.error_code = error_code
+        self.error_type = error_type
+
+    @property
+    def is_auth_error(self):
+        return (
+            self.status_code == 401
+            or self.error_code in AUTH_ERROR_CODES
+            or self.error_type == "OAuthException"
+        )
+
+
+def _check_response(response, error_message):
+    """
+    Raise GraphAPIError if a Graph API response is not a 200.
+    """
+    if response.status_code != 200:
+        try:
+            error = response.json().get("error", {})
+        except Exception:
+            error = {}
+        raise GraphAPIError(
+            f"{error_message}: {response.text}",
+            status_code=response.status_code,
+            error_code=error.get("code"),
+            error_type=error.get("type")
+        )
+
+
+def _find_page(pages, page_name):
+    for page in pages:
+        if page["name"].lower() == page_name.lower():
+            return page
+    raise Exception(f"Page with name '{page_name}' not found")
+
+
+def _parse_media_urls(post):
+    """
+    Split a post into its media URLs (in display order) and the carousel children
+    whose URL was not expanded inline. Unresolved slots in `media_urls` are None;
+    `pending` lists (slot index, child id) pairs still needing a lookup.
+    """
+    media_urls = []
+    pending = []
+    media_type = post.get("media_type")
+    if media_type == "CAROUSEL_ALBUM":
+        children = post.get("children", {})
+        # Instagram may return children as { "data": [...] }
+        children_data = children.get("data", []) if isinstance(children, dict) else children
+        if DEBUG_LOGGING:
+            print(children_data)
+        for child in children_data:
+            if child.get("media_url"):
+                media_urls.append(child["media_url"])
+            elif child.get("id"):
+                pending.append((len(media_urls), child["id"]))
+                media_urls.append(None)
+    else:
+        url = post.get("media_url")
+        if url:
+            media_urls.append(url)
+    return media_urls, pending
+
+
+def _parse_comments_page(data):
+    """
+    Split a comments edge response into (comments, after_cursor, has_next). The
+    `after` cursor is kept even on the last page so a later call can resume there.
+    """
+    paging = data.get("paging", {})
+    after = paging.get("cursors", {}).get("after")
+    return data.get("data", []), after, bool(paging.get("next"))
+
+
+def _batch_media_request(child_ids):
+    """
+    Body of a Graph API batch request fetching the media URL of every child in one round trip.
+    """
+    return json.dumps([
+        {"method": "GET", "relative_url": f"{child_id}?fields={CAROUSEL_CHILD_FIELDS}"}
+        for child_id in child_ids
+    ])
+
+
+def _parse_batch_media_response(results, expected):
+    """
+    Extract media URLs from a batch response, in request order. Raises if any
+    sub-request failed so the caller can fall back to individual lookups.
+    """
+    if not isinstance(results, list) or len(results) != expected:
+        raise Exception("Unexpected batch response shape")
+    urls = []
+    for result in results:
+        if not result or result.get("code") != 200:
+            raise Exception(f"Batch sub-request failed: {result}")
+        urls.append(json.loads(result["body"]).get("media_url"))
+    return urls
+
+
+class AsyncInstagramAPI:
+    """
+    Graph API client; every method is a coroutine. All calls share one httpx
+    keep-alive connection pool;
+    `max_connections` caps the pool, `max_connections_per_host` caps concurrent
+    requests to any single host (Graph API or media CDN), and `timeout` applies
+    per request.
+
+    With `token_store` set, the business token is read from the store for each
+    request rather than fixed at construction.
+    """
+    def __init__(self, access_token, base_url=None, max_connections=GRAPH_HTTP_MAX_CONNECTIONS,
+                 max_connections_per_host=GRAPH_HTTP_MAX_CONNECTIONS_PER_HOST, timeout=GRAPH_HTTP_TIMEOUT,
+                 page_cache=None, token_store=None):
+        self._access_token = access_token
+        self.token_store = token_store
         self.api_version = GRAPH_API_VERSION
-        self.base_url = f"https://graph.facebook.com/{self.api_version}"
+        self.base_url = base_url or GRAPH_API_BASE_URL
+        self.page_cache = page_cache if page_cache is not None else PageAccountCache()
+        self.max_connections_per_host = max_connections_per_host
+        self.client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections
+            ),
+            timeout=httpx.Timeout(timeout),
+            follow_redirects=True
+        )
+        self._host_limits = {}
 
-    def get_user_pages(self):
+    @property
+    def ig_business_access_token(self):
+        """
+        The business token. With a `token_store` it is read from the store on every
+        request (an in-memory lookup), so tokens renewed by TokenRefreshScheduler are
+        picked up without rebuilding the client.
+        """
+        if self.token_store is not None:
+            return self.token_store.get_business_token() or self._access_token
+        return self._access_token
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    async def aclose(self):
+        await self.client.aclose()
+
+    def _host_limit(self, url):
+        host = urlparse(url).netloc
+        if host not in self._host_limits:
+            self._host_limits[host] = asyncio.Semaphore(self.max_connections_per_host)
+        return self._host_limits[host]
+
+    async def _get(self, url, params=None):
+        async with self._host_limit(url):
+            return await self.client.get(url, params=params)
+
+    async def _post(self, url, data=None):
+        async with self._host_limit(url):
+            return await self.client.post(url, data=data)
+
+    @traced("graph.get_user_pages")
+    async def get_user_pages(self):
         """
         Get all Facebook Pages that the current user has access to.
         """
-        url = f"{self.base_url}/me/accounts"
-        params = {
+        response = await self._get(f"{self.base_url}/me/accounts", {
             "access_token": self.ig_business_access_token,
             "fields": "id,name,access_token"
-        }
-        response = requests.get(url, params=params)
-        if response.status_code != 200:
-            raise Exception(f"Error getting pages: {response.text}")
-        
+        })
+        _check_response(response, "Error getting pages")
+
         data = response.json()
         if "data" not in data:
             raise Exception("No pages found for the current user")
-        
+
         return data["data"]
 
-    def get_page_by_name(self, page_name):
+    @traced("graph.get_page_by_name")
+    async def get_page_by_name(self, page_name):
         """
         Get a specific Facebook Page by its name.
         """
-        pages = self.get_user_pages()
-        for page in pages:
-            if page["name"].lower() == page_name.lower():
-                return page
-        raise Exception(f"Page with name '{page_name}' not found")
+        return _find_page(await self.get_user_pages(), page_name)
 
-    def get_connected_instagram_account(self, page_id, page_access_token):
+    @traced("graph.get_connected_instagram_account")
+    async def get_connected_instagram_account(self, page_id, page_access_token):
         """
         Get the Instagram Business Account connected to the given Facebook Page.
         """
-        url = f"{self.base_url}/{page_id}"
-        params = {
+        response = await self._get(f"{self.base_url}/{page_id}", {
             "fields": "connected_instagram_account",
             "access_token": page_access_token
-        }
-        response = requests.get(url, params=params)
-        if response.status_code != 200:
-            raise Exception(f"Error getting connected Instagram account: {response.text}")
-        
+        })
+        _check_response(response, "Error getting connected Instagram account")
+
         page_data = response.json()
         if "connected_instagram_account" not in page_data:
             raise Exception("No connected Instagram Business Account found for this Page")
-        
+
         return page_data["connected_instagram_account"]
 
-    def get_recent_post(self, page_name):
+    @traced("graph.get_recent_post")
+    async def get_recent_post(self, page_name):
         """
         Retrieve the most recent post from an Instagram Business account connected to the given Facebook Page.
-        Note: The API response might return posts in descending order.
-        Adjust index as necessary.
-        """
-        # Get the page and its access token
-        page = self.get_page_by_name(page_name)
-        page_id = page["id"]
-        page_access_token = page["access_token"]
-        
-        # Get the connected Instagram Business Account
-        ig_account = self.get_connected_instagram_account(page_id, page_access_token)
-        ig_account_id = ig_account["id"]
-        
-        # Get the most recent posts
-        url = f"{self.base_url}/{ig_account_id}/media"
+        """
+        return (await self.get_recent_posts(page_name, limit=1))[0]
+
+    @traced("graph.resolve_ig_account_id")
+    async def resolve_ig_account_id(self, page_name, use_cache=True):
+        """
+        Resolve a Facebook Page name to its connected Instagram Business Account ID,
+        using the page cache when a fresh entry exists.
+        """
+        if use_cache:
+            cached = self.page_cache.get(page_name)
+            if cached:
+                return cached["ig_account_id"]
+
+        page = await self.get_page_by_name(page_name)
+        ig_account = await self.get_connected_instagram_account(page["id"], page["access_token"])
+        self.page_cache.set(page_name, page["id"], ig_account["id"])
+        return ig_account["id"]
+
+    @traced("graph.get_recent_posts")
+    async def get_recent_posts(self, page_name, limit=1):
+        """
+        Retrieve up to `limit` most recent posts (newest first) from the Instagram Business
+        account connected to the given Facebook Page. Uses the cached page -> account
+        resolution, re-resolving once on an auth error.
+        """
         params = {
-            "fields": "id,caption,media_type,media_url,timestamp,permalink,children",  # include children if carousel
-            "limit": 1,
+            "fields": RECENT_POST_FIELDS,
+            "limit": limit,
             "access_token": self.ig_business_access_token
         }
-        response = requests.get(url, params=params)
-        if response.status_code != 200:
-            raise Exception(f"Error retrieving posts: {response.text}")
+        ig_account_id = await self.resolve_ig_account_id(page_name)
+        response = await self._get(f"{self.base_url}/{ig_account_id}/media", params)
+        try:
+            _check_response(response, "Error retrieving posts")
+        except GraphAPIError as e:
+            if not e.is_auth_error:
+                raise
+            self.page_cache.invalidate(page_name)
+            ig_account_id = await self.resolve_ig_account_id(page_name, use_cache=False)
+            response = await self._get(f"{self.base_url}/{ig_account_id}/media", params)
+            _check_response(response, "Error retrieving posts")
         data = response.json()
         if "data" in data and len(data["data"]) > 0:
-            # Adjust the index as needed. Here we pick the second most-recent post.
-            return data["data"][0]
+            return data["data"][:limit]
         else:
             raise Exception("No posts found for the specified account.")
-    
-    
-    def get_media_details(self, media_id):
+
+    @traced("graph.get_media_details")
+    async def get_media_details(self, media_id):
         """
         Retrieve full details of a media item using its media ID.
-        This is particularly useful for carousel items, which only include the ID in the children list.
         """
-        url = f"{self.base_url}/{media_id}"
-        params = {
-            "fields": "id,media_type,media_url,timestamp",
+        response = await self._get(f"{self.base_url}/{media_id}", {
+            "fields": MEDIA_DETAIL_FIELDS,
             "access_token": self.ig_business_access_token
-        }
-        response = requests.get(url, params=params)
-        if response.status_code != 200:
-            raise Exception(f"Error retrieving media details: {response.text}")
+        })
+        _check_response(response, "Error retrieving media details")
         return response.json()
 
-
-    def get_media_urls(self, post):
+    @traced("graph.get_media_urls")
+    async def get_media_urls(self, post):
         """
         Retrieve media URLs based on media type (carousel vs. single post).
+
+        Children without an expanded media_url are resolved with one batch request,
+        falling back to concurrent get_media_details calls.
         """
         media_urls = []
         try:
-            media_type = post.get("media_type")
-            if media_type == "CAROUSEL_ALBUM":
-                children = post.get("children", {})
-                # Instagram may return children as { "data": [...] }
-                children_data = children.get("data", []) if isinstance(children, dict) else children
-                print(children_data)
-                for child in children_data:
-                    child_id = child.get("id")
-                    if child_id:
-                        # Get the full child media details using the API.
-                        child_details = self.get_media_details(child_id)
-                        url = child_details.get("media_url")
-                        if url:
-                            media_urls.append(url)
-            else:
-                url = post.get("media_url")
-                if url:
-                    media_urls.append(url)
+            media_urls, pending = _parse_media_urls(post)
+            if pending:
+                child_ids = [child_id for _, child_id in pending]
+                try:
+                    resolved = await self.get_media_urls_batch(child_ids)
+                except Exception as e:
+                    print(f"Batch media lookup failed, resolving children individually: {e}")
+                    details = await asyncio.gather(*(self.get_media_details(child_id) for child_id in child_ids))
+                    resolved = [child.get("media_url") for child in details]
+                for (index, _), url in zip(pending, resolved):
+                    media_urls[index] = url
         except Exception as e:
             print(f"Error parsing media URLs from Graph API post: {e}")
-        
-        return media_urls
 
-    def get_comments(self, post_id):
+        return [url for url in media_urls if url]
+
+    @traced("graph.get_media_urls_batch")
+    async def get_media_urls_batch(self, child_ids):
         """
-        Retrieve existing comments for a given post.
+        Resolve the media URLs of several media items with one Graph API batch request.
+        """
+        response = await self._post(self.base_url, {
+            "batch": _batch_media_request(child_ids),
+            "include_headers": "false",
+            "access_token": self.ig_business_access_token
+        })
+        _check_response(response, "Error in batch media request")
+        return _parse_batch_media_response(response.json(), len(child_ids))
+
+    @traced("graph.get_comments_page")
+    async def get_comments_page(self, post_id, after=None, limit=COMMENTS_PAGE_SIZE):
+        """
+        Retrieve one page of comments for a given post.
+        Returns a tuple: (comments, after_cursor, has_next_page)
         """
-        url = f"{self.base_url}/{post_id}/comments"
         params = {
-            "fields": "id,text,username,timestamp",
+            "fields": COMMENT_FIELDS,
+            "limit": limit,
             "access_token": self.ig_business_access_token
         }
-        response = requests.get(url, params=params)
-        if response.status_code != 200:
-            raise Exception(f"Error retrieving comments: {response.text}")
-        data = response.json()
-        return data.get("data", [])
+        if after:
+            params["after"] = after
+        response = await self._get(f"{self.base_url}/{post_id}/comments", params)
+        _check_response(response, "Error retrieving comments")
+        return _parse_comments_page(response.json())
 
-    def post_comment(self, post_id, comment_text, persona_token):
+    @traced("graph.get_comments")
+    async def get_comments(self, post_id):
+        """
+        Retrieve all existing comments for a given post, following pagination.
+        """
+        comments, after, has_next = await self.get_comments_page(post_id)
+        while has_next:
+            page, after, has_next = await self.get_comments_page(post_id, after=after)
+            comments.extend(page)
+        return comments
+
+    @traced("graph.post_comment")
+    async def post_comment(self, post_id, comment_text, persona_token):
         """
         Post a comment to a given post using a persona's access token.
         """
-        # Verify the persona token is valid and has required permissions.
-        url = f"{self.base_url}/me"
-        params = {
-            "fields": "id,name",
-            "access_token": persona_token
-        }
-        response = requests.get(url, params=params)
-        if response.status_code != 200:
-            raise Exception(f"Invalid persona token or insufficient permissions: {response.text}")
-        
-        # Now post the comment
-        url = f"{self.base_url}/{post_id}/comments"
-        params = {
+        # An invalid or expired persona token surfaces as a GraphAPIError with is_auth_error set.
+        response = await self._post(f"{self.base_url}/{post_id}/comments", {
             "message": comment_text,
             "access_token": persona_token
-        }
-        response = requests.post(url, data=params)
-        if response.status_code != 200:
-            raise Exception(f"Error posting comment: {response.text}")
+        })
+        _check_response(response, "Error posting comment")
         return response.json()
 
-    def download_media(self, media_url):
+    @traced("graph.download_media")
+    async def download_media(self, media_url):
         """
         Download media content from a URL.
         """
-        response = requests.get(media_url)
-        if response.status_code != 200:
-            raise Exception(f"Error downloading media: {response.text}")
+        response = await self._get(media_url)
+        _check_response(response, "Error downloading media")
         return response.content
-
@@ -0,0 +1,135 @@
+"""
+Instagrapi Client Pool
+
+Keeps one logged-in instagrapi Client per persona for the life of the process
+and persists each client's session settings to disk, so later runs resume the
+session instead of performing a full login. The participant's user_id is cached
+(and persisted) so it is looked up at most once.
+
+With a post permalink, posting a comment costs a single media_comment call: the
+media pk is decoded locally from the permalink's shortcode.
+
+instagrapi itself is only imported when the first client is created, so runs
+that use the Graph API alone never load it.
+"""
+
+import json
+import os
+import threading
+from pathlib import Path
+
+from tracing import traced
+import config
+from config import INSTAGRAPI_SESSION_DIR
+
+USER_ID_CACHE_FILE = "user_ids.json"
+
+
+class InstagrapiClientPool:
+    def __init__(self, session_dir=INSTAGRAPI_SESSION_DIR):
+        self.session_dir = Path(session_dir)
+        self.session_dir.mkdir(parents=True, exist_ok=True)
+        self._clients = {}
+        self._locks = {}
+        self._pool_lock = threading.Lock()
+        self._user_ids = self._load_user_ids()
+
+    def _session_file(self, persona_name):
+        return self.session_dir / f"{persona_name}.json"
+
+    def _load_user_ids(self):
+        try:
+            with open(self.session_dir / USER_ID_CACHE_FILE) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _persona_lock(self, persona_name):
+        with self._pool_lock:
+            return self._locks.setdefault(persona_name, threading.Lock())
+
+    @staticmethod
+    def _credentials(persona_name):
+        ig_username = getattr(config, f"{persona_name.upper()}_IG_USERNAME", None)
+        ig_password = getattr(config, f"{persona_name.upper()}_IG_PASSWORD", None)
+        if not ig_username or not ig_password:
+            raise Exception(f"Missing credentials for persona: {persona_name}")
+        return ig_username, ig_password
+
+    def _save_session(self, persona_name, cl):
+        session_file = self._session_file(persona_name)
+        cl.dump_settings(session_file)
+        os.chmod(session_file, 0o600)  # session cookies are as sensitive as the password
+
+    def _login(self, persona_name, cl, fresh=False):
+        """
+        Log in, reusing saved session settings unless `fresh` is set. With a valid
+        saved session instagrapi does not hit the login endpoint.
+        """
+        ig_username, ig_password = self._credentials(persona_name)
+        session_file = self._session_file(persona_name)
+        if fresh:
+            # Keep the device identity but drop the expired session
+            old_settings = cl.get_settings()
+            cl.set_settings({})
+            cl.set_uuids(old_settings.get("uuids", {}))
+        elif session_file.exists():
+            cl.load_settings(session_file)
+        cl.login(ig_username, ig_password)
+        self._save_session(persona_name, cl)
+
+    def get_client(self, persona_name):
+        """Return the persona's logged-in client, creating (and logging in) on first use."""
+        with self._persona_lock(persona_name):
+            cl = self._clients.get(persona_name)
+            if cl is None:
+                config.validate_config("instagrapi")
+                from instagrapi import Client
+                cl = Client()
+                self._login(persona_name, cl)
+                self._clients[persona_name] = cl
+            return cl
+
+    def _call(self, persona_name, action):
+        """
+        Run `action(client)`, re-logging in once if the saved session has expired.
+        """
+        cl = self.get_client(persona_name)
+        from instagrapi.exceptions import LoginRequired  # already loaded by get_client
+        try:
+            return action(cl)
+        except LoginRequired:
+            print(f"Instagrapi session for {persona_name} expired, logging in again.")
+            with self._persona_lock(persona_name):
+                self._login(persona_name, cl, fresh=True)
+            return action(cl)
+
+    def participant_user_id(self, persona_name, username):
+        """The participant's user_id, looked up once and cached on disk."""
+        user_id = self._user_ids.get(username)
+        if user_id is None:
+            user_id = self._call(persona_name, lambda cl: cl.user_id_from_username(username))
+            with self._pool_lock:
+                self._user_ids[username] = user_id
+                with open(self.session_dir / USER_ID_CACHE_FILE, "w") as f:
+                    json.dump(self._user_ids, f, indent=4)
+        return user_id
+
+    @traced("instagrapi.resolve_media_pk")
+    def resolve_media_pk(self, persona_name, permalink=None, username=None):
+        """
+        Media pk of the post to comment on: decoded locally from the permalink when
+        available, otherwise the participant's latest post.
+        """
+        cl = self.get_client(persona_name)
+        if permalink:
+            return cl.media_pk_from_url(permalink)
+        user_id = self.participant_user_id(persona_name, username)
+        media = self._call(persona_name, lambda cl: cl.user_medias(user_id, 1))
+        if not media:
+            return None
+        return media[0].pk
+
+    @traced("instagrapi.post_comment")
+    def post_comment(self, persona_name, media_pk, comment_text):
+        return self._call(persona_name, lambda cl: cl.media_comment(media_pk, comment_text))
@@ -1,17 +1,27 @@
 import asyncio
-from pathlib import Path
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager, nullcontext
 
 # Unofficial Instagram API:
-from instagrapi import Client
-from instagrapi.exceptions import ClientError
+from instagrapi_pool import InstagrapiClientPool
 
 # Official Instagram Graph API-related modules and others
-from instagram_api import InstagramAPI
-from token_manager import TokenManager
+from instagram_api import AsyncInstagramAPI, GraphAPIError
+from token_manager import get_token_manager
+from token_refresh_scheduler import TokenRefreshScheduler
 from persona_manager import PersonaManager
 from media_uploader import MediaUploader
+from media_mirror import MediaMirror
+from image_preprocessor import ImagePreprocessor
 from comment_generator import CommentGenerator
 from comment_logger import CommentLogger
+from comment_snapshot import CommentSnapshot, exclude_own, is_material_change
+from comment_scheduler import CommentScheduler
+from pipeline_stats import PipelineStats
+from telemetry import Telemetry, annotate
+import tracing
+from tracing import span
 import config
 # from config import (
 #     GCS_BUCKET_NAME,
@@ -33,166 +43,439 @@ import config
 #     AUNT_IG_PASSWORD
 # )
 
-TEMP_MEDIA_DIR = Path("/tmp/instagrapi_downloads")
-TEMP_MEDIA_DIR.mkdir(parents=True, exist_ok=True)
+# Comment threads kept in memory for pre-post checks
+MAX_CACHED_SNAPSHOTS = 256
 
-async def download_and_upload_media(insta_api, uploader, media_urls):
+
+class PipelineClients:
     """
-    Download media from each URL and then upload them to cloud storage.
-    Wrapping synchronous operations in asyncio.to_thread to avoid blocking.
-    Returns a list of URLs for uploaded media.
+    Clients shared by every post processed in one run, so batch mode builds the
+    token, storage, LLM and Graph API clients once instead of once per post.
+
+    Also owns the comment scheduler, which posts every scheduled comment through
+    post_comment (with `stats` and `limiter` recording the "post" stage).
     """
-    uploaded_media_urls = []
-    for media_url in media_urls:
+    def __init__(self, stats=None, limiter=None):
+        self.stats = stats
+        self.limiter = limiter
+        # Fail fast on missing settings; instagrapi's are checked when its first client logs in
+        config.validate_config("graph", "gcs", "openai")
+        self.telemetry = Telemetry()
+        self.persona_manager = PersonaManager()
+        self.token_manager = get_token_manager()
+        business_token = self.token_manager.get_instagram_business_token()
+        if config.DEBUG_LOGGING:
+            print(f"Business Token: {business_token}")
+        # Renews the business and persona tokens ahead of expiry, off the request path
+        self.token_refresher = TokenRefreshScheduler(self.token_manager)
+
+        self.uploader = MediaUploader(bucket_name=getattr(config, "GCS_BUCKET_NAME"))
+        self.mirror = MediaMirror(self.uploader)
+        self.image_preprocessor = ImagePreprocessor()
+        self.comment_gen = CommentGenerator(base_prompt=config.base_prompt())
+        self.logger = CommentLogger()
+        # Reads the business token from the shared store, so the refresher's renewals take effect
+        self.insta_api = AsyncInstagramAPI(business_token, token_store=self.token_manager.token_store)
+        self.instagrapi_pool = InstagrapiClientPool()
+        # Comments from these accounts are the pipeline's own (see refresh_draft)
+        self.persona_usernames = {
+            getattr(config, f"{name.upper()}_IG_USERNAME", None) for name in self.persona_manager.get_all_personas()
+        } - {None}
+        self.scheduler = CommentScheduler(self.post_comment, self.comment_already_posted)
+        self._snapshots = OrderedDict()  # post_id -> CommentSnapshot, most recently used last
+
+    async def __aenter__(self):
+        self.token_refresher.start()
+        self.scheduler.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    async def aclose(self):
+        await self.scheduler.stop()
+        await self.insta_api.aclose()
+        await self.token_refresher.stop()
+        self.mirror.close()
+        self.image_preprocessor.close()
+        self.comment_gen.close()
+        self.logger.close()
+        self.telemetry.close()
+        tracing.flush()
+
+    def comment_snapshot(self, post_id):
+        """
+        The shared CommentSnapshot of a post, so the scheduler's pre-post checks reuse
+        what generation already fetched. Only the most recently used posts are kept.
+        """
+        snapshot = self._snapshots.pop(post_id, None) or CommentSnapshot(self.insta_api, post_id)
+        self._snapshots[post_id] = snapshot
+        while len(self._snapshots) > MAX_CACHED_SNAPSHOTS:
+            self._snapshots.popitem(last=False)
+        return snapshot
+
+    async def refresh_draft(self, job):
+        """
+        Late context check just before a scheduled comment goes out: pull only the
+        comments added since the draft was generated, and regenerate the draft only
+        if the thread changed materially. Otherwise the draft is posted as is.
+        """
+        draft, payload = job["comment"], job["payload"]
+        persona_name, post_id = job["persona"], job["post_id"]
+        if "seen_until" not in payload:
+            return draft
+        snapshot = self.comment_snapshot(post_id)
         try:
-            # Wrap the synchronous download in a separate thread
-            media_bytes = await asyncio.to_thread(insta_api.download_media, media_url)
+            await snapshot.refresh()
+            new_comments = snapshot.comments_since(payload["seen_until"])
         except Exception as e:
-            print(f"Error downloading media from {media_url}: {e}")
-            continue
+            print(f"Error refreshing comments via Graph API for post {post_id}: {e}")
+            return draft
+        # Sibling personas' comments from this pipeline are not a reason to rewrite the draft
+        new_comments = exclude_own(new_comments, self.scheduler.comments_for_post(post_id), self.persona_usernames)
+        if not is_material_change(draft, new_comments):
+            return draft
 
+        persona_data = self.persona_manager.get_persona(persona_name)
+        if not persona_data:
+            return draft
+        print(f"{len(new_comments)} new comment(s) on post {post_id} since {persona_name}'s draft; regenerating it.")
         try:
-            # Likewise, wrap the uploader call if it's synchronous
-            uploaded_url = await asyncio.to_thread(
-                uploader.upload_media_bytes,
-                media_bytes,
-                source_url=media_url  # enables MIME type detection
-            )
+            async with pipeline_stage("prepare", self.stats, self.limiter, self.telemetry, post_id=post_id):
+                prompt_images = await self.image_preprocessor.prepare(payload.get("media_urls", []))
+            comment_history = await snapshot.history()
+            async with pipeline_stage("generate", self.stats, self.limiter, self.telemetry,
+                                      post_id=post_id, persona=persona_name):
+                comment_text = await self.comment_gen.agenerate_comment(
+                    media_url=prompt_images,
+                    caption=payload.get("caption", ""),
+                    comment_history=comment_history,
+                    persona_data=persona_data,
+                    persona_prompt=self.persona_manager.get_persona_prompt(persona_name)
+                )
+        except Exception as e:
+            print(f"Error regenerating {persona_name}'s draft, posting it unchanged: {e}")
+            return draft
+        if not comment_text:
+            return draft
+        print(f"Regenerated comment for {persona_name}: {comment_text}")
+        # Later retries of this job compare against the thread this draft was written for
+        payload["seen_until"] = snapshot.last_timestamp
+        self.scheduler.update_comment(job["id"], comment_text, payload)
+        return comment_text
+
+    async def post_comment(self, job):
+        """Post one scheduled comment (called by the scheduler once it is due)."""
+        persona_name, post_id = job["persona"], job["post_id"]
+        # Scheduler tasks run outside process_post, so each scheduled post starts its own trace
+        with span("scheduled_comment", post_id=post_id, persona=persona_name, attempt=job["attempts"]):
+            return await self._post_comment(job)
+
+    async def _post_comment(self, job):
+        persona_name, post_id = job["persona"], job["post_id"]
+        comment_text = await self.refresh_draft(job)
+        job["comment"] = comment_text
+        # How long the comment actually waited between scheduling and posting
+        self.telemetry.record("delay", time.time() - job["created_at"], started_at=job["created_at"],
+                              post_id=post_id, persona=persona_name)
+        async with pipeline_stage("post", self.stats, self.limiter, self.telemetry,
+                                  post_id=post_id, persona=persona_name):
+            annotate(attempts=job["attempts"])
+            if job["payload"].get("use_instagrapi"):
+                response = await asyncio.to_thread(
+                    self.post_with_instagrapi, persona_name, comment_text, job["payload"].get("permalink")
+                )
+            else:
+                response = await self.post_with_graph_api(persona_name, post_id, comment_text)
+            if response is None:
+                annotate(error_code="NotPosted")
+        if response is None:
+            return None
+        print(f"Posted comment for {persona_name}: {response}")
+        self.logger.log_comment(post_id, persona_name, comment_text)
+        return response
+
+    async def comment_already_posted(self, job):
+        """
+        Whether a comment whose earlier attempt was interrupted is on the post anyway;
+        if so it is logged now, as the interrupted attempt could not log it.
+        """
+        comments = await self.insta_api.get_comments(job["post_id"])
+        if not any(comment.get("text") == job["comment"] for comment in comments):
+            return False
+        logged = await asyncio.to_thread(self.logger.get_comments, job["post_id"])  # waits for queued writes
+        if (job["persona"], job["comment"]) not in {(persona, comment) for persona, comment, _ in logged}:
+            self.logger.log_comment(job["post_id"], job["persona"], job["comment"])
+        return True
 
-            uploaded_media_urls.append(uploaded_url)
+    async def post_with_graph_api(self, persona_name, post_id, comment_text):
+        persona_token = await asyncio.to_thread(self.token_manager.get_persona_token, persona_name)
+        if not persona_token:
+            raise Exception(f"No access token found for persona: {persona_name}")
+        try:
+            return await self.insta_api.post_comment(post_id, comment_text, persona_token)
+        except GraphAPIError as e:
+            if not e.is_auth_error:
+                raise
+            # Only now check the token remotely; retry once with the refreshed token
+            persona_token = await asyncio.to_thread(self.token_manager.handle_auth_failure, persona_name)
+            return await self.insta_api.post_comment(post_id, comment_text, persona_token)
+
+    def post_with_instagrapi(self, persona_name, comment_text, permalink=None):
+        # Reuse the persona's pooled, session-persisted client; the media pk comes from
+        # the Graph API permalink so no lookup is needed before commenting
+        pool = self.instagrapi_pool
+        try:
+            media_pk = pool.resolve_media_pk(
+                persona_name,
+                permalink=permalink,
+                username=getattr(config, "PARTICIPANT_IG_USERNAME")
+            )
+            if not media_pk:
+                print(f"No media found for user {getattr(config, 'PARTICIPANT_IG_USERNAME')}.")
+                return None
         except Exception as e:
-            print(f"Error uploading media: {e}")
-            continue
-    return uploaded_media_urls
+            print(f"Error retrieving post with Instagrapi: {e}")
+            return None
+
+        # Post the comment on the media
+        return pool.post_comment(persona_name, media_pk, comment_text)
+
 
-async def process_post(selected_persona=None, use_instagrapi=False):
+@asynccontextmanager
+async def pipeline_stage(name, stats=None, limiter=None, telemetry=None, **labels):
+    """
+    Run one unit of work for a pipeline stage, holding a slot of the shared
+    concurrency limiter (if any) and recording it in the stage counters and,
+    labelled with `labels` (post_id, persona), in the telemetry table and as a
+    "stage.<name>" tracing span.
+    """
+    async with (limiter or nullcontext()):
+        with (stats.track(name) if stats else nullcontext()):
+            with (telemetry.stage(name, **labels) if telemetry else nullcontext()):
+                with span(f"stage.{name}", **labels):
+                    yield
+
+
+async def process_post(selected_persona=None, use_instagrapi=False, clients=None, post=None,
+                       page_name=None, stats=None, limiter=None):
     """
     Process the most recent post by:
       - retrieving media information,
-      - downloading media,
-      - uploading media to Google Cloud Storage,
+      - downloading media and preparing downscaled images (and video keyframes) for the prompt,
+      - uploading media to Google Cloud Storage (in the background),
       - generating comments (via LLM),
       - and posting comments under different personas (using either the official 
         Graph API or unofficial Instagrapi library).
+
+    In batch mode `clients`, `stats` and `limiter` are shared across posts, and `post`
+    is the already-fetched Graph API post to process. Returns the ids of the
+    comments it scheduled.
     """
-    # Load configuration and initialize helper classes
-    persona_manager = PersonaManager()
-    token_manager = TokenManager()
-    business_token = token_manager.get_instagram_business_token()
-    print(f"Business Token: {business_token}")
-
-    uploader = MediaUploader(bucket_name=getattr(config, "GCS_BUCKET_NAME"))
-    comment_gen = CommentGenerator(base_prompt=getattr(config, "BASE_PROMPT"))
-    logger = CommentLogger()
-
-    # Variables to be set by each branch
-    media_urls = []      # List of URLs to download media from
-
-    # Step 1: Retrieve the most recent post using the participant's Facebook Page name
-    insta_api = InstagramAPI(business_token)
-    try:
-        post = insta_api.get_recent_post(getattr(config, "PARTICIPANT_FB_PAGE_NAME"))
-        if not post:
-            print("No recent post found using Graph API.")
-            return
-    except Exception as e:
-        print(f"Error fetching recent post from Graph API: {e}")
-        return
-
-    post_id = post.get("id")
-    print(post_id)
-    caption = post.get("caption", "")
-    
-    # Step 2: Retrieve media URLs based on media type (carousel vs. single post)
-    media_urls = insta_api.get_media_urls(post)  # 调用新函数获取媒体 URL
-    print(media_urls)
-
-    # Step 3 & 4: Download and upload post media (images and/or videos)
-    uploaded_media_urls = await download_and_upload_media(insta_api, uploader, media_urls)
-    if not uploaded_media_urls:
-        print("No media was successfully uploaded.")
-        return
+    # Load configuration and initialize helper classes (or reuse the shared ones)
+    if clients is None:
+        async with await asyncio.to_thread(PipelineClients, stats, limiter) as clients:
+            job_ids = await process_post(selected_persona, use_instagrapi, clients=clients, post=post,
+                                         page_name=page_name, stats=stats, limiter=limiter)
+            # Stay up until this post's comments are out (they survive a restart regardless)
+            await clients.scheduler.wait_for(job_ids)
+        return job_ids
+    with span("process_post", page_name=page_name) as post_span:
+        insta_api = clients.insta_api
+
+        # Variables to be set by each branch
+        media_urls = []      # List of URLs to download media from
+
+        # Step 1: Retrieve the most recent post using the participant's Facebook Page name
+        if post is None:
+            page_name = page_name or getattr(config, "PARTICIPANT_FB_PAGE_NAME")
+            try:
+                async with pipeline_stage("fetch", stats, limiter, clients.telemetry):
+                    post = await insta_api.get_recent_post(page_name)
+                if not post:
+                    print("No recent post found using Graph API.")
+                    return []
+            except Exception as e:
+                print(f"Error fetching recent post from Graph API: {e}")
+                return []
+
+        post_id = post.get("id")
+        post_span.set(post_id=post_id)
+        if config.DEBUG_LOGGING:
+            print(post_id)
+        caption = post.get("caption", "")
     
-    # Step 5 & 6: For each persona, generate and post a comment with the specified delay
-    async def handle_persona(persona_name, persona_data, post_id, caption, uploaded_media_urls):
+        # Step 2: Retrieve media URLs based on media type (carousel vs. single post)
         try:
-            existing_comments = insta_api.get_comments(post_id)
-            comment_history = [f"{comment['username']}: {comment['text']}" for comment in existing_comments]
+            async with pipeline_stage("fetch", stats, limiter, clients.telemetry, post_id=post_id):
+                media_urls = await insta_api.get_media_urls(post)
+            post_span.set(media_items=len(media_urls))
+            if config.DEBUG_LOGGING:
+                print(media_urls)
+        except Exception as e:
+            print(f"Error fetching media URLs from Graph API: {e}")
+            return []
+
+        # Step 3: Stream post media (images and/or videos) into cloud storage. This only
+        # archives the media, so it runs alongside generation instead of ahead of it.
+        async def mirror_media():
+            async with pipeline_stage("mirror", stats, limiter, clients.telemetry, post_id=post_id):
+                uploaded_media_urls = await clients.mirror.mirror(media_urls)
+            if not uploaded_media_urls:
+                print("No media was successfully uploaded.")
+            return uploaded_media_urls
+
+        mirror_task = asyncio.create_task(mirror_media())
+        try:
+            return await generate_and_post(post, post_id, caption, media_urls, selected_persona,
+                                           use_instagrapi, clients, stats, limiter)
+        finally:
+            await asyncio.gather(mirror_task, return_exceptions=True)
+
+
+async def generate_and_post(post, post_id, caption, media_urls, selected_persona, use_instagrapi,
+                            clients, stats=None, limiter=None):
+    """
+    Steps 4 - 6 of process_post: prepare the prompt images, then generate every
+    persona's comment and hand it to the scheduler for posting. Returns the ids of
+    the scheduled comments.
+    """
+    persona_manager = clients.persona_manager
+    comment_gen = clients.comment_gen
+
+    # Step 4: Download the media from the CDN, downscale images (and keyframes sampled
+    # from videos) and inline them for the prompt
+    async with pipeline_stage("prepare", stats, limiter, clients.telemetry, post_id=post_id):
+        prompt_images = await clients.image_preprocessor.prepare(media_urls)
+    if not prompt_images:
+        print("No images could be prepared for the prompt; generating from the caption only.")
+
+    # Step 5 & 6: For each persona, generate a comment and schedule it with the specified delay.
+    # The comment thread is fetched once per post and shared by every persona task.
+    comment_snapshot = clients.comment_snapshot(post_id)
+
+    async def load_comment_history():
+        try:
+            return await comment_snapshot.history()
         except Exception as e:
             print(f"Error fetching comments via Graph API for post {post_id}: {e}")
-            comment_history = []
-
-        # Generate comment 
-        print(uploaded_media_urls)
-        comment_text = comment_gen.generate_comment(
-            media_url=uploaded_media_urls,  # Pass the list of uploaded GCS URLs
-            caption=caption,
-            comment_history=comment_history,
-            persona_data=persona_data
-        )
+            return []
+
+    async def handle_persona(persona_name, persona_data, post_id, caption, prompt_images, comment_text=None):
+        # Generate comment, unless it was already generated in a multi-persona request
+        if comment_text is None:
+            comment_history = await load_comment_history()
+            async with pipeline_stage("generate", stats, limiter, clients.telemetry,
+                                      post_id=post_id, persona=persona_name):
+                comment_text = await comment_gen.agenerate_comment(
+                    media_url=prompt_images,  # Pass the list of preprocessed image data URLs
+                    caption=caption,
+                    comment_history=comment_history,
+                    persona_data=persona_data,
+                    persona_prompt=persona_manager.get_persona_prompt(persona_name)
+                )
+        if comment_text is None:
+            return None
         print(f"Generated comment for {persona_name}: {comment_text}")
 
-        # Schedule the posting after a delay defined in the persona data
+        # Schedule the posting after a delay defined in the persona data. The job is
+        # persisted and posted by the scheduler, so nothing here waits out the delay.
+        # The draft is generated now; just before posting, the scheduler checks the
+        # comments added since `seen_until` and regenerates only if they matter.
         delay_minutes = persona_data.get("delay_minutes", 0)
         print(f"Scheduling comment for {persona_name} with a delay of {delay_minutes} minutes.")
-        await asyncio.sleep(delay_minutes * 60)
-
-        try:
-            if use_instagrapi:
-                # Retrieve Instagram credentials for the persona
-                ig_username = getattr(config, f"{persona_name.upper()}_IG_USERNAME", None)
-                ig_password = getattr(config, f"{persona_name.upper()}_IG_PASSWORD", None)
-
-                # Check if credentials are provided
-                if not ig_username or not ig_password:
-                    raise Exception(f"Missing credentials for persona: {persona_name}")
-
-                # Create a Client instance and log in to the Instagram account of the persona
-                cl = Client()
-                cl.login(ig_username, ig_password)  # Log in to the persona's Instagram account
-
-                try:
-                    # Retrieve the latest post for the given user using Instagrapi
-                    user_id = cl.user_id_from_username(getattr(config, "PARTICIPANT_IG_USERNAME"))
-                    media = cl.user_medias(user_id, 1)  # Retrieve latest post
-                    if not media:
-                        print(f"No media found for user {getattr(config, 'PARTICIPANT_IG_USERNAME')}.")
-                        return
-                    post = media[0]
-                    post_id = post.pk
-                    caption = post.caption_text or ""
-                except Exception as e:
-                    print(f"Error retrieving post with Instagrapi: {e}")
-                    return
-
-                # Post the comment on the media
-                response = cl.media_comment(post_id, comment_text)
-            else:
-                persona_token = token_manager.token_store.get_persona_token(persona_name)
-                if not persona_token:
-                    raise Exception(f"No access token found for persona: {persona_name}")
-                response = insta_api.post_comment(post_id, comment_text, persona_token)
-            print(f"Posted comment for {persona_name}: {response}")
-            logger.log_comment(post_id, persona_name, comment_text)
-        except Exception as e:
-            print(f"Error posting comment for {persona_name}: {e}")
+        job_id = persona_manager.schedule_comment(
+            clients.scheduler, post_id, persona_name, comment_text, delay_minutes,
+            permalink=post.get("permalink"), use_instagrapi=use_instagrapi,
+            caption=caption, media_urls=media_urls, seen_until=comment_snapshot.last_timestamp
+        )
+        if job_id is None:
+            print(f"A comment for {persona_name} on post {post_id} is already scheduled or posted.")
+        return job_id
 
-    # Create asynchronous tasks for personas.
-    tasks = []
+    # Collect the personas to comment as.
+    personas = {}
     if selected_persona is None:
         # Process all personas from personas.json
-        for persona_name, persona_data in persona_manager.personas.items():
-            tasks.append(handle_persona(persona_name, persona_data, post_id, caption, uploaded_media_urls))
+        personas = dict(persona_manager.personas)
     else:
         # Process only the selected persona(s)
         for persona_name in selected_persona:
             persona_data = persona_manager.get_persona(persona_name)
             if persona_data:
-                tasks.append(handle_persona(persona_name, persona_data, post_id, caption, uploaded_media_urls))
+                personas[persona_name] = persona_data
             else:
                 print(f"Persona {persona_name} not found.")
 
-    await asyncio.gather(*tasks)
+    # Optionally generate every persona's comment in one request (images sent once)
+    generated = {}
+    if getattr(config, "MULTI_PERSONA_GENERATION") and len(personas) > 1:
+        comment_history = await load_comment_history()
+        async with pipeline_stage("generate", stats, limiter, clients.telemetry, post_id=post_id):
+            generated = await comment_gen.agenerate_comments(
+                media_url=prompt_images,
+                caption=caption,
+                comment_history=comment_history,
+                personas={name: (data, persona_manager.get_persona_prompt(name)) for name, data in personas.items()}
+            )
+
+    # Create asynchronous tasks for personas.
+    tasks = []
+    for persona_name, persona_data in personas.items():
+        if persona_name in generated and generated[persona_name] is None:
+            print(f"No comment could be generated for {persona_name}.")
+            continue
+        tasks.append(handle_persona(persona_name, persona_data, post_id, caption, prompt_images,
+                                    comment_text=generated.get(persona_name)))
+    job_ids = await asyncio.gather(*tasks)
+    return [job_id for job_id in job_ids if job_id is not None]
+
+
+async def process_participants(page_names, recent_posts=1, max_concurrency=4,
+                               selected_persona=None, use_instagrapi=False):
+    """
+    Batch mode: process the `recent_posts` most recent posts of every participant page
+    in `page_names` with one set of shared clients.
+
+    Posts flow through fetch -> mirror -> generate -> post as independent tasks; at most
+    `max_concurrency` stage operations run at once (persona delays do not hold a slot).
+    Returns the PipelineStats with per-stage throughput counters.
+    """
+    stats = PipelineStats()
+    limiter = asyncio.Semaphore(max_concurrency)
+
+    async def fetch_posts(page_name):
+        try:
+            async with pipeline_stage("fetch", stats, limiter, clients.telemetry):
+                return await clients.insta_api.get_recent_posts(page_name, recent_posts)
+        except Exception as e:
+            print(f"Error fetching recent posts for page {page_name}: {e}")
+            return []
+
+    async def run_participant(page_name):
+        posts = await fetch_posts(page_name)
+        per_post = await asyncio.gather(*(
+            process_post(selected_persona, use_instagrapi, clients=clients, post=post,
+                         stats=stats, limiter=limiter)
+            for post in posts
+        ))
+        return [job_id for job_ids in per_post for job_id in job_ids]
+
+    async with await asyncio.to_thread(PipelineClients, stats, limiter) as clients:
+        per_page = await asyncio.gather(*(run_participant(page_name) for page_name in page_names))
+        # Wait for this batch's comments only, not for jobs left over from earlier runs
+        await clients.scheduler.wait_for([job_id for job_ids in per_page for job_id in job_ids])
+        print(f"Prompt cache hit rate: {clients.comment_gen.cache_hit_rate():.0%}")
+        print(f"Time to first token: {clients.comment_gen.ttft_summary()}")
+    print(stats.report())
+    return stats
+
+
+async def post_scheduled_comments():
+    """Post the comments still pending from earlier runs (e.g. after a crash), then exit."""
+    async with await asyncio.to_thread(PipelineClients) as clients:
+        await clients.scheduler.wait_idle()
+
 
 if __name__ == "__main__":
     # 选择要生成评论的角色，可以传入角色名称或 None 以生成所有角色的评论
@@ -200,4 +483,19 @@ if __name__ == "__main__":
     # Make sure all names match the keys in personas.json
     selected_persona = ["aunt"]  # 或者指定某个角色名称，例如 "Aunt"
     use_instagrapi = True  # Set True to use Instagrapi, False to use official Graph API
-    asyncio.run(process_post(selected_persona, use_instagrapi))
\ No newline at end of file
+
+    # Batch mode: set to a list of participant Facebook Page names to process several
+    # participants (and their `recent_posts` latest posts) in one run.
+    participant_pages = None
+    recent_posts = 1
+    max_concurrency = 4
+    # Set True to only post comments scheduled by earlier runs
+    resume_only = False
+
+    if resume_only:
+        asyncio.run(post_scheduled_comments())
+    elif participant_pages:
+        asyncio.run(process_participants(participant_pages, recent_posts, max_concurrency,
+                                         selected_persona, use_instagrapi))
+    else:
+        asyncio.run(process_post(selected_persona, use_instagrapi))
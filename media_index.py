@@ -0,0 +1,60 @@
+"""
+Mirrored Media Index
+
+Local record of media already mirrored to GCS, used by MediaUploader to skip
+downloads and uploads of content it has seen before. Maps a normalized source
+URL to the SHA-256 of its content, and a content hash to the public URL of the
+content-addressed blob holding it.
+"""
+
+import json
+import threading
+from pathlib import Path
+from typing import Optional
+from urllib.parse import urlparse
+from config import MEDIA_INDEX_FILE
+
+
+def source_key(source_url: str) -> str:
+    """
+    Instagram CDN URLs carry short-lived signatures in the query string, so media is
+    keyed by host + path only.
+    """
+    parsed = urlparse(source_url)
+    return f"{parsed.netloc}{parsed.path}"
+
+
+class MediaIndex:
+    def __init__(self, index_file=MEDIA_INDEX_FILE):
+        self.index_file = Path(index_file)
+        self._lock = threading.Lock()
+        data = self._load()
+        self._sources = data.get("sources", {})
+        self._blobs = data.get("blobs", {})
+
+    def _load(self):
+        try:
+            with open(self.index_file) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _save(self):
+        with open(self.index_file, "w") as f:
+            json.dump({"sources": self._sources, "blobs": self._blobs}, f, indent=4)
+
+    def lookup_source(self, source_url: str) -> Optional[str]:
+        """Public URL of already-mirrored media from this source, if any."""
+        content_hash = self._sources.get(source_key(source_url))
+        return self._blobs.get(content_hash) if content_hash else None
+
+    def lookup_hash(self, content_hash: str) -> Optional[str]:
+        """Public URL of the blob holding content with this hash, if any."""
+        return self._blobs.get(content_hash)
+
+    def record(self, content_hash: str, public_url: str, source_url: Optional[str] = None):
+        with self._lock:
+            self._blobs[content_hash] = public_url
+            if source_url:
+                self._sources[source_key(source_url)] = content_hash
+            self._save()
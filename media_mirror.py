@@ -0,0 +1,75 @@
+"""
+Media Mirror Stage
+
+Copies post media from the Instagram CDN to Google Cloud Storage. Each item is
+streamed: the download is read in chunks and written straight into a resumable
+GCS upload, so memory stays bounded by the chunk sizes rather than the media
+size. Items run concurrently on a bounded worker pool, so mirroring a post takes
+roughly as long as its slowest item. Media the uploader's index has already
+mirrored costs no transfer at all.
+"""
+
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from config import MEDIA_MIRROR_WORKERS, MEDIA_DOWNLOAD_CHUNK_SIZE, GRAPH_HTTP_TIMEOUT
+
+
+class MediaMirror:
+    def __init__(self, uploader, max_workers=MEDIA_MIRROR_WORKERS, chunk_size=MEDIA_DOWNLOAD_CHUNK_SIZE,
+                 timeout=GRAPH_HTTP_TIMEOUT):
+        self.uploader = uploader
+        self.chunk_size = chunk_size
+        self.timeout = timeout
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="media-mirror")
+        # Keep-alive session sized so every worker can hold its own CDN connection
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def mirror_one(self, media_url):
+        """
+        Stream one media item from `media_url` into GCS and return its public URL.
+        Media already mirrored from the same source is not downloaded again.
+        Runs on a worker thread.
+        """
+        mirrored_url = self.uploader.find_mirrored(media_url)
+        if mirrored_url:
+            return mirrored_url
+
+        with self.session.get(media_url, stream=True, timeout=self.timeout) as response:
+            if response.status_code != 200:
+                raise Exception(f"Error downloading media: {response.text}")
+            return self.uploader.upload_media_stream(
+                response.iter_content(chunk_size=self.chunk_size),
+                source_url=media_url  # enables MIME type detection
+            )
+
+    async def mirror(self, media_urls):
+        """
+        Mirror every URL concurrently (bounded by the worker pool) and return the
+        public URLs of the items that succeeded, in the original order.
+        """
+        loop = asyncio.get_running_loop()
+        # Each worker runs in a copy of the caller's context, so upload spans nest under the stage
+        results = await asyncio.gather(
+            *(loop.run_in_executor(self.executor, contextvars.copy_context().run, self.mirror_one, url)
+              for url in media_urls),
+            return_exceptions=True
+        )
+
+        uploaded_media_urls = []
+        for media_url, result in zip(media_urls, results):
+            if isinstance(result, Exception):
+                print(f"Error mirroring media from {media_url}: {result}")
+                continue
+            uploaded_media_urls.append(result)
+        return uploaded_media_urls
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+        self.session.close()
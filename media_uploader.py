@@ -1,37 +1,104 @@
 # media_uploader.py
-from google.cloud import storage
+import hashlib
+import threading
 import uuid
 import mimetypes
 import os
 from urllib.parse import urlparse
-from config import GCP_CREDENTIALS_PATH
+from media_index import MediaIndex
+from tracing import traced
+from config import GCP_CREDENTIALS_PATH, MEDIA_UPLOAD_CHUNK_SIZE, STORAGE_EMULATOR_HOST, validate_config
+
+# Streamed uploads land here first, until their content hash (and final name) is known
+STAGING_PREFIX = "staging/"
 
 class MediaUploader:
-    def __init__(self, bucket_name):
+    def __init__(self, bucket_name, media_index=None):
         self.bucket_name = bucket_name
-        self.client = storage.Client.from_service_account_json(GCP_CREDENTIALS_PATH)
-        self.bucket = self.client.get_bucket(bucket_name)
+        self.media_index = media_index if media_index is not None else MediaIndex()
+        self._bucket = None
+        self._bucket_lock = threading.Lock()
+
+    @property
+    def bucket(self):
+        """
+        The GCS bucket. google-cloud-storage is imported, the client built and the
+        bucket looked up (a network call) on first use rather than at construction.
+        """
+        if self._bucket is None:
+            with self._bucket_lock:
+                if self._bucket is None:
+                    validate_config("gcs")
+                    from google.cloud import storage
+                    if STORAGE_EMULATOR_HOST:
+                        # The client picks the emulator up from the environment and needs no credentials
+                        client = storage.Client()
+                    else:
+                        client = storage.Client.from_service_account_json(GCP_CREDENTIALS_PATH)
+                    self._bucket = client.get_bucket(self.bucket_name)
+        return self._bucket
+
+    @staticmethod
+    def _extension(source_url):
+        if not source_url:
+            return ""
+        parsed_path = urlparse(source_url).path
+        return os.path.splitext(parsed_path)[1]  # includes the dot
+
+    @staticmethod
+    def _resolve_content_type(blob_name, content_type):
+        """
+        If `content_type` is "auto", detect it from the blob name's extension (e.g. .mp4).
+        """
+        if content_type == "auto":
+            content_type, _ = mimetypes.guess_type(blob_name)
+            if not content_type:
+                content_type = "application/octet-stream"  # default fallback
+        return content_type
+
+    def find_mirrored(self, source_url):
+        """
+        Return the public URL of media already mirrored from `source_url`, or None.
+        Lets callers skip the download entirely.
+        """
+        return self.media_index.lookup_source(source_url)
 
+    def _publish_content_addressed(self, content_hash, source_url, upload):
+        """
+        Return the public URL of the blob named after `content_hash`, calling
+        `upload(blob_name)` only if that content is not in the bucket yet.
+        """
+        public_url = self.media_index.lookup_hash(content_hash)
+        if public_url is None:
+            blob_name = f"{content_hash}{self._extension(source_url)}"
+            blob = self.bucket.get_blob(blob_name)
+            if blob is None:
+                blob = upload(blob_name)
+                blob.make_public()
+                print(f"✅ Uploaded {blob_name} with content-type: {blob.content_type}")
+            public_url = blob.public_url
+        self.media_index.record(content_hash, public_url, source_url)
+        return public_url
+
+    @traced("gcs.upload_media_bytes")
     def upload_media_bytes(self, media_bytes, source_url=None, destination_blob_name=None, content_type="auto"):
         """
         Upload media content provided as bytes to GCS and return the public URL.
 
-        - If `destination_blob_name` is not provided, generate a UUID-based name.
+        - If `destination_blob_name` is not provided, the blob is named after the SHA-256 of
+          the content, and identical content already in the bucket is reused, not re-uploaded.
         - If `content_type` is "auto", detect it using `source_url` (e.g., from a file extension like .mp4).
         """
-        # Guess file extension and MIME type if needed
         if destination_blob_name is None:
-            ext = ""
-            if source_url:
-                parsed_path = urlparse(source_url).path
-                ext = os.path.splitext(parsed_path)[1]  # includes the dot
-            destination_blob_name = f"{uuid.uuid4()}{ext}"
+            def upload(blob_name):
+                blob = self.bucket.blob(blob_name)
+                blob.upload_from_string(media_bytes, content_type=self._resolve_content_type(blob_name, content_type))
+                return blob
 
-        if content_type == "auto":
-            content_type, _ = mimetypes.guess_type(destination_blob_name)
-            if not content_type:
-                content_type = "application/octet-stream"  # default fallback
+            content_hash = hashlib.sha256(media_bytes).hexdigest()
+            return self._publish_content_addressed(content_hash, source_url, upload)
 
+        content_type = self._resolve_content_type(destination_blob_name, content_type)
         blob = self.bucket.blob(destination_blob_name)
         blob.upload_from_string(media_bytes, content_type=content_type)
         blob.make_public()
@@ -39,6 +106,39 @@ class MediaUploader:
         print(f"✅ Uploaded {destination_blob_name} with content-type: {content_type}")
         return blob.public_url
 
+    @traced("gcs.upload_media_stream")
+    def upload_media_stream(self, chunks, source_url=None, content_type="auto", chunk_size=MEDIA_UPLOAD_CHUNK_SIZE):
+        """
+        Upload media from an iterable of byte chunks to GCS with a resumable upload and
+        return the public URL. At most `chunk_size` bytes are buffered at a time, so
+        memory use does not grow with the size of the media.
+
+        The content is hashed while streaming into a staging blob, which is then renamed
+        (server-side, no re-transfer) to its content-addressed name, or deleted if that
+        content already exists in the bucket.
+        """
+        ext = self._extension(source_url)
+        content_type = self._resolve_content_type(f"media{ext}", content_type)
+        digest = hashlib.sha256()
+
+        staging_blob = self.bucket.blob(f"{STAGING_PREFIX}{uuid.uuid4()}{ext}", chunk_size=chunk_size)
+        with staging_blob.open("wb", content_type=content_type) as writer:
+            for chunk in chunks:
+                digest.update(chunk)
+                writer.write(chunk)
+
+        promoted = []
+
+        def promote(blob_name):
+            promoted.append(blob_name)
+            return self.bucket.rename_blob(staging_blob, blob_name)
+
+        public_url = self._publish_content_addressed(digest.hexdigest(), source_url, promote)
+        if not promoted:
+            staging_blob.delete()
+        return public_url
+
+    @traced("gcs.upload_media_file")
     def upload_media_file(self, file_path, destination_blob_name=None):
         """
         Upload a media file from disk to GCS.
@@ -0,0 +1,82 @@
+"""
+Page Account Cache
+
+Persists the Facebook Page name -> (page_id, ig_account_id) resolution used by
+AsyncInstagramAPI.get_recent_posts, so polling a participant only costs the media
+request. Entries expire after a TTL and are invalidated by the API client when
+the Graph API reports an auth error. The page access token is not needed once the
+account is resolved, so it is never written to disk.
+"""
+
+import json
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Optional, Dict, Any
+from config import PAGE_CACHE_FILE, PAGE_CACHE_TTL_SECONDS
+
+
+class PageAccountCache:
+    def __init__(self, cache_file=PAGE_CACHE_FILE, ttl_seconds=PAGE_CACHE_TTL_SECONDS):
+        self.cache_file = Path(cache_file)
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._entries = self._load()
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        """Load cached entries from disk, ignoring a missing or corrupt file."""
+        try:
+            with open(self.cache_file) as f:
+                entries = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+        for entry in entries.values():
+            entry.pop("page_access_token", None)  # written by older versions; dropped on the next save
+        return entries
+
+    def _save(self):
+        """Write to a temp file in the same directory, then atomically rename it over the cache file."""
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_file.parent, prefix=".page_cache.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(self._entries, f, indent=4)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.cache_file)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    @staticmethod
+    def _key(page_name: str) -> str:
+        return page_name.lower()
+
+    def get(self, page_name: str) -> Optional[Dict[str, Any]]:
+        """Return the cached resolution for a page, or None if missing or expired."""
+        entry = self._entries.get(self._key(page_name))
+        if entry and time.time() - entry["cached_at"] < self.ttl_seconds:
+            return entry
+        return None
+
+    def set(self, page_name: str, page_id: str, ig_account_id: str):
+        """Cache the resolution chain for a page and persist it."""
+        with self._lock:
+            self._entries[self._key(page_name)] = {
+                "page_id": page_id,
+                "ig_account_id": ig_account_id,
+                "cached_at": time.time()
+            }
+            self._save()
+
+    def invalidate(self, page_name: str):
+        """Drop a page's cached resolution (e.g. after an auth error)."""
+        with self._lock:
+            if self._entries.pop(self._key(page_name), None) is not None:
+                self._save()
+
+    def clear(self):
+        with self._lock:
+            self._entries = {}
+            self._save()
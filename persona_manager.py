@@ -1,15 +1,17 @@
 # persona_manager.py
 import json
-from token_manager import TokenManager
-from token_store import TokenStore
+from token_manager import get_token_manager
+from comment_generator import compile_persona
 from config import PERSONA_FILE
 
 class PersonaManager:
     def __init__(self, persona_file=PERSONA_FILE):
         self.persona_file = persona_file
-        self.token_manager = TokenManager()
-        self.token_store = TokenStore()
+        self.token_manager = get_token_manager()
+        self.token_store = self.token_manager.token_store
         self.personas = self.load_personas()
+        # Persona prompt fragments, compiled once here instead of on every generation
+        self.persona_prompts = {name: compile_persona(name, data) for name, data in self.personas.items()}
 
     def load_personas(self):
         with open(self.persona_file, "r") as f:
@@ -31,9 +33,13 @@ class PersonaManager:
             }
             json.dump(personas_without_tokens, f, indent=4)
         
-        # Save tokens separately in token store
+        # Save tokens separately in token store, keeping the stored expiry of unchanged tokens
+        stored_tokens = self.token_store.get_all_persona_tokens()
         for name, data in self.personas.items():
             if "access_token" in data:
+                stored = stored_tokens.get(name) or {}
+                if stored.get("access_token") == data["access_token"]:
+                    continue
                 self.token_store.save_persona_token(name, data["access_token"])
 
     def get_persona(self, name):
@@ -48,23 +54,26 @@ class PersonaManager:
                 if "auth_code" in persona:
                     print(f"Access token for {name} is not available or expired. Attempting to regenerate.")
                     try:
-                        short_token, long_token = self.token_manager.get_user_tokens(persona["auth_code"])
+                        short_token, long_token, expires_at = self.token_manager.get_user_tokens(persona["auth_code"])
                         persona["access_token"] = long_token
-                        self.token_store.save_persona_token(name, long_token)
+                        self.token_store.save_persona_token(name, long_token, expires_at)
                     except Exception as e:
                         print(f"Error regenerating token for {name}: {e}")
         return persona
 
+    def get_persona_prompt(self, name):
+        return self.persona_prompts.get(name)
+
     def get_all_personas(self):
         return self.personas.keys()
 
-    async def schedule_comment(self, delay_minutes, coro):
+    def schedule_comment(self, scheduler, post_id, persona_name, comment_text, delay_minutes, **job_options):
         """
-        Schedule a coroutine to run after delay_minutes.
+        Schedule a persona's comment to be posted after delay_minutes. The job is
+        persisted by `scheduler` (a CommentScheduler), so it survives restarts.
+        Returns the job id, or None if one is already scheduled for this persona and post.
         """
-        import asyncio
-        await asyncio.sleep(delay_minutes * 60)
-        await coro
+        return scheduler.schedule(post_id, persona_name, comment_text, delay_minutes * 60, **job_options)
 
     def retrieve_tokens_for_persona(self):
         """
@@ -83,10 +92,10 @@ class PersonaManager:
             if "auth_code" in persona_data and not persona_data.get("access_token"):
                 print(f"Retrieving tokens for persona: {persona_name}")
                 try:
-                    short_token, long_token = self.token_manager.get_user_tokens(persona_data["auth_code"])
-                    # Save the long-lived token
+                    short_token, long_token, expires_at = self.token_manager.get_user_tokens(persona_data["auth_code"])
+                    # Save the long-lived token with its expiry, so the refresh scheduler renews it
                     persona_data["access_token"] = long_token
-                    self.token_store.save_persona_token(persona_name, long_token)
+                    self.token_store.save_persona_token(persona_name, long_token, expires_at)
                     updated = True
                 except Exception as e:
                     print(f"Error retrieving token for {persona_name}: {e}")
@@ -0,0 +1,72 @@
+"""
+Pipeline Throughput Counters
+
+Tracks how many items each stage of the post pipeline (fetch, mirror, prepare,
+generate, post) has completed, how long each item took, and the resulting throughput in
+items per minute since the pipeline started. Used by the batch mode in main.py
+to show how throughput scales with the concurrency limit.
+"""
+
+import time
+from contextlib import contextmanager
+
+STAGES = ("fetch", "mirror", "prepare", "generate", "post")
+
+
+class StageCounter:
+    def __init__(self, name):
+        self.name = name
+        self.completed = 0
+        self.failed = 0
+        self.busy_seconds = 0.0
+
+    def record(self, elapsed, ok=True):
+        if ok:
+            self.completed += 1
+        else:
+            self.failed += 1
+        self.busy_seconds += elapsed
+
+    @property
+    def avg_latency(self):
+        total = self.completed + self.failed
+        return self.busy_seconds / total if total else 0.0
+
+
+class PipelineStats:
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.stages = {name: StageCounter(name) for name in STAGES}
+
+    @contextmanager
+    def track(self, stage):
+        """
+        Time one item passing through `stage`. Exceptions are counted as
+        failures and re-raised.
+        """
+        counter = self.stages.setdefault(stage, StageCounter(stage))
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            counter.record(time.perf_counter() - start, ok=False)
+            raise
+        counter.record(time.perf_counter() - start)
+
+    def elapsed(self):
+        return time.perf_counter() - self.started_at
+
+    def per_minute(self, stage):
+        elapsed = self.elapsed()
+        if elapsed <= 0:
+            return 0.0
+        return self.stages[stage].completed * 60.0 / elapsed
+
+    def report(self):
+        lines = [f"Pipeline stats after {self.elapsed():.1f}s:"]
+        for name, counter in self.stages.items():
+            lines.append(
+                f"  {name:<9} done={counter.completed:<5} failed={counter.failed:<4} "
+                f"avg={counter.avg_latency:.2f}s  rate={self.per_minute(name):.1f}/min"
+            )
+        return "\n".join(lines)
@@ -0,0 +1,81 @@
+"""
+Rate Limiter for LLM Requests
+
+Token-bucket limiter that keeps concurrent generations under the provider's
+requests-per-minute (RPM) and tokens-per-minute (TPM) limits. Callers acquire
+one request plus their estimated token count before each call, then reconcile
+the estimate with the actual usage reported in the response. A 429 can pause
+every caller for the server's Retry-After interval.
+
+Usage:
+    limiter = RateLimiter(rpm=500, tpm=30000)
+    await limiter.acquire(estimated_tokens)
+    ...
+    limiter.reconcile(estimated_tokens, usage.total_tokens)
+"""
+
+import asyncio
+import time
+
+
+class TokenBucket:
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.refill_per_second = per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.refill_per_second)
+        self.updated = now
+
+    def wait_time(self, amount):
+        """Seconds until `amount` can be consumed (0 if it can be right now)."""
+        self._refill()
+        amount = min(amount, self.capacity)  # a request larger than the bucket waits for a full bucket
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.refill_per_second
+
+    def consume(self, amount):
+        self.tokens -= amount
+
+    def credit(self, amount):
+        """Return (or, if negative, charge) tokens after the real cost is known."""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class RateLimiter:
+    def __init__(self, rpm, tpm):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self._blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, estimated_tokens):
+        """
+        Wait until one request and `estimated_tokens` tokens fit under both limits,
+        then reserve them. Waiters are served in arrival order.
+        """
+        async with self._lock:
+            while True:
+                wait = max(
+                    self._blocked_until - time.monotonic(),
+                    self.requests.wait_time(1),
+                    self.tokens.wait_time(estimated_tokens)
+                )
+                if wait <= 0:
+                    self.requests.consume(1)
+                    self.tokens.consume(estimated_tokens)
+                    return
+                await asyncio.sleep(wait)
+
+    def reconcile(self, estimated_tokens, actual_tokens):
+        """Adjust the token bucket once the response reports the real usage."""
+        self.tokens.credit(estimated_tokens - actual_tokens)
+
+    def pause(self, seconds):
+        """Hold back every caller for `seconds` (e.g. the Retry-After of a 429)."""
+        self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
@@ -0,0 +1,97 @@
+"""
+Generation Response Cache
+
+On-disk (SQLite) cache of LLM completions, keyed by a hash of everything that
+determines the output: model, temperature, request options and the full
+message list (base prompt, persona fragment, caption and the inlined images,
+whose bytes stand in for the media hashes). Re-running a post after a crash or
+while iterating on code then returns instantly instead of paying for the
+generation again.
+
+Entries expire after a TTL, and the least recently used ones are evicted once
+the cache holds more than `max_entries`. In replay mode the cache is the only
+source: a miss raises instead of calling the API, so runs are deterministic and
+work offline.
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from typing import Optional
+from config import RESPONSE_CACHE_FILE, RESPONSE_CACHE_TTL_SECONDS, RESPONSE_CACHE_MAX_ENTRIES
+
+
+class CacheMiss(Exception):
+    """Raised in replay mode when a request has no cached response."""
+
+
+def request_key(model, temperature, messages, **request_options):
+    payload = json.dumps(
+        {"model": model, "temperature": temperature, "messages": messages, "options": request_options},
+        sort_keys=True, separators=(",", ":")
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, db_path=RESPONSE_CACHE_FILE, ttl_seconds=RESPONSE_CACHE_TTL_SECONDS,
+                 max_entries=RESPONSE_CACHE_MAX_ENTRIES):
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.create_table()
+
+    def create_table(self):
+        with self._lock:
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    content TEXT,
+                    created_at REAL,
+                    accessed_at REAL
+                )
+            ''')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses (accessed_at)')
+            self.conn.commit()
+
+    def get(self, key) -> Optional[str]:
+        """Cached content for `key`, or None if missing or expired."""
+        now = time.time()
+        with self._lock:
+            row = self.conn.execute('SELECT content, created_at FROM responses WHERE key = ?', (key,)).fetchone()
+            if row is None or now - row[1] >= self.ttl_seconds:
+                self.misses += 1
+                return None
+            self.conn.execute('UPDATE responses SET accessed_at = ? WHERE key = ?', (now, key))
+            self.conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key, content):
+        now = time.time()
+        with self._lock:
+            self.conn.execute('''
+                INSERT OR REPLACE INTO responses (key, content, created_at, accessed_at) VALUES (?, ?, ?, ?)
+            ''', (key, content, now, now))
+            # Drop expired entries, then the least recently used beyond the size bound
+            self.conn.execute('DELETE FROM responses WHERE created_at <= ?', (now - self.ttl_seconds,))
+            self.conn.execute('''
+                DELETE FROM responses WHERE key IN (
+                    SELECT key FROM responses ORDER BY accessed_at DESC LIMIT -1 OFFSET ?
+                )
+            ''', (self.max_entries,))
+            self.conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self.conn.execute('DELETE FROM responses')
+            self.conn.commit()
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,81 @@
+"""
+Batched SQLite Writer
+
+Write-behind helper shared by the comment log and the telemetry table in
+comments.db. Callers only queue rows; one dedicated thread drains the queue
+and inserts whatever has accumulated in a single transaction (a group commit),
+so hot-path callers never share a connection or wait on a commit.
+"""
+
+import queue
+import sqlite3
+import threading
+
+_STOP = object()
+
+
+def connect(db_path):
+    """Connection in WAL mode, so readers never block the writer (or each other)."""
+    conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')  # durable at each checkpoint; safe with WAL
+    return conn
+
+
+class BatchWriter:
+    def __init__(self, db_path, insert_sql, batch_size, flush_interval, name="sqlite-writer"):
+        self.insert_sql = insert_sql
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.conn = connect(db_path)
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._write_loop, name=name, daemon=True)
+        self._thread.start()
+
+    def put(self, row):
+        self._queue.put(row)
+
+    def _write_loop(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            batch, done = [], 1
+            if item is _STOP:
+                stopping = True
+            else:
+                batch.append(item)
+                # Gather whatever else arrives shortly, up to one batch
+                while len(batch) < self.batch_size:
+                    try:
+                        item = self._queue.get(timeout=self.flush_interval)
+                    except queue.Empty:
+                        break
+                    done += 1
+                    if item is _STOP:
+                        stopping = True
+                        break
+                    batch.append(item)
+            try:
+                if batch:
+                    self._insert(batch)
+            finally:
+                for _ in range(done):
+                    self._queue.task_done()
+
+    def _insert(self, batch):
+        try:
+            with self.conn:
+                self.conn.executemany(self.insert_sql, batch)
+        except sqlite3.Error as e:
+            print(f"Error writing {len(batch)} row(s) to {threading.current_thread().name}: {e}")
+
+    def flush(self):
+        """Block until every queued row is committed."""
+        self._queue.join()
+
+    def close(self):
+        """Commit what is queued and stop the writer thread."""
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join()
+        self.conn.close()
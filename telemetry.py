@@ -0,0 +1,204 @@
+"""
+Pipeline Telemetry
+
+Records one row per pipeline stage event (fetch, mirror, prepare, generate,
+delay, post) in a `stage_events` table in comments.db. Each row holds the
+duration, the outcome and error code, and for generations the token counts,
+attempts, response-cache hits and time to first token.
+
+Code running inside a stage adds its numbers with annotate(), which finds the
+current event through a context variable, so the generator and API clients
+need no telemetry plumbing. Rows are written behind by a BatchWriter.
+
+Rollup views (stage_latency, generation_usage, error_counts, post_to_comment,
+daily_stage_rollup) answer the usual operational questions; run this module to
+print them:
+
+    python telemetry.py              # every rollup
+    python telemetry.py stage_latency
+"""
+
+import contextvars
+import sys
+import time
+import uuid
+from contextlib import contextmanager
+from sqlite_writer import BatchWriter, connect
+from config import COMMENT_LOG_FILE, COMMENT_LOG_BATCH_SIZE, COMMENT_LOG_FLUSH_INTERVAL, TELEMETRY_ENABLED
+
+_current_event = contextvars.ContextVar("telemetry_event", default=None)
+
+COLUMNS = (
+    "run_id", "post_id", "persona", "stage", "started_at", "duration_ms", "ok", "error_code",
+    "attempts", "prompt_tokens", "completion_tokens", "cached_tokens", "response_cached", "ttft_ms"
+)
+# Annotations that add up over an event (e.g. tokens of a multi-request generation)
+SUMMED = {"attempts", "prompt_tokens", "completion_tokens", "cached_tokens", "response_cached"}
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS stage_events (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        run_id TEXT,
+        post_id TEXT,
+        persona TEXT,
+        stage TEXT NOT NULL,
+        started_at REAL NOT NULL,
+        duration_ms REAL NOT NULL,
+        ok INTEGER NOT NULL,
+        error_code TEXT,
+        attempts INTEGER,
+        prompt_tokens INTEGER,
+        completion_tokens INTEGER,
+        cached_tokens INTEGER,
+        response_cached INTEGER,
+        ttft_ms REAL
+    );
+    CREATE INDEX IF NOT EXISTS idx_stage_events_stage_time ON stage_events (stage, started_at);
+    CREATE INDEX IF NOT EXISTS idx_stage_events_post ON stage_events (post_id, persona);
+
+    CREATE VIEW IF NOT EXISTS stage_latency AS
+    WITH ranked AS (
+        SELECT stage, COALESCE(persona, '') AS persona, duration_ms,
+               ROW_NUMBER() OVER (PARTITION BY stage, COALESCE(persona, '') ORDER BY duration_ms) AS rn,
+               COUNT(*) OVER (PARTITION BY stage, COALESCE(persona, '')) AS n
+        FROM stage_events WHERE ok = 1
+    )
+    SELECT stage, persona, n AS events,
+           ROUND(AVG(duration_ms), 1) AS avg_ms,
+           ROUND(MIN(CASE WHEN rn >= 0.5 * n THEN duration_ms END), 1) AS p50_ms,
+           ROUND(MIN(CASE WHEN rn >= 0.95 * n THEN duration_ms END), 1) AS p95_ms,
+           ROUND(MAX(duration_ms), 1) AS max_ms
+    FROM ranked GROUP BY stage, persona;
+
+    CREATE VIEW IF NOT EXISTS generation_usage AS
+    SELECT COALESCE(persona, '(multi)') AS persona, COUNT(*) AS generations,
+           SUM(ok = 0) AS failed,
+           SUM(prompt_tokens) AS prompt_tokens,
+           SUM(cached_tokens) AS cached_tokens,
+           SUM(completion_tokens) AS completion_tokens,
+           SUM(COALESCE(response_cached, 0) > 0) AS response_cache_hits,
+           ROUND(AVG(attempts), 2) AS avg_attempts,
+           ROUND(AVG(ttft_ms), 1) AS avg_ttft_ms
+    FROM stage_events WHERE stage = 'generate' GROUP BY persona;
+
+    CREATE VIEW IF NOT EXISTS error_counts AS
+    SELECT stage, error_code, COUNT(*) AS events, MAX(datetime(started_at, 'unixepoch')) AS last_seen
+    FROM stage_events WHERE ok = 0 GROUP BY stage, error_code ORDER BY events DESC;
+
+    CREATE VIEW IF NOT EXISTS post_to_comment AS
+    SELECT p.persona, COUNT(*) AS comments,
+           ROUND(AVG(p.started_at + p.duration_ms / 1000.0 - f.detected_at) / 60.0, 1) AS avg_minutes,
+           ROUND(MAX(p.started_at + p.duration_ms / 1000.0 - f.detected_at) / 60.0, 1) AS max_minutes
+    FROM stage_events p
+    JOIN (
+        SELECT post_id, MIN(started_at) AS detected_at FROM stage_events
+        WHERE stage = 'fetch' AND post_id IS NOT NULL GROUP BY post_id
+    ) f ON f.post_id = p.post_id
+    WHERE p.stage = 'post' AND p.ok = 1
+    GROUP BY p.persona;
+
+    CREATE VIEW IF NOT EXISTS daily_stage_rollup AS
+    SELECT date(started_at, 'unixepoch') AS day, stage, COALESCE(persona, '') AS persona,
+           COUNT(*) AS events, SUM(ok = 0) AS errors, ROUND(AVG(duration_ms), 1) AS avg_ms,
+           SUM(prompt_tokens) AS prompt_tokens, SUM(completion_tokens) AS completion_tokens
+    FROM stage_events GROUP BY day, stage, persona ORDER BY day DESC, stage, persona;
+'''
+
+VIEWS = ("stage_latency", "generation_usage", "error_counts", "post_to_comment", "daily_stage_rollup")
+
+
+def annotate(**values):
+    """
+    Attach numbers (tokens, attempts, error_code, ...) to the stage event running in
+    the current task. A no-op outside a stage or with telemetry disabled.
+    """
+    event = _current_event.get()
+    if event is None:
+        return
+    for key, value in values.items():
+        if key in SUMMED and value is not None:
+            event[key] = (event.get(key) or 0) + value
+        else:
+            event[key] = value
+
+
+def error_code(error):
+    """Short error label, e.g. "GraphAPIError:190" or "TimeoutError"."""
+    code = getattr(error, "error_code", None) or getattr(error, "status_code", None)
+    return f"{type(error).__name__}:{code}" if code else type(error).__name__
+
+
+class Telemetry:
+    def __init__(self, db_path=COMMENT_LOG_FILE, enabled=TELEMETRY_ENABLED):
+        self.enabled = enabled
+        self.run_id = uuid.uuid4().hex[:12]
+        self._writer = None
+        if enabled:
+            conn = connect(db_path)
+            conn.executescript(SCHEMA)
+            conn.close()
+            self._writer = BatchWriter(
+                db_path,
+                f"INSERT INTO stage_events ({', '.join(COLUMNS)}) VALUES ({', '.join('?' for _ in COLUMNS)})",
+                COMMENT_LOG_BATCH_SIZE, COMMENT_LOG_FLUSH_INTERVAL, name="telemetry"
+            )
+
+    @contextmanager
+    def stage(self, name, **labels):
+        """Time one stage event; the body can add to it with annotate()."""
+        if not self.enabled:
+            yield
+            return
+        event = dict(labels)
+        token = _current_event.set(event)
+        started_at, start = time.time(), time.perf_counter()
+        try:
+            yield
+        except BaseException as e:
+            event.setdefault("error_code", error_code(e))
+            raise
+        finally:
+            _current_event.reset(token)
+            self.record(name, time.perf_counter() - start, started_at=started_at, **event)
+
+    def record(self, stage, duration, started_at=None, **fields):
+        """Write one stage event; `duration` is in seconds."""
+        if not self.enabled:
+            return
+        fields.update(
+            run_id=self.run_id,
+            stage=stage,
+            started_at=started_at if started_at is not None else time.time() - duration,
+            duration_ms=duration * 1000.0,
+            ok=int(fields.get("error_code") is None)
+        )
+        self._writer.put(tuple(fields.get(column) for column in COLUMNS))
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+
+def print_report(db_path=COMMENT_LOG_FILE, views=VIEWS):
+    conn = connect(db_path)
+    conn.executescript(SCHEMA)
+    for view in views:
+        cursor = conn.execute(f"SELECT * FROM {view}")
+        headers = [column[0] for column in cursor.description]
+        rows = [["" if value is None else str(value) for value in row] for row in cursor.fetchall()]
+        widths = [max([len(h)] + [len(row[i]) for row in rows]) for i, h in enumerate(headers)]
+        print(f"\n== {view} ==")
+        print("  ".join(h.ljust(w) for h, w in zip(headers, widths)))
+        for row in rows:
+            print("  ".join(value.ljust(w) for value, w in zip(row, widths)))
+        if not rows:
+            print("(no data)")
+    conn.close()
+
+
+if __name__ == "__main__":
+    requested = sys.argv[1:] or VIEWS
+    unknown = [view for view in requested if view not in VIEWS]
+    if unknown:
+        sys.exit(f"Unknown report(s): {', '.join(unknown)}. Available: {', '.join(VIEWS)}")
+    print_report(views=requested)
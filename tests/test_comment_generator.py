@@ -0,0 +1,20 @@
+from comment_generator import fit_to_budget
+
+
+def test_cut_ends_at_last_sentence():
+    assert fit_to_budget("Love this. Want the recipe now please", 4) == ("Love this.", True)
+
+
+def test_abbreviations_do_not_end_a_sentence():
+    assert fit_to_budget("Looks great, Mr. Chen made this dish so well!", 4) == ("Looks great", True)
+    assert fit_to_budget("Dr. Lee would approve of this", 3) == ("Dr. Lee would", True)
+
+
+def test_initialisms_do_not_end_a_sentence():
+    text = "Try it with herbs, e.g. basil. So good and fresh"
+    assert fit_to_budget(text, 7) == ("Try it with herbs, e.g. basil.", True)
+    assert fit_to_budget("Pair it with greens, i.e. spinach or kale", 5) == ("Pair it with greens", True)
+
+
+def test_text_within_budget_is_unchanged():
+    assert fit_to_budget("Looks great, Mr. Chen!", 10) == ("Looks great, Mr. Chen!", False)
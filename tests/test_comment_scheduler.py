@@ -0,0 +1,72 @@
+import asyncio
+
+from comment_scheduler import FAILED, PENDING, POSTED, CommentScheduler
+
+
+def make_scheduler(tmp_path, post_fn):
+    return CommentScheduler(post_fn, db_path=str(tmp_path / "comments.db"), max_attempts=1, retry_seconds=0)
+
+
+def status_of(scheduler, job_id):
+    return scheduler.conn.execute("SELECT status FROM scheduled_comments WHERE id = ?", (job_id,)).fetchone()[0]
+
+
+def test_failed_comment_can_be_rescheduled(tmp_path):
+    responses = [None, {"id": "c1"}]  # the first attempt posts nothing, the second succeeds
+    posted = []
+
+    async def post_fn(job):
+        posted.append(job["comment"])
+        return responses.pop(0)
+
+    async def run():
+        scheduler = make_scheduler(tmp_path, post_fn).start()
+        try:
+            first = scheduler.schedule("p1", "aunt", "First try")
+            await asyncio.wait_for(scheduler.wait_for([first]), timeout=5)
+            assert status_of(scheduler, first) == FAILED
+
+            second = scheduler.schedule("p1", "aunt", "Second try")
+            assert second is not None
+            assert status_of(scheduler, second) == PENDING
+            await asyncio.wait_for(scheduler.wait_for([second]), timeout=5)
+            assert status_of(scheduler, second) == POSTED
+
+            # A posted comment is never scheduled again
+            assert scheduler.schedule("p1", "aunt", "Third try") is None
+        finally:
+            await scheduler.stop()
+
+    asyncio.run(run())
+    assert posted == ["First try", "Second try"]
+
+
+def test_pending_comment_is_not_rescheduled(tmp_path):
+    async def post_fn(job):
+        return {"id": "c1"}
+
+    scheduler = make_scheduler(tmp_path, post_fn)
+    job_id = scheduler.schedule("p1", "aunt", "Lovely!", delay_seconds=3600)
+    assert job_id is not None
+    assert scheduler.schedule("p1", "aunt", "Lovely again!") is None
+    row = scheduler.conn.execute("SELECT comment FROM scheduled_comments WHERE id = ?", (job_id,)).fetchone()
+    assert row[0] == "Lovely!"
+
+
+def test_wait_for_ignores_other_jobs(tmp_path):
+    async def post_fn(job):
+        return {"id": job["persona"]}
+
+    async def run():
+        scheduler = make_scheduler(tmp_path, post_fn)
+        scheduler.schedule("p0", "aunt", "Due tomorrow", delay_seconds=86400)
+        scheduler.start()
+        try:
+            job_id = scheduler.schedule("p1", "aunt", "Due now")
+            await asyncio.wait_for(scheduler.wait_for([job_id]), timeout=5)
+            assert status_of(scheduler, job_id) == POSTED
+            assert scheduler.pending_count() == 1
+        finally:
+            await scheduler.stop()
+
+    asyncio.run(run())
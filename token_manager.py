@@ -1,22 +1,48 @@
+import threading
+import time
 import requests
 from config import (
     INSTAGRAM_APP_ID,
     INSTAGRAM_APP_SECRET,
     INSTAGRAM_REDIRECT_URI,
-    GRAPH_API_VERSION
+    GRAPH_API_BASE_URL
 )
-from token_store import TokenStore
+from token_store import get_token_store, to_epoch
 
-class TokenManager:
+_shared_manager = None
+_shared_manager_lock = threading.Lock()
+
+
+class _InflightRefresh:
     def __init__(self):
-        # Initialize token store
-        self.token_store = TokenStore()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+def get_token_manager():
+    """Return the process-wide TokenManager (backed by the shared TokenStore)."""
+    global _shared_manager
+    with _shared_manager_lock:
+        if _shared_manager is None:
+            _shared_manager = TokenManager()
+        return _shared_manager
+
+
+class TokenManager:
+    def __init__(self, token_store=None):
+        # Use the process-wide token store unless one is injected
+        self.token_store = token_store if token_store is not None else get_token_store()
         
         # Credentials for performing OAuth exchanges for user tokens
         self.app_id = INSTAGRAM_APP_ID
         self.app_secret = INSTAGRAM_APP_SECRET
         self.redirect_uri = INSTAGRAM_REDIRECT_URI
         
+        # Token refreshes currently in progress, keyed by token ("business" or "persona:<name>")
+        self._inflight = {}
+        self._inflight_lock = threading.Lock()
+
         # Validate required configuration
         if not self.app_id:
             raise Exception("Missing required configuration: INSTAGRAM_APP_ID")
@@ -26,6 +52,10 @@ class TokenManager:
     def get_instagram_business_token(self):
         """
         Get the Instagram Business Access Token, refreshing if necessary.
+
+        Expiry is checked locally against the stored `expires_at`, so the steady state
+        costs no network call. A token saved without expiry metadata is inspected once
+        via /debug_token and its expiry stored.
         """
         try:
             # Get token from store
@@ -34,30 +64,71 @@ class TokenManager:
             if not business_token:
                 print("No existing token found, getting new token...")
                 return self.refresh_token()
-            
-            # Try to validate token
-            try:
-                url = f"https://graph.facebook.com/{GRAPH_API_VERSION}/me"
-                params = {
-                    "access_token": business_token,
-                    "fields": "id,name"
-                }
-                response = requests.get(url, params=params)
-                
-                if response.status_code == 200:
-                    return business_token
-                
-            except Exception as e:
-                print(f"Token validation failed: {e}")
-            
-            # If we get here, token is invalid or expired
-            print("Token is invalid or expired, refreshing...")
-            return self.refresh_token()
+
+            expires_at = self.token_store.get_business_token_expires_at()
+            if expires_at is None:
+                token_info = self.inspect_token(business_token)
+                if not token_info.get("is_valid"):
+                    print("Token is invalid, refreshing...")
+                    return self.refresh_token()
+                self.token_store.save_business_token(business_token, token_info.get("expires_at"))
+                expires_at = to_epoch(token_info.get("expires_at"))
+
+            if self.token_store.is_token_expired(expires_at):
+                print("Token is expired or about to expire, refreshing...")
+                return self.refresh_token()
+
+            return business_token
             
         except Exception as e:
             print(f"Error getting business token: {e}")
             raise
 
+    def inspect_token(self, token):
+        """
+        Ask the Graph API about a token (validity, expiry, scopes) via /debug_token.
+        Only used when expiry is unknown or after an auth failure.
+        """
+        url = f"{GRAPH_API_BASE_URL}/debug_token"
+        params = {
+            "input_token": token,
+            "access_token": f"{self.app_id}|{self.app_secret}"
+        }
+        response = requests.get(url, params=params)
+        if response.status_code != 200:
+            raise Exception(f"Error inspecting token: {response.text}")
+        return response.json().get("data", {})
+
+    def _single_flight(self, key, refresh):
+        """
+        Run `refresh()` unless a refresh for the same token is already in progress on
+        another thread, in which case wait for that one and share its result. Keeps
+        the scheduler, the auth-failure path and lazy callers from exchanging the same
+        token twice.
+        """
+        with self._inflight_lock:
+            call = self._inflight.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = self._inflight[key] = _InflightRefresh()
+
+        if not is_leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = refresh()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._inflight_lock:
+                del self._inflight[key]
+            call.done.set()
+
     def get_short_lived_token(self, auth_code=None):
         """
         Exchanges an auth code for a short-lived access token.
@@ -84,28 +155,39 @@ class TokenManager:
         """
         Exchanges a short-lived token for a long-lived token.
         """
-        url = f"https://graph.facebook.com/{GRAPH_API_VERSION}/oauth/access_token"
+        return self.exchange_token(short_lived_token)[0]
+
+    def exchange_token(self, token):
+        """
+        Exchanges a short-lived (or current long-lived) token for a long-lived token.
+        Returns a tuple: (long_lived_token, expires_at) where expires_at is epoch
+        seconds, or None if the response carries no expiry.
+        """
+        url = f"{GRAPH_API_BASE_URL}/oauth/access_token"
         params = {
             "grant_type": "fb_exchange_token",
             "client_id": self.app_id,
             "client_secret": self.app_secret,
-            "fb_exchange_token": short_lived_token
+            "fb_exchange_token": token
         }
         response = requests.get(url, params=params)
         if response.status_code != 200:
             raise Exception(f"Error exchanging token: {response.text}")
         token_data = response.json()
-        return token_data.get("access_token")
+        expires_in = token_data.get("expires_in")
+        expires_at = time.time() + expires_in if expires_in else None
+        return token_data.get("access_token"), expires_at
 
     def get_user_tokens(self, auth_code):
         """
         Retrieves both short-lived and long-lived tokens for a user/persona.
         Expects an auth code (obtained via the OAuth flow) as input.
-        Returns a tuple: (short_lived_token, long_lived_token)
+        Returns a tuple: (short_lived_token, long_lived_token, expires_at) where
+        expires_at is the long-lived token's expiry in epoch seconds, or None if unknown.
         """
         short_lived_token = self.get_short_lived_token(auth_code)
-        long_lived_token = self.exchange_short_lived_token(short_lived_token)
-        return short_lived_token, long_lived_token
+        long_lived_token, expires_at = self.exchange_token(short_lived_token)
+        return short_lived_token, long_lived_token, expires_at
 
     def refresh_token(self):
         """
@@ -113,8 +195,11 @@ class TokenManager:
         This method assumes that a valid current token exists in the token store.
         
         If no current token is found, the method raises an exception to indicate that 
-        re-authentication via OAuth is needed.
+        re-authentication via OAuth is needed. Concurrent calls share one exchange.
         """
+        return self._single_flight("business", self._refresh_business_token)
+
+    def _refresh_business_token(self):
         try:
             # Get current business token from token store
             current_token = self.token_store.get_business_token()
@@ -124,14 +209,14 @@ class TokenManager:
             print("Attempting to refresh Instagram Business access token using current token...")
             
             # Use the Graph API endpoint to refresh the token.
-            # We call exchange_short_lived_token() with the current token because the endpoint is the same for both exchanging and refreshing.
-            new_token = self.exchange_short_lived_token(current_token)
+            # We call exchange_token() with the current token because the endpoint is the same for both exchanging and refreshing.
+            new_token, expires_at = self.exchange_token(current_token)
             if not new_token:
                 raise Exception("No long-lived token received in response")
             
             print("Successfully refreshed the token.")
-            # Save the new token back to the token store (and update timestamp, if desired)
-            self.token_store.save_business_token(new_token)
+            # Save the new token back to the token store along with its expiry
+            self.token_store.save_business_token(new_token, expires_at)
             print("New token saved to tokens.json.")
 
             return new_token
@@ -140,6 +225,79 @@ class TokenManager:
             print(f"Error in refresh_token: {e}")
             raise Exception("Failed to refresh Instagram access token. Please check your app credentials and token validity.")
 
+    def refresh_persona_token(self, persona_name):
+        """
+        Exchange a persona's current long-lived token for a fresh one and store it
+        with its new expiry. Concurrent calls for the same persona share one exchange.
+        """
+        return self._single_flight(f"persona:{persona_name}", lambda: self._refresh_persona_token(persona_name))
+
+    def _refresh_persona_token(self, persona_name):
+        persona_data = self.token_store.get_all_persona_tokens().get(persona_name) or {}
+        current_token = persona_data.get("access_token")
+        if not current_token:
+            raise Exception(f"No access token stored for persona: {persona_name}")
+        new_token, expires_at = self.exchange_token(current_token)
+        if not new_token:
+            raise Exception("No long-lived token received in response")
+        self.token_store.save_persona_token(persona_name, new_token, expires_at)
+        print(f"Refreshed access token for persona: {persona_name}")
+        return new_token
+
+    def get_persona_token(self, persona_name):
+        """
+        A persona's token to post with, or None if none is stored or it has expired.
+
+        A token inside the refresh margin is refreshed inline (sharing any refresh
+        already in progress). If that refresh fails, the current token is still used
+        as long as it has not actually expired.
+        """
+        persona_data = self.token_store.get_all_persona_tokens().get(persona_name) or {}
+        token = persona_data.get("access_token")
+        expires_at = persona_data.get("expires_at")
+        if not token or not self.token_store.is_token_expired(expires_at):
+            return token
+
+        try:
+            return self.refresh_persona_token(persona_name)
+        except Exception as e:
+            if self.token_store.is_token_expired(expires_at, margin=0):
+                print(f"Token for {persona_name} has expired and could not be refreshed: {e}")
+                return None
+            print(f"Error refreshing token for {persona_name}, using the current one until it expires: {e}")
+            return token
+
+    def handle_auth_failure(self, persona_name=None):
+        """
+        Called after the Graph API rejected a token. Returns the token to retry with.
+        """
+        return self.verify_token(persona_name)
+
+    def verify_token(self, persona_name=None):
+        """
+        Check a token remotely via /debug_token, store its expiry, and refresh it if it
+        is invalid or close to expiry. `persona_name=None` means the business token.
+        Returns the current (possibly refreshed) token.
+        """
+        if persona_name is None:
+            token = self.token_store.get_business_token()
+        else:
+            token = (self.token_store.get_all_persona_tokens().get(persona_name) or {}).get("access_token")
+
+        token_info = self.inspect_token(token) if token else {}
+        expires_at = token_info.get("expires_at")
+        if token_info.get("is_valid") and not self.token_store.is_token_expired(expires_at):
+            # The token itself is fine (e.g. a permissions error); just record its expiry
+            if persona_name is None:
+                self.token_store.save_business_token(token, expires_at)
+            else:
+                self.token_store.save_persona_token(persona_name, token, expires_at)
+            return token
+
+        if persona_name is None:
+            return self.refresh_token()
+        return self.refresh_persona_token(persona_name)
+
     def generate_or_regenerate_access_tokens_for_users(self, fb_page_id, ig_user_id):
         """
         Generate or regenerate access tokens for the specified Facebook page and Instagram user.
@@ -154,15 +312,14 @@ class TokenManager:
             print("Successfully obtained short-lived token.")
 
             # Step 2: Exchange short-lived token for long-lived token
-            long_lived_token = self.exchange_short_lived_token(short_lived_token)
+            long_lived_token, expires_at = self.exchange_token(short_lived_token)
             
             if not long_lived_token:
                 raise Exception("Failed to obtain long-lived token.")
 
             print("Successfully exchanged for long-lived token.")
 
-            # Step 3: Save tokens to token store with expiration date
-            expires_at = "2025-12-31T23:59:59Z"  # 示例过期日期，实际应根据 API 返回的过期时间设置
+            # Step 3: Save tokens to token store with the expiration date returned by the exchange
             self.token_store.save_persona_token("Aunt", long_lived_token, expires_at)  # 保存 Aunt 的令牌
             self.token_store.save_persona_token("Participant", long_lived_token, expires_at)  # 保存 Participant 的令牌
 
@@ -0,0 +1,132 @@
+"""
+Proactive Token Refresh Scheduler
+
+Keeps the business token and every persona token fresh from inside the running
+service, so no request ever waits on a token exchange. Each token gets its own
+timer that fires TOKEN_REFRESH_LEAD_SECONDS before it expires, minus a random
+jitter so tokens saved together are not all refreshed in the same instant.
+Refreshes go through TokenManager's single-flight guard, so a timer firing
+while another caller is already refreshing the same token shares that exchange.
+
+Usage:
+    scheduler = TokenRefreshScheduler(get_token_manager())
+    scheduler.start()      # inside a running event loop
+    ...
+    await scheduler.stop()
+"""
+
+import asyncio
+import math
+import random
+import time
+from config import (
+    TOKEN_REFRESH_LEAD_SECONDS,
+    TOKEN_REFRESH_JITTER_SECONDS,
+    TOKEN_REFRESH_RETRY_SECONDS,
+    TOKEN_REFRESH_RESCAN_SECONDS
+)
+from token_store import to_epoch
+
+BUSINESS_TOKEN = None  # key used for the business token; persona tokens use the persona name
+
+
+class TokenRefreshScheduler:
+    def __init__(self, token_manager, lead_seconds=TOKEN_REFRESH_LEAD_SECONDS,
+                 jitter_seconds=TOKEN_REFRESH_JITTER_SECONDS, retry_seconds=TOKEN_REFRESH_RETRY_SECONDS,
+                 rescan_seconds=TOKEN_REFRESH_RESCAN_SECONDS):
+        self.token_manager = token_manager
+        self.token_store = token_manager.token_store
+        self.lead_seconds = lead_seconds
+        self.jitter_seconds = jitter_seconds
+        self.retry_seconds = retry_seconds
+        self.rescan_seconds = rescan_seconds
+        self._timers = {}       # token key -> (due epoch, asyncio.Task)
+        self._rescan_task = None
+
+    def start(self):
+        """Arm a timer for every stored token and periodically pick up new or changed ones."""
+        if self._rescan_task is None:
+            self._rescan_task = asyncio.create_task(self._rescan_loop())
+        return self
+
+    async def stop(self):
+        tasks = [task for _, task in self._timers.values()]
+        if self._rescan_task is not None:
+            tasks.append(self._rescan_task)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._timers.clear()
+        self._rescan_task = None
+
+    def _expiries(self):
+        """Current expiry (epoch seconds or None if unknown) of every stored token."""
+        expiries = {}
+        if self.token_store.get_business_token():
+            expiries[BUSINESS_TOKEN] = self.token_store.get_business_token_expires_at()
+        for persona_name, persona_data in self.token_store.get_all_persona_tokens().items():
+            if persona_data.get("access_token"):
+                expiries[persona_name] = to_epoch(persona_data.get("expires_at"))
+        # Tokens that never expire need no timer
+        return {key: expires_at for key, expires_at in expiries.items() if expires_at != math.inf}
+
+    def _due_time(self, expires_at):
+        if expires_at is None:
+            return time.time()  # unknown expiry: look it up right away
+        return expires_at - self.lead_seconds - random.uniform(0, self.jitter_seconds)
+
+    def _arm(self, key, due):
+        previous = self._timers.get(key)
+        if previous is not None:
+            previous[1].cancel()
+        self._timers[key] = (due, asyncio.create_task(self._timer(key, due)))
+
+    async def _rescan_loop(self):
+        while True:
+            self._rescan()
+            await asyncio.sleep(self.rescan_seconds)
+
+    def _rescan(self):
+        """
+        Arm timers for tokens that have none, and re-arm tokens whose expiry moved
+        (e.g. refreshed by another process or re-authenticated by hand).
+        """
+        expiries = self._expiries()
+        for key in list(self._timers):
+            if key not in expiries:
+                self._timers.pop(key)[1].cancel()
+        for key, expires_at in expiries.items():
+            timer = self._timers.get(key)
+            if timer is None or timer[1].done():
+                self._arm(key, self._due_time(expires_at))
+            elif expires_at is not None and expires_at - self.lead_seconds > timer[0] + self.jitter_seconds:
+                self._arm(key, self._due_time(expires_at))
+
+    async def _timer(self, key, due):
+        await asyncio.sleep(max(0.0, due - time.time()))
+        label = "business token" if key is BUSINESS_TOKEN else f"token for {key}"
+        try:
+            await asyncio.to_thread(self._refresh, key)
+            print(f"Proactively refreshed {label}.")
+            expiries = self._expiries()
+            if key not in expiries:
+                # Removed, or now a non-expiring token: nothing left to schedule
+                self._timers.pop(key, None)
+                return
+            next_due = self._due_time(expiries[key])
+            if next_due <= time.time():
+                # No usable expiry came back; check again later rather than spinning
+                next_due = time.time() + self.rescan_seconds
+        except Exception as e:
+            print(f"Error refreshing {label}, retrying later: {e}")
+            next_due = time.time() + self.retry_seconds + random.uniform(0, self.retry_seconds)
+        self._timers[key] = (next_due, asyncio.create_task(self._timer(key, next_due)))
+
+    def _refresh(self, key):
+        expires_at = self._expiries().get(key)
+        if expires_at is None:
+            # Unknown expiry: inspect the token, which stores its expiry (and refreshes if needed)
+            return self.token_manager.verify_token(key)
+        if key is BUSINESS_TOKEN:
+            return self.token_manager.refresh_token()
+        return self.token_manager.refresh_persona_token(key)
@@ -3,131 +3,230 @@ Token Storage Management Module
 
 Handles the persistent storage and retrieval of various types of tokens
 (Instagram business tokens, persona tokens, etc.) in a JSON file.
+
+One TokenStore is shared by the whole process (see get_token_store). Reads are
+served from an in-memory copy of the file, which is only reloaded when the
+file's mtime changes (checked at most every TOKEN_FILE_CHECK_INTERVAL seconds).
+Writes are serialized with a lock and replace the file atomically.
+
+Token expiry (`expires_at`, epoch seconds, from the token exchange response) is
+stored alongside each token and checked locally, so lookups need no network call.
 """
 
+import copy
 import json
+import math
+import os
+import tempfile
+import threading
 import time
+from contextlib import contextmanager
 from pathlib import Path
 from typing import Optional, Dict, Any
-import requests
-from config import GRAPH_API_VERSION
+from datetime import datetime
+from config import TOKEN_FILE_CHECK_INTERVAL, TOKEN_REFRESH_MARGIN_SECONDS
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to the in-process lock only
+    fcntl = None
 
 TOKEN_FILE = Path("tokens.json")
 
+_shared_store = None
+_shared_store_lock = threading.Lock()
+
+
+def to_epoch(value) -> Optional[float]:
+    """
+    Normalize a stored expiry to epoch seconds, or None if unknown. Older entries
+    may hold ISO-8601 strings; 0 means the token never expires (as reported by
+    /debug_token).
+    """
+    if value is None or value == "":
+        return None
+    if value == 0:
+        return math.inf
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return datetime.fromisoformat(str(value).replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        return None
+
+
+def get_token_store() -> "TokenStore":
+    """Return the process-wide TokenStore, creating it on first use."""
+    global _shared_store
+    with _shared_store_lock:
+        if _shared_store is None:
+            _shared_store = TokenStore()
+        return _shared_store
+
+
 class TokenStore:
-    def __init__(self):
-        self.token_file = TOKEN_FILE
+    def __init__(self, token_file=TOKEN_FILE, check_interval=TOKEN_FILE_CHECK_INTERVAL):
+        self.token_file = Path(token_file)
+        self.check_interval = check_interval
+        self._lock = threading.RLock()
+        self._data = None
+        self._mtime = None
+        self._checked_at = 0.0
         self._ensure_token_file()
 
     def _ensure_token_file(self):
         """Ensure the token file exists with proper structure."""
         if not self.token_file.exists():
-            self.token_file.write_text(json.dumps({
+            self._write_file({
                 "business_token": None,
                 "persona_tokens": {},
                 "last_updated": None
-            }, indent=4))
+            })
 
-    def _load_tokens(self) -> Dict[str, Any]:
-        """Load all tokens from the file."""
+    @contextmanager
+    def _file_lock(self):
+        """Serialize writers in this process and, where supported, across processes."""
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            with open(f"{self.token_file}.lock", "w") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_file(self):
+        mtime = self.token_file.stat().st_mtime_ns
         with open(self.token_file) as f:
-            return json.load(f)
+            self._data = json.load(f)
+        self._mtime = mtime
+
+    def _write_file(self, data: Dict[str, Any]):
+        """Write to a temp file in the same directory, then atomically rename it over the token file."""
+        fd, tmp_path = tempfile.mkstemp(dir=self.token_file.parent or ".", prefix=".tokens.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(data, f, indent=4)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.token_file)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        self._data = data
+        self._mtime = self.token_file.stat().st_mtime_ns
+        self._checked_at = time.monotonic()
+
+    def _load_tokens(self) -> Dict[str, Any]:
+        """
+        Return the in-memory token data. The file is re-read only if its mtime has
+        changed since the last load, and the mtime is checked at most once per
+        check interval.
+        """
+        now = time.monotonic()
+        if self._data is not None and now - self._checked_at < self.check_interval:
+            return self._data
+        with self._lock:
+            self._checked_at = now
+            if self._data is None or self.token_file.stat().st_mtime_ns != self._mtime:
+                self._read_file()
+            return self._data
+
+    @contextmanager
+    def _update_tokens(self):
+        """
+        Read-modify-write the token data under the writer lock, starting from the
+        latest file contents, and persist it atomically on exit.
+        """
+        with self._file_lock():
+            self._read_file()
+            data = copy.deepcopy(self._data)
+            yield data
+            self._save_tokens(data)
 
     def _save_tokens(self, data: Dict[str, Any]):
         """Save tokens to the file."""
         # Time is formatted as "YYYY-MM-DD HH:MM:SS", e.g. "2024-03-08 14:30:25"
         data["last_updated"] = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
-        with open(self.token_file, "w") as f:
-            json.dump(data, f, indent=4)
+        self._write_file(data)
 
     def get_business_token(self) -> Optional[str]:
         """Get the Instagram business token."""
         data = self._load_tokens()
         return data.get("business_token")
 
-    def save_business_token(self, token: str):
-        """Save the Instagram business token."""
+    def get_business_token_expires_at(self) -> Optional[float]:
+        """Expiry of the business token (epoch seconds), or None if unknown."""
         data = self._load_tokens()
-        data["business_token"] = token
-        self._save_tokens(data)
+        return to_epoch(data.get("business_token_expires_at"))
+
+    def save_business_token(self, token: str, expires_at: Optional[float] = None):
+        """Save the Instagram business token and, if known, when it expires."""
+        with self._update_tokens() as data:
+            data["business_token"] = token
+            data["business_token_expires_at"] = expires_at
 
     def get_persona_token(self, persona_name: str) -> Optional[str]:
-        """Get a specific persona's token."""
+        """
+        Get a specific persona's token, or None if it is missing or expires within the
+        refresh margin. Expiry is checked locally against the stored `expires_at`.
+        """
         data = self._load_tokens()
         persona_data = data.get("persona_tokens", {}).get(persona_name)
-        
+
         if persona_data:
             access_token = persona_data.get("access_token")
-            if access_token and not self.is_token_expired(access_token):
+            if access_token and not self.is_token_expired(persona_data.get("expires_at")):
                 return access_token
-            
-            # 如果访问令牌不可用或已过期，尝试重新生成
-            if "auth_code" in persona_data:
-                print(f"Access token for {persona_name} is not available or expired. Attempting to regenerate.")
-                try:
-                    # 使用 fb_page_id 和 ig_user_id 生成新的访问令牌
-                    self.token_manager.generate_or_regenerate_access_tokens_for_users(persona_data["fb_page_id"], persona_data["ig_user_id"])
-                    
-                    # 重新加载令牌
-                    return self.get_persona_token(persona_name)
-                except Exception as e:
-                    print(f"Error regenerating token for {persona_name}: {e}")
-        
+
         return None
 
-    def save_persona_token(self, persona_name: str, access_token: str, expires_at: Optional[str] = None):
-        """Save a persona's token with optional expiration."""
-        data = self._load_tokens()
-        if "persona_tokens" not in data:
-            data["persona_tokens"] = {}
-        
-        data["persona_tokens"][persona_name] = {
-            "access_token": access_token,
-            "expires_at": expires_at,
-            "updated_at": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
-        }
-        self._save_tokens(data)
+    def get_persona_token_expires_at(self, persona_name: str) -> Optional[float]:
+        """Expiry of a persona's token (epoch seconds), or None if unknown."""
+        persona_data = self._load_tokens().get("persona_tokens", {}).get(persona_name) or {}
+        return to_epoch(persona_data.get("expires_at"))
+
+    def save_persona_token(self, persona_name: str, access_token: str, expires_at: Optional[float] = None):
+        """Save a persona's token with optional expiration (epoch seconds)."""
+        with self._update_tokens() as data:
+            if "persona_tokens" not in data:
+                data["persona_tokens"] = {}
+
+            data["persona_tokens"][persona_name] = {
+                "access_token": access_token,
+                "expires_at": expires_at,
+                "updated_at": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
+            }
 
     def get_all_persona_tokens(self) -> Dict[str, Dict[str, Any]]:
         """Get all persona tokens."""
         data = self._load_tokens()
-        return data.get("persona_tokens", {})
+        return copy.deepcopy(data.get("persona_tokens", {}))
 
     def delete_persona_token(self, persona_name: str):
         """Delete a specific persona's token."""
-        data = self._load_tokens()
-        if "persona_tokens" in data and persona_name in data["persona_tokens"]:
-            del data["persona_tokens"][persona_name]
-            self._save_tokens(data)
+        with self._update_tokens() as data:
+            if "persona_tokens" in data and persona_name in data["persona_tokens"]:
+                del data["persona_tokens"][persona_name]
 
     def clear_all_tokens(self):
         """Clear all stored tokens."""
-        self._save_tokens({
-            "business_token": None,
-            "persona_tokens": {},
-            "last_updated": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
-        })
+        with self._update_tokens() as data:
+            data.clear()
+            data.update({
+                "business_token": None,
+                "persona_tokens": {},
+            })
 
-    def is_token_expired(self, token):
+    def is_token_expired(self, expires_at, margin: float = TOKEN_REFRESH_MARGIN_SECONDS) -> bool:
         """
-        Check if a token is expired or about to expire (within 24 hours).
+        Check locally whether a token expiring at `expires_at` is expired or about to
+        expire (within `margin` seconds, 24 hours by default). A token with unknown
+        expiry is treated as valid; it is only checked remotely after an auth failure.
         """
-        try:
-            url = f"https://graph.facebook.com/{GRAPH_API_VERSION}/debug_token"
-            params = {
-                "input_token": token,
-                "access_token": f"{self.app_id}|{self.app_secret}"
-            }
-            response = requests.get(url, params=params)
-            
-            if response.status_code != 200:
-                return True
-            
-            data = response.json()
-            expires_at = data.get("data", {}).get("expires_at", 0)
-            
-            # Consider token expired if it has less than 24 hours left
-            return time.time() > (expires_at - 86400)
-            
-        except Exception:
-            return True
+        expires_at = to_epoch(expires_at)
+        if expires_at is None:
+            return False
+        return time.time() > expires_at - margin
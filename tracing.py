@@ -0,0 +1,282 @@
+"""
+Tracing Spans
+
+Lightweight spans around the hot path: every process_post stage, every Graph API
+and instagrapi call, every GCS upload and every LLM request. A span records its
+name, attributes, start/end time, error (if any) and its parent, found through a
+context variable, so spans nest across awaits, tasks and asyncio.to_thread.
+
+Finished spans are queued and exported in batches by a background thread, either
+as JSON lines (TRACE_EXPORTER=jsonl, written to TRACE_FILE) or as OTLP/HTTP JSON
+posted to an OpenTelemetry collector (TRACE_EXPORTER=otlp, TRACE_OTLP_ENDPOINT;
+benchmarks/stub_otlp_collector.py stands in for one locally).
+
+With TRACING_ENABLED unset, span() returns a shared no-op object and traced()
+functions call straight through, so instrumentation costs one flag check.
+
+Usage:
+    with span("graph.get_comments", post_id=post_id) as s:
+        ...
+        s.set(comments=len(comments))
+
+    @traced("gcs.upload_media_bytes")
+    def upload_media_bytes(...): ...
+"""
+
+import abc
+import asyncio
+import atexit
+import contextvars
+import functools
+import json
+import os
+import queue
+import threading
+import time
+
+from config import (
+    TRACING_ENABLED,
+    TRACE_EXPORTER,
+    TRACE_FILE,
+    TRACE_OTLP_ENDPOINT,
+    TRACE_SERVICE_NAME,
+    TRACE_BATCH_SIZE,
+    TRACE_FLUSH_INTERVAL
+)
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+_STOP = object()
+
+
+class Span:
+    __slots__ = ("name", "attributes", "trace_id", "span_id", "parent_id",
+                 "start_ns", "end_ns", "error", "_token")
+
+    def __init__(self, name, attributes):
+        parent = _current_span.get()
+        self.name = name
+        self.attributes = attributes
+        self.trace_id = parent.trace_id if parent is not None else os.urandom(16).hex()
+        self.parent_id = parent.span_id if parent is not None else None
+        self.span_id = os.urandom(8).hex()
+        self.start_ns = self.end_ns = 0
+        self.error = None
+
+    def set(self, **attributes):
+        """Add attributes known only once the work is under way (token counts, sizes)."""
+        self.attributes.update(attributes)
+
+    def __enter__(self):
+        self._token = _current_span.set(self)
+        self.start_ns = time.time_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end_ns = time.time_ns()
+        _current_span.reset(self._token)
+        if exc_type is not None:
+            self.error = f"{exc_type.__name__}: {exc}"
+        if _exporter is not None:
+            _exporter.export(self)
+        return False
+
+    def to_dict(self):
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_ns": self.start_ns,
+            "duration_ms": (self.end_ns - self.start_ns) / 1e6,
+            "attributes": self.attributes,
+            "error": self.error
+        }
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def set(self, **attributes):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class _BatchExporter(abc.ABC):
+    """Queues finished spans; a daemon thread hands them to _write() in batches."""
+    def __init__(self, batch_size=TRACE_BATCH_SIZE, flush_interval=TRACE_FLUSH_INTERVAL):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._export_loop, name="trace-exporter", daemon=True)
+        self._thread.start()
+
+    def export(self, span):
+        self._queue.put(span)
+
+    def _export_loop(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            batch, done = [], 1
+            if item is _STOP:
+                stopping = True
+            else:
+                batch.append(item)
+                while len(batch) < self.batch_size:
+                    try:
+                        item = self._queue.get(timeout=self.flush_interval)
+                    except queue.Empty:
+                        break
+                    done += 1
+                    if item is _STOP:
+                        stopping = True
+                        break
+                    batch.append(item)
+            try:
+                if batch:
+                    self._write(batch)
+            except Exception as e:
+                print(f"Error exporting {len(batch)} span(s): {e}")
+            finally:
+                for _ in range(done):
+                    self._queue.task_done()
+
+    @abc.abstractmethod
+    def _write(self, batch):
+        """Send one batch of finished spans. Runs on the exporter thread."""
+
+    def flush(self):
+        self._queue.join()
+
+    def shutdown(self):
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join()
+
+
+class JsonlExporter(_BatchExporter):
+    """One JSON object per span, appended to `path`."""
+    def __init__(self, path=TRACE_FILE, **kwargs):
+        self.path = path
+        super().__init__(**kwargs)
+
+    def _write(self, batch):
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.writelines(json.dumps(span.to_dict(), default=str) + "\n" for span in batch)
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_attributes(attributes):
+    return [{"key": key, "value": _otlp_value(value)} for key, value in attributes.items() if value is not None]
+
+
+def _otlp_span(span):
+    otlp = {
+        "traceId": span.trace_id,
+        "spanId": span.span_id,
+        "name": span.name,
+        "kind": 1,  # SPAN_KIND_INTERNAL
+        "startTimeUnixNano": str(span.start_ns),
+        "endTimeUnixNano": str(span.end_ns),
+        "attributes": _otlp_attributes(span.attributes),
+        "status": {"code": 2, "message": span.error} if span.error else {"code": 1}
+    }
+    if span.parent_id:
+        otlp["parentSpanId"] = span.parent_id
+    return otlp
+
+
+class OtlpHttpExporter(_BatchExporter):
+    """Posts batches as OTLP/HTTP JSON (the collector's /v1/traces endpoint)."""
+    def __init__(self, endpoint=TRACE_OTLP_ENDPOINT, service_name=TRACE_SERVICE_NAME, timeout=10, **kwargs):
+        self.endpoint = endpoint
+        self.service_name = service_name
+        self.timeout = timeout
+        super().__init__(**kwargs)
+
+    def _write(self, batch):
+        import urllib.request  # only this exporter needs it (http.client, ssl, email)
+        body = {"resourceSpans": [{
+            "resource": {"attributes": _otlp_attributes({"service.name": self.service_name})},
+            "scopeSpans": [{"scope": {"name": "tracing"}, "spans": [_otlp_span(span) for span in batch]}]
+        }]}
+        request = urllib.request.Request(
+            self.endpoint, data=json.dumps(body, default=str).encode(),
+            headers={"Content-Type": "application/json"}, method="POST"
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout):  # raises on non-2xx
+            pass
+
+
+EXPORTERS = {"jsonl": JsonlExporter, "otlp": OtlpHttpExporter}
+_exporter = None
+
+
+def configure(enabled=TRACING_ENABLED, exporter=TRACE_EXPORTER, **options):
+    """
+    (Re)configure tracing; `options` go to the exporter (e.g. path=, endpoint=).
+    Spans still queued for a previous exporter are exported first.
+    """
+    global _exporter
+    previous, _exporter = _exporter, None
+    if previous is not None:
+        previous.shutdown()
+    if enabled:
+        if exporter not in EXPORTERS:
+            raise ValueError(f"Unknown TRACE_EXPORTER {exporter!r}; expected one of {', '.join(EXPORTERS)}")
+        _exporter = EXPORTERS[exporter](**options)
+
+
+def flush():
+    """Block until every finished span has been exported."""
+    if _exporter is not None:
+        _exporter.flush()
+
+
+def span(name, **attributes):
+    """A span context manager, or the shared no-op one when tracing is off."""
+    if _exporter is None:
+        return _NOOP_SPAN
+    return Span(name, attributes)
+
+
+def traced(name):
+    """Decorator running each call of a function or coroutine function in a span named `name`."""
+    def decorate(func):
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                if _exporter is None:
+                    return await func(*args, **kwargs)
+                with Span(name, {}):
+                    return await func(*args, **kwargs)
+        else:
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if _exporter is None:
+                    return func(*args, **kwargs)
+                with Span(name, {}):
+                    return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+configure()
+atexit.register(lambda: configure(enabled=False))
@@ -0,0 +1,126 @@
+"""
+Video Keyframe Sampling
+
+Turns a video (a reel or a video carousel item) into a few still frames for the
+multimodal prompt. The video is decoded from the file it was downloaded to, so
+it is never held in memory as a whole.
+
+Sampling modes:
+- "scene": decode only the stream's keyframes (cheap, no inter-frame decoding)
+  and keep those that differ visibly from the last kept one, i.e. roughly one
+  frame per shot.
+- "uniform": seek to evenly spaced timestamps.
+
+Either way at most `max_frames` frames are returned, spread evenly over the video.
+
+PyAV is an optional dependency (`pip install av`). Without it, video media is
+left out of the prompt as before. It loads FFmpeg's libraries, so it is only
+imported when the first video is decoded.
+"""
+
+import importlib.util
+
+av = None  # PyAV, once _load_av() has imported it
+
+from config import VIDEO_MAX_FRAMES, VIDEO_SAMPLING, VIDEO_SCENE_THRESHOLD
+
+THUMB_SIZE = (16, 16)
+
+
+def available():
+    return av is not None or importlib.util.find_spec("av") is not None
+
+
+def _load_av():
+    global av
+    if av is None:
+        if not available():
+            raise Exception("PyAV is not installed; install `av` to include video frames in prompts")
+        import av
+    return av
+
+
+def _spread(items, count):
+    """`count` items evenly spaced across `items` (all of them if there are fewer)."""
+    if len(items) <= count:
+        return list(items)
+    if count == 1:
+        return [items[len(items) // 2]]
+    step = (len(items) - 1) / (count - 1)
+    return [items[round(i * step)] for i in range(count)]
+
+
+def _thumbnail(image):
+    return list(image.convert("L").resize(THUMB_SIZE).getdata())
+
+
+def _difference(a, b):
+    """Mean absolute difference of two grayscale thumbnails, from 0 to 1."""
+    return sum(abs(x - y) for x, y in zip(a, b)) / (len(a) * 255)
+
+
+def _to_image(frame, size_for):
+    image = frame.to_image()
+    if size_for is not None:
+        size = size_for(image.width, image.height)
+        if size != image.size:
+            image = image.resize(size)
+    return image
+
+
+def _scene_frames(container, stream, max_frames, threshold, size_for):
+    stream.codec_context.skip_frame = "NONKEY"
+    frames, last_thumb = [], None
+    for frame in container.decode(stream):
+        image = _to_image(frame, size_for)
+        thumb = _thumbnail(image)
+        if last_thumb is None or _difference(thumb, last_thumb) >= threshold:
+            frames.append(image)
+            last_thumb = thumb
+            if len(frames) >= 4 * max_frames:
+                # Long videos with many cuts: thin out as we go so memory stays bounded
+                frames = _spread(frames, 2 * max_frames)
+    return frames
+
+
+def _uniform_frames(container, stream, max_frames, size_for):
+    if stream.duration is not None:
+        duration = float(stream.duration * stream.time_base)
+    elif container.duration is not None:
+        duration = container.duration / av.time_base
+    else:
+        return None
+
+    frames = []
+    for i in range(max_frames):
+        target = duration * (i + 0.5) / max_frames
+        # Seeking lands on the keyframe before `target`; decode forward from there
+        container.seek(int(target / stream.time_base), stream=stream)
+        for frame in container.decode(stream):
+            if frame.time is not None and frame.time < target:
+                continue
+            frames.append(_to_image(frame, size_for))
+            break
+    return frames
+
+
+def extract_keyframes(video_file, max_frames=VIDEO_MAX_FRAMES, mode=VIDEO_SAMPLING,
+                      threshold=VIDEO_SCENE_THRESHOLD, size_for=None):
+    """
+    Sample up to `max_frames` PIL images from the video at `video_file` (a path or a
+    binary file object).
+
+    `size_for(width, height)`, if given, returns the size each frame is shrunk to as
+    soon as it is decoded.
+    """
+    with _load_av().open(video_file) as container:
+        if not container.streams.video:
+            return []
+        stream = container.streams.video[0]
+        stream.thread_type = "AUTO"
+        frames = None
+        if mode == "uniform":
+            frames = _uniform_frames(container, stream, max_frames, size_for)
+        if frames is None:  # scene mode, or a stream without a known duration
+            frames = _scene_frames(container, stream, max_frames, threshold, size_for)
+    return _spread(frames, max_frames)